@@ -1,9 +1,113 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 from api import models
 
 
+def estimated_count(model):
+    # Row estimate kept by PostgreSQL's statistics, None elsewhere or when
+    # the table was never analyzed
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                       [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    # Skip the COUNT(*) of unfiltered changelists of large tables, the
+    # page count is approximate there
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list.model)
+            threshold = getattr(settings, 'ADMIN_ESTIMATED_COUNT_MIN', 10000)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Changelist settings for tables that grow with every user
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ['id', 'date', 'user', 'wallet', 'category', 'flow',
+                    'ammount']
+    list_select_related = ['user', 'wallet', 'category']
+    list_filter = ['flow']
+    date_hierarchy = 'date'
+    search_fields = ['=user__email']
+    raw_id_fields = ['user', 'wallet', 'category', 'recurring', 'tags']
+
+
+class WalletAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'user', 'currency', 'balance']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user']
+
+
+class TagAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'user', 'usage_count']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user']
+
+
+class CategoryAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'user']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user']
+
+
+class RecurringTransactionAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'category', 'flow', 'ammount',
+                    'frequency', 'next_run', 'is_active']
+    list_select_related = ['user', 'category']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user', 'wallet', 'category', 'tags']
+
+
+class BudgetAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'category', 'tag', 'period', 'limit',
+                    'spent', 'period_start']
+    list_select_related = ['user', 'category', 'tag']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user', 'category', 'tag']
+
+
+class ExchangeRateAdmin(LargeTableAdmin):
+    list_display = ['date', 'base', 'quote', 'rate']
+    date_hierarchy = 'date'
+
+
+class IdempotencyKeyAdmin(LargeTableAdmin):
+    list_display = ['created', 'user', 'method', 'path', 'status_code']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    raw_id_fields = ['user']
+
+
+class TaskAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at',
+                    'finished']
+
+
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
@@ -25,7 +129,48 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class AuditLogAdmin(LargeTableAdmin):
+    # Entries are append-only, the admin can only browse them
+    list_display = ['created', 'user_id', 'action', 'model', 'object_id']
+    list_filter = ['model', 'action']
+    date_hierarchy = 'created'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    # Worst offenders by total time spent first
+    list_display = ['origin', 'calls', 'total_time', 'average_time',
+                    'max_time', 'last_seen']
+    ordering = ['-total_time']
+    search_fields = ['sql', 'origin']
+    readonly_fields = ['fingerprint', 'sql', 'origin', 'stack', 'calls',
+                       'total_time', 'max_time', 'explain', 'first_seen',
+                       'last_seen']
+
+    def average_time(self, obj):
+        return round(obj.total_time / obj.calls, 2) if obj.calls else 0
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Transaction)
-admin.site.register(models.Wallet)
-admin.site.register(models.Tag)
+admin.site.register(models.Transaction, TransactionAdmin)
+admin.site.register(models.Wallet, WalletAdmin)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Category, CategoryAdmin)
+admin.site.register(models.RecurringTransaction, RecurringTransactionAdmin)
+admin.site.register(models.Budget, BudgetAdmin)
+admin.site.register(models.ExchangeRate, ExchangeRateAdmin)
+admin.site.register(models.IdempotencyKey, IdempotencyKeyAdmin)
+admin.site.register(models.Task, TaskAdmin)
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
+admin.site.register(models.AuditLog, AuditLogAdmin)
@@ -0,0 +1,55 @@
+import threading
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import metrics
+
+_lock = threading.Lock()
+_semaphores = {}
+
+
+class ServiceBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many expensive requests, try again shortly.'
+    default_code = 'service_busy'
+    # Picked up by the exception handler as the Retry-After header
+    wait = 1
+
+
+class Slot:
+    # A held place in a concurrency limited scope
+
+    def __init__(self, scope, semaphore):
+        self.scope = scope
+        self.semaphore = semaphore
+
+    def release(self):
+        self.semaphore.release()
+        metrics.incr(f'admission.active.{self.scope}', -1)
+
+
+def get_semaphore(scope):
+    limit = getattr(settings, 'CONCURRENCY_LIMITS', {}).get(scope)
+    if limit is None:
+        return None
+    with _lock:
+        if scope not in _semaphores:
+            _semaphores[scope] = threading.BoundedSemaphore(limit)
+        return _semaphores[scope]
+
+
+def acquire(scope):
+    # Wait up to CONCURRENCY_QUEUE_TIMEOUT seconds for a slot in scope,
+    # raise ServiceBusy when none frees up
+    semaphore = get_semaphore(scope)
+    if semaphore is None:
+        return None
+    timeout = getattr(settings, 'CONCURRENCY_QUEUE_TIMEOUT', 0)
+    if not semaphore.acquire(timeout=timeout):
+        metrics.incr(f'admission.rejected.{scope}')
+        raise ServiceBusy()
+    metrics.incr(f'admission.admitted.{scope}')
+    metrics.incr(f'admission.active.{scope}')
+    return Slot(scope, semaphore)
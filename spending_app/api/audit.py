@@ -0,0 +1,166 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Model
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from . import metrics
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_changes(data):
+    # Validated serializer data with related objects reduced to their ids
+    changes = {}
+    for name, value in data.items():
+        if isinstance(value, Model):
+            value = value.pk
+        elif isinstance(value, (list, tuple)):
+            value = [v.pk if isinstance(v, Model) else v for v in value]
+        elif isinstance(value, FieldFile) or hasattr(value, 'read'):
+            value = getattr(value, 'name', None)
+        changes[name] = value
+    return changes
+
+
+class AuditBuffer:
+    # Bounded in-memory queue of audit entries, written to AuditLog in
+    # batches by a background thread so requests never wait on it. When
+    # the buffer is full a request waits up to AUDIT_BACKPRESSURE_TIMEOUT
+    # for the flusher, then the entry is dropped and counted. The thread
+    # is started by the processes serving requests, see start().
+
+    def __init__(self):
+        self.started = False
+        self.reset()
+
+    def reset(self):
+        self.entries = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.thread = None
+        # Serializes writers, so an exit flush waits for the thread's batch
+        self.flushing = threading.Lock()
+
+    def put(self, entry):
+        capacity = getattr(settings, 'AUDIT_BUFFER_SIZE', 10000)
+        timeout = getattr(settings, 'AUDIT_BACKPRESSURE_TIMEOUT', 0.05)
+        with self.lock:
+            if len(self.entries) >= capacity:
+                metrics.incr('audit.backpressure')
+                self.not_empty.notify()
+                self.not_full.wait_for(
+                    lambda: len(self.entries) < capacity, timeout)
+            if len(self.entries) >= capacity:
+                metrics.incr('audit.dropped')
+                return False
+            self.entries.append(entry)
+            metrics.incr('audit.recorded')
+            metrics.set_gauge('audit.buffered', len(self.entries))
+            if len(self.entries) >= getattr(
+                    settings, 'AUDIT_BATCH_SIZE', 500):
+                self.not_empty.notify()
+        return True
+
+    def take(self, limit):
+        with self.lock:
+            batch = [self.entries.popleft()
+                     for _ in range(min(limit, len(self.entries)))]
+            metrics.set_gauge('audit.buffered', len(self.entries))
+            self.not_full.notify_all()
+        return batch
+
+    def write(self, batch):
+        AuditLog.objects.bulk_create(
+            [AuditLog(**entry) for entry in batch])
+
+    def flush(self):
+        # Write everything buffered so far, returns the number of entries
+        batch_size = getattr(settings, 'AUDIT_BATCH_SIZE', 500)
+        written = 0
+        with self.flushing:
+            while True:
+                batch = self.take(batch_size)
+                if not batch:
+                    return written
+                start = time.perf_counter()
+                try:
+                    self.write(batch)
+                except Exception:
+                    logger.exception('Could not write %d audit entries',
+                                     len(batch))
+                    metrics.incr('audit.dropped', len(batch))
+                    metrics.incr('audit.flush_errors')
+                else:
+                    written += len(batch)
+                    metrics.incr('audit.written', len(batch))
+                metrics.observe('audit.flush', time.perf_counter() - start)
+
+    def run(self):
+        interval = getattr(settings, 'AUDIT_FLUSH_INTERVAL', 1.0)
+        while True:
+            with self.lock:
+                self.not_empty.wait_for(lambda: self.entries, interval)
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                # The thread sleeps most of the time, so it must not hold
+                # a database connection in between
+                connections.close_all()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='audit-flusher', daemon=True)
+                self.thread.start()
+                if not self.started:
+                    atexit.register(self.flush)
+                    self.started = True
+
+    def after_fork(self):
+        # A forked child, like a gunicorn worker of a preloaded app, copies
+        # the buffer but not the flusher thread. The parent writes the
+        # entries it buffered, the child starts over with a thread of its
+        # own when the parent had one.
+        self.reset()
+        if self.started:
+            self.start()
+
+
+buffer = AuditBuffer()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=buffer.after_fork)
+
+
+def record(action, model, object_id, user=None, changes=None):
+    # Queue an audit entry, never blocking the caller for long
+    return buffer.put({
+        'user_id': getattr(user, 'pk', None),
+        'action': action,
+        'model': model._meta.label,
+        'object_id': object_id,
+        'changes': serialize_changes(changes or {}),
+        'created': timezone.now(),
+    })
+
+
+def flush():
+    return buffer.flush()
+
+
+def start():
+    # Run the flusher thread in this process and flush what is left at exit
+    buffer.start()
@@ -0,0 +1,35 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def init_process():
+    # Workers are spawned rather than forked, so they never share the
+    # parent's database connections, and set Django up themselves
+    django.setup()
+
+
+def process_pool(workers):
+    return ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_process)
+
+
+def run_chunks(func, chunks, workers, *args):
+    # Yield func(chunk, *args) for every chunk as results come in, from a
+    # process pool when there is more than one worker. func must be a
+    # module level function so it can be sent to the workers.
+    if workers <= 1:
+        for chunk in chunks:
+            yield func(chunk, *args)
+        return
+    with process_pool(workers) as pool:
+        futures = [pool.submit(func, chunk, *args) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
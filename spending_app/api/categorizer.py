@@ -0,0 +1,166 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+
+from .models import Tag, Transaction
+
+re_token = re.compile(r'\w{2,}')
+
+
+def tokenize(note):
+    return set(re_token.findall((note or '').lower()))
+
+
+class UserModel:
+    # Multinomial naive Bayes over note tokens for the category, and
+    # P(tag | token) for tags, learned from one user's transactions
+
+    def __init__(self):
+        self.category_docs = Counter()
+        self.category_tokens = defaultdict(Counter)
+        self.category_totals = Counter()
+        self.token_docs = Counter()
+        self.tag_tokens = defaultdict(Counter)
+        self.vocabulary = set()
+        self.built = time.monotonic()
+        self.lock = threading.Lock()
+
+    def learn(self, note, category=None, tag_ids=()):
+        tokens = tokenize(note)
+        with self.lock:
+            self.learn_category(tokens, category)
+            self.learn_tags(tokens, tag_ids)
+
+    def learn_category(self, tokens, category):
+        if category is not None:
+            self.category_docs[category] += 1
+            self.category_tokens[category].update(tokens)
+            self.category_totals[category] += len(tokens)
+            self.token_docs.update(tokens)
+            self.vocabulary.update(tokens)
+
+    def learn_tags(self, tokens, tag_ids):
+        for token in tokens:
+            self.tag_tokens[token].update(tag_ids)
+
+    def predict_category(self, tokens):
+        # None unless the note has a token seen before, the prior alone
+        # is not worth a guess
+        known = tokens & self.vocabulary
+        if not known:
+            return None
+        documents = sum(self.category_docs.values())
+        size = len(self.vocabulary)
+        best, best_score = None, -math.inf
+        for category, docs in self.category_docs.items():
+            counts = self.category_tokens[category]
+            denominator = math.log(self.category_totals[category] + size)
+            score = math.log(docs / documents) + sum(
+                math.log(counts[token] + 1) - denominator
+                for token in known)
+            if score > best_score:
+                best, best_score = category, score
+        return best
+
+    def predict_tags(self, tokens, min_support=2, min_share=0.5):
+        # Tags used on at least min_share of the transactions containing
+        # one of the note's tokens
+        tags = set()
+        for token in tokens:
+            seen = self.token_docs[token]
+            if seen < min_support:
+                continue
+            for tag_id, count in self.tag_tokens[token].items():
+                if count / seen >= min_share:
+                    tags.add(tag_id)
+        return sorted(tags)
+
+    def predict(self, note):
+        tokens = tokenize(note)
+        with self.lock:
+            return self.predict_category(tokens), self.predict_tags(tokens)
+
+
+def build(user_id):
+    # Train on the user's latest CATEGORIZER_TRAINING_SIZE transactions
+    limit = getattr(settings, 'CATEGORIZER_TRAINING_SIZE', 5000)
+    rows = list(Transaction.objects.filter(user_id=user_id)
+                .exclude(note__isnull=True).exclude(note='')
+                .order_by('-pk')
+                .values_list('note', 'category__name', 'tag_ids')[:limit])
+    model = UserModel()
+    for note, category, tag_ids in rows:
+        model.learn(note, category, tag_ids)
+    return model
+
+
+class ModelCache:
+    # Thread safe LRU cache of per-user models, rebuilt once older than
+    # CATEGORIZER_MODEL_MAX_AGE so other processes' writes are picked up
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        max_age = getattr(settings, 'CATEGORIZER_MODEL_MAX_AGE', 3600)
+        with self.lock:
+            model = self.entries.get(user_id)
+            if model is not None and \
+                    time.monotonic() - model.built < max_age:
+                self.entries.move_to_end(user_id)
+                return model
+        model = build(user_id)
+        with self.lock:
+            self.entries[user_id] = model
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return model
+
+    def peek(self, user_id):
+        # The cached model without building one
+        with self.lock:
+            return self.entries.get(user_id)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+model_cache = ModelCache(getattr(settings, 'CATEGORIZER_CACHE_SIZE', 1000))
+
+
+def suggest(user_id, notes):
+    # Return (category name, tag ids) for each note. Tags deleted since the
+    # model was built are left out.
+    model = model_cache.get(user_id)
+    predictions = [model.predict(note) for note in notes]
+    tag_ids = {tag_id for _, tags in predictions for tag_id in tags}
+    if tag_ids:
+        tag_ids = set(Tag.objects.filter(pk__in=tag_ids, user_id=user_id)
+                      .values_list('pk', flat=True))
+    return [(category, [tag_id for tag_id in tags if tag_id in tag_ids])
+            for category, tags in predictions]
+
+
+def learn(transaction):
+    # Add a new transaction to its user's cached model, if there is one
+    model = model_cache.peek(transaction.user_id)
+    if model is not None and transaction.note:
+        model.learn(transaction.note, transaction.category.name)
+
+
+def learn_tags(transaction, tag_ids):
+    model = model_cache.peek(transaction.user_id)
+    if model is not None and transaction.note:
+        model.learn(transaction.note, tag_ids=tag_ids)
@@ -0,0 +1,107 @@
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import ExchangeRate
+
+CENT = Decimal('0.01')
+
+
+class ExchangeRateMissing(ValueError):
+    pass
+
+
+class RateCache:
+    # Thread safe LRU cache of rates keyed by (base, quote, date). Entries
+    # expire after ttl seconds, so rates loaded by another process replace
+    # the earlier fallback to a previous day's rate.
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            rate, expires = entry
+            if expires is not None and time.monotonic() >= expires:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return rate
+
+    def put(self, key, rate):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.entries[key] = (rate, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+rate_cache = RateCache(getattr(settings, 'EXCHANGE_RATE_CACHE_SIZE', 10000),
+                       getattr(settings, 'EXCHANGE_RATE_CACHE_TTL', 600))
+
+
+def load_rates(base, quote, days):
+    # Resolve the rate in effect on each day with at most three queries:
+    # the direct pair, falling back to the inverse of the opposite pair
+    for pair_base, pair_quote, inverse in ((base, quote, False),
+                                           (quote, base, True)):
+        rates = ExchangeRate.objects.filter(base=pair_base, quote=pair_quote)
+        first = rates.filter(date__lte=min(days)).order_by('-date')\
+            .values_list('date', flat=True).first()
+        if first is None:
+            continue
+        table = list(rates.filter(date__gte=first, date__lte=max(days))
+                     .order_by('date').values_list('date', 'rate'))
+        dates = [date for date, _ in table]
+        resolved = {}
+        for day in days:
+            rate = table[bisect_right(dates, day) - 1][1]
+            resolved[day] = 1 / rate if inverse else rate
+        return resolved
+    raise ExchangeRateMissing(
+        f'No exchange rate from {base} to {quote} on {min(days)}')
+
+
+def get_rates(pairs, target):
+    # Return {(currency, day): rate to target} for every requested pair
+    rates, missing = {}, {}
+    for currency, day in set(pairs):
+        if currency == target:
+            rates[(currency, day)] = Decimal(1)
+            continue
+        rate = rate_cache.get((currency, target, day))
+        if rate is None:
+            missing.setdefault(currency, set()).add(day)
+        else:
+            rates[(currency, day)] = rate
+    for currency, days in missing.items():
+        for day, rate in load_rates(currency, target, days).items():
+            rate_cache.put((currency, target, day), rate)
+            rates[(currency, day)] = rate
+    return rates
+
+
+def convert_amounts(amounts, currencies, days, target):
+    # Convert parallel lists of amounts, each distinct rate looked up once
+    currencies = [currency.upper() for currency in currencies]
+    target = target.upper()
+    rates = get_rates(zip(currencies, days), target)
+    return [
+        (Decimal(amount) * rates[(currency, day)]).quantize(CENT)
+        for amount, currency, day in zip(amounts, currencies, days)
+    ]
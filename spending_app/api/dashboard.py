@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import records, tasks
+from .db_router import shared_cache
+from .models import Flow, Transaction, Wallet
+from .serializers import TransactionSerializer, WalletSerializer
+
+
+def month_start(now):
+    return now.date().replace(day=1)
+
+
+def cache_key(user_id, month):
+    # The month is part of the key, so a new month starts with a new payload
+    return f'dashboard:{user_id}:{month:%Y-%m}'
+
+
+def pending_key(user_id):
+    return f'dashboard:pending:{user_id}'
+
+
+def compute(user_id, now=None):
+    # Build the home screen payload of a user from the database
+    now = now or timezone.now()
+    month = month_start(now)
+    wallets = Wallet.objects.filter(user_id=user_id).order_by('-balance')
+    user_records = records.get(user_id)
+    if user_records is not None:
+        spend = user_records.month_spend(month)
+    else:
+        spend = Transaction.objects.filter(
+            user_id=user_id, flow=Flow.EXPENSES, date__date__gte=month
+        ).values_list('category__name').annotate(
+            total=Sum('ammount')).order_by('-total')
+    recent = Transaction.objects.filter(user_id=user_id)\
+        .select_related('category')\
+        .order_by('-date', '-id')[:settings.DASHBOARD_RECENT_TRANSACTIONS]
+    return {
+        'month': month,
+        'wallets': WalletSerializer(wallets, many=True).data,
+        'month_spend': [
+            {'category': category, 'total': total}
+            for category, total in spend],
+        'recent_transactions': TransactionSerializer(recent, many=True).data,
+        'computed_at': now,
+    }
+
+
+def refresh(user_id, now=None):
+    now = now or timezone.now()
+    payload = compute(user_id, now)
+    shared_cache().set(cache_key(user_id, month_start(now)), payload,
+                       settings.DASHBOARD_CACHE_TTL)
+    return payload
+
+
+def get(user_id):
+    # A single cache read, computed inline only when nothing is cached yet
+    now = timezone.now()
+    payload = shared_cache().get(cache_key(user_id, month_start(now)))
+    if payload is None:
+        payload = refresh(user_id, now)
+    return payload
+
+
+@tasks.task
+def refresh_task(user_id):
+    shared_cache().delete(pending_key(user_id))
+    refresh(user_id)
+
+
+def schedule(user_id):
+    # Queue one recompute per user after the current transaction commits,
+    # writes made while one is already queued share it
+    if user_id is None:
+        return
+
+    def enqueue():
+        if shared_cache().add(pending_key(user_id), True,
+                              settings.DASHBOARD_PENDING_TTL):
+            refresh_task.delay(user_id)
+
+    transaction.on_commit(enqueue)
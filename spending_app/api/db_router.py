@@ -0,0 +1,65 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+_state = threading.local()
+
+
+def primary_pin_key(user_id):
+    return f'db-primary-pin:{user_id}'
+
+
+def shared_cache():
+    # Values every process must see, not only the one that wrote them
+    return caches[getattr(settings, 'SHARED_CACHE', 'default')]
+
+
+def pin_to_primary(user):
+    # Keep a user's reads on the primary while replicas catch up
+    window = getattr(settings, 'READ_YOUR_WRITES_WINDOW', 0)
+    if window and user.is_authenticated and \
+            getattr(settings, 'DATABASE_REPLICAS', []):
+        shared_cache().set(primary_pin_key(user.pk), True, window)
+
+
+def is_pinned_to_primary(user):
+    # Check if the user wrote recently and must read from the primary
+    if not user.is_authenticated or \
+            not getattr(settings, 'DATABASE_REPLICAS', []):
+        return False
+    return bool(shared_cache().get(primary_pin_key(user.pk)))
+
+
+def set_replica_reads(enabled):
+    # Enable or disable replica reads for the current thread
+    _state.replica_reads = enabled
+
+
+def replica_reads_enabled():
+    return getattr(_state, 'replica_reads', False)
+
+
+class PrimaryReplicaRouter:
+    # Send writes to the primary and allowed reads to a read replica
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        # The database cache must not lag behind its writes
+        if model._meta.app_label == 'django_cache':
+            return 'default'
+        if replicas and replica_reads_enabled():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # All databases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db == 'default'
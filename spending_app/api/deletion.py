@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import Q
+
+from . import records, tasks
+from .models import Budget, RecurringTransaction, Tag, Transaction, Wallet
+
+# Image files deleted per queued cleanup task
+FILES_PER_TASK = 100
+
+
+def batch_size():
+    return getattr(settings, 'DELETION_BATCH_SIZE', 1000)
+
+
+def is_large(transactions):
+    # Check if deleting these transactions should run in the background
+    threshold = getattr(settings, 'BACKGROUND_DELETION_THRESHOLD', 5000)
+    return transactions[threshold:threshold + 1].exists()
+
+
+def delete_transactions(transactions):
+    # Delete transactions in batches with plain DELETE statements instead
+    # of the ORM collector, which loads every row and tag link in memory.
+    # Returns how many were deleted and the names of their image files.
+    through = Transaction.tags.through
+    using = router.db_for_write(Transaction)
+    deleted, images = 0, []
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(transactions.order_by().values_list('pk', 'image')
+                         [:batch_size()])
+            if not batch:
+                break
+            ids = [pk for pk, _ in batch]
+            images.extend(image for _, image in batch if image)
+            links = through.objects.filter(transaction_id__in=ids)
+            tag_ids = set(links.values_list('tag_id', flat=True))
+            links._raw_delete(using)
+            deleted += Transaction.objects.filter(pk__in=ids)\
+                ._raw_delete(using)
+            Tag.objects.refresh_usage(tag_ids)
+    return deleted, images
+
+
+def delete_files(names, defer=True):
+    # Remove image files, through the task queue unless already in a task
+    for start in range(0, len(names), FILES_PER_TASK):
+        chunk = names[start:start + FILES_PER_TASK]
+        if defer:
+            tasks.delete_media_files.delay(chunk)
+        else:
+            tasks.delete_media_files(chunk)
+
+
+def delete_wallet(wallet_id, defer_files=True):
+    # Delete a wallet, its transactions and their receipt images
+    wallet = Wallet.objects.filter(pk=wallet_id).first()
+    if wallet is None:
+        return 0
+    deleted, images = delete_transactions(
+        Transaction.objects.filter(wallet_id=wallet_id))
+    wallet.delete()
+    Budget.objects.recount(wallet.user_id)
+    records.invalidate(wallet.user_id)
+    delete_files(images, defer_files)
+    return deleted
+
+
+def delete_user(user_id, defer_files=True):
+    # Delete a user with everything they own and their receipt images
+    deleted, images = delete_transactions(Transaction.objects.filter(
+        Q(user_id=user_id) | Q(wallet__user_id=user_id)))
+    # Categories are protected by the recurring schedules pointing at them
+    RecurringTransaction.objects.filter(user_id=user_id).delete()
+    get_user_model().objects.filter(pk=user_id).delete()
+    records.invalidate(user_id)
+    delete_files(images, defer_files)
+    return deleted
+
+
+@tasks.task
+def delete_wallet_task(wallet_id):
+    delete_wallet(wallet_id, defer_files=False)
+
+
+@tasks.task
+def delete_user_task(user_id):
+    delete_user(user_id, defer_files=False)
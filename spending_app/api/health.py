@@ -0,0 +1,77 @@
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+_lock = threading.Lock()
+_cached = {'expires': 0, 'result': None}
+
+
+def pending_migrations(database='default'):
+    # Compare the applied migrations with the leaf nodes on disk, without
+    # running the full migrate command and its checks
+    executor = MigrationExecutor(connections[database])
+    targets = executor.loader.graph.leaf_nodes()
+    return executor.migration_plan(targets)
+
+
+def check_database(database='default'):
+    # Run a trivial query on the persistent connection of this thread,
+    # bounded by a statement timeout on PostgreSQL
+    connection = connections[database]
+    timeout = getattr(settings, 'READINESS_DB_TIMEOUT', 2)
+    with transaction.atomic(using=database), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL statement_timeout = %s',
+                           [int(timeout * 1000)])
+        cursor.execute('SELECT 1')
+
+
+def check_media():
+    # Create and remove a file to be sure uploads can be stored
+    with tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT):
+        pass
+
+
+def check_migrations():
+    plan = pending_migrations()
+    if plan:
+        raise RuntimeError(f'{len(plan)} unapplied migrations')
+
+
+CHECKS = {
+    'database': check_database,
+    'media': check_media,
+    'migrations': check_migrations,
+}
+
+
+def run_checks():
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            check()
+        except Exception as e:
+            results[name] = str(e) or e.__class__.__name__
+        else:
+            results[name] = 'ok'
+    return all(r == 'ok' for r in results.values()), results
+
+
+def readiness():
+    # Return (ready, results), reusing the last results for a few seconds
+    # so frequent probes from several load balancers stay cheap
+    ttl = getattr(settings, 'READINESS_CACHE_SECONDS', 5)
+    with _lock:
+        if _cached['result'] is None or time.monotonic() >= _cached['expires']:
+            _cached['result'] = run_checks()
+            _cached['expires'] = time.monotonic() + ttl
+        return _cached['result']
+
+
+def reset():
+    with _lock:
+        _cached['result'] = None
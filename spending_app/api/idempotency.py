@@ -0,0 +1,99 @@
+import functools
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def idempotent(view_method):
+    # Replay the stored response when a client retries a write with the
+    # same Idempotency-Key header, without running the view again
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {'detail': f'{HEADER} must be at most 255 characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        record, existing = claim(request, key)
+        if record is None:
+            return replay(request, existing)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            # A record left behind by a dead process expires on its own
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        if status.is_success(response.status_code):
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=['status_code', 'response'])
+        else:
+            # Let the client retry a failed request with the same key
+            record.delete()
+        return response
+    return wrapper
+
+
+def is_expired(record):
+    # Keys past their TTL are treated as absent, as are requests that never
+    # finished, e.g. because their process died
+    age = timezone.now() - record.created
+    if age > timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL):
+        return True
+    return record.status_code is None and age > timedelta(
+        seconds=settings.IDEMPOTENCY_IN_PROGRESS_TIMEOUT)
+
+
+def claim(request, key, attempts=3):
+    # Store a new in-progress record for the key and return (record, None),
+    # or (None, the live record already stored for it)
+    existing = None
+    for _ in range(attempts):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=request.user, key=key, method=request.method,
+                    path=request.path), None
+        except IntegrityError:
+            pass
+        # The record may have been purged or expired since the insert
+        existing = IdempotencyKey.objects.filter(
+            user=request.user, key=key).first()
+        if existing is not None and not is_expired(existing):
+            return None, existing
+        if existing is not None:
+            IdempotencyKey.objects.filter(
+                pk=existing.pk, created=existing.created).delete()
+    return None, None
+
+
+def replay(request, record):
+    if record is not None and \
+            (record.method, record.path) != (request.method, request.path):
+        return Response(
+            {'detail': f'{HEADER} was already used for another request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record is None or record.status_code is None:
+        return Response(
+            {'detail': 'A request with this key is still in progress.'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(
+        record.response,
+        status=record.status_code,
+        headers={'Idempotent-Replayed': 'true'}
+    )
@@ -0,0 +1,19 @@
+import json
+import logging
+
+
+class JSONFormatter(logging.Formatter):
+    # One JSON object per line, with the dict passed as extra={'data': ...}
+    # merged into the standard fields
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'data', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,63 @@
+import gc
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from api import records
+from api.models import Transaction
+
+
+def retained(load):
+    # Bytes still allocated by load's result once it returns
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = load()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    # Django command comparing the memory of a user's transactions held as
+    # model instances and as compact records
+    help = ('Measure the memory of a user\'s transactions as model '
+            'instances and as cached records')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='Defaults to the user with most transactions')
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+        if user_id is None:
+            user_id = Transaction.objects.values('user_id')\
+                .annotate(count=Count('pk')).order_by('-count')\
+                .values_list('user_id', flat=True).first()
+        if user_id is None:
+            raise CommandError('There are no transactions')
+
+        instances, instance_bytes = retained(lambda: list(
+            Transaction.objects.filter(user_id=user_id)
+            .select_related('category')))
+        user_records, record_bytes = retained(
+            lambda: records.build(user_id, None))
+        if user_records is None:
+            raise CommandError(
+                'The user has more transactions than RECORD_CACHE_MAX_ROWS')
+
+        count = max(len(instances), 1)
+        self.stdout.write(
+            f'User {user_id}, {len(instances)} transactions\n'
+            f'model instances: {instance_bytes} bytes '
+            f'({instance_bytes / count:.0f} per transaction)\n'
+            f'records: {record_bytes} bytes '
+            f'({record_bytes / count:.0f} per transaction, '
+            f'{user_records.size} counted by the cache)')
+        if record_bytes:
+            self.stdout.write(self.style.SUCCESS(
+                f'Records take {instance_bytes / record_bytes:.1f}x less '
+                f'memory'))
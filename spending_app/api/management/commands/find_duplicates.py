@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from api import dashboard, deletion, records
+from api.models import Budget, Transaction
+
+
+def fingerprint_ranges(prefix_length):
+    # Split the fingerprint space by hex prefix. Fingerprints are uniform
+    # hashes, so each range holds about the same share of the index.
+    prefixes = [f'{i:0{prefix_length}x}' for i in range(16 ** prefix_length)]
+    return zip(prefixes, prefixes[1:] + [None])
+
+
+def duplicate_groups(queryset, start, end):
+    # Return {fingerprint: [ids]} for fingerprints in [start, end) that are
+    # shared by several transactions, oldest transaction first
+    rows = queryset.filter(fingerprint__gte=start)
+    if end is not None:
+        rows = rows.filter(fingerprint__lt=end)
+    shared = rows.values('fingerprint').annotate(count=Count('pk'))\
+        .filter(count__gt=1).values_list('fingerprint', flat=True)
+    groups = defaultdict(list)
+    for fingerprint, pk in queryset.filter(fingerprint__in=list(shared))\
+            .order_by('fingerprint', 'pk').values_list('fingerprint', 'pk'):
+        groups[fingerprint].append(pk)
+    return groups
+
+
+def merge(groups):
+    # Keep the oldest transaction of each group, move the tags of the
+    # others onto it and delete them in bulk
+    through = Transaction.tags.through
+    keepers = {ids[0]: ids[1:] for ids in groups.values()}
+    duplicate_ids = [pk for ids in keepers.values() for pk in ids]
+    keeper_of = {pk: keeper for keeper, ids in keepers.items()
+                 for pk in ids}
+    with transaction.atomic():
+        links = through.objects.filter(transaction_id__in=duplicate_ids)\
+            .values_list('transaction_id', 'tag_id')
+        through.objects.bulk_create([
+            through(transaction_id=keeper_of[pk], tag_id=tag_id)
+            for pk, tag_id in links
+        ], ignore_conflicts=True)
+        Transaction.objects.refresh_tag_ids(keepers)
+        Transaction.objects.filter(pk__in=keepers)\
+            .update(is_duplicate=False)
+        user_ids = set(Transaction.objects.filter(pk__in=keepers)
+                       .values_list('user_id', flat=True))
+        deleted, images = deletion.delete_transactions(
+            Transaction.objects.filter(pk__in=duplicate_ids))
+        for user_id in user_ids:
+            Budget.objects.recount(user_id)
+            dashboard.schedule(user_id)
+            records.invalidate(user_id)
+    deletion.delete_files(images)
+    return deleted
+
+
+class Command(BaseCommand):
+    # Django command to report or merge transactions sharing a fingerprint
+    help = 'Find transactions with the same wallet, day, amount and note'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='Only check the transactions of this user')
+        parser.add_argument('--prefix-length', type=int, default=2,
+                            help='Scan 16 ** N fingerprint ranges')
+        parser.add_argument('--merge', action='store_true',
+                            help='Delete duplicates, keeping the oldest')
+
+    def handle(self, *args, **options):
+        queryset = Transaction.objects.exclude(fingerprint='')
+        if options['user'] is not None:
+            queryset = queryset.filter(user_id=options['user'])
+
+        found = merged = 0
+        for start, end in fingerprint_ranges(options['prefix_length']):
+            groups = duplicate_groups(queryset, start, end)
+            if not groups:
+                continue
+            for ids in groups.values():
+                found += len(ids) - 1
+                self.stdout.write(
+                    f'Transaction {ids[0]} has duplicates '
+                    f'{", ".join(map(str, ids[1:]))}')
+            if options['merge']:
+                merged += merge(groups)
+
+        if options['merge']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Merged {merged} duplicate transactions'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Found {found} duplicate transactions'))
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from api.batch import chunked, run_chunks
+from api.models import Transaction
+from api.reports import yearly_report
+
+
+def generate_chunk(user_ids, year, output_dir):
+    # Write the yearly report of each user as output_dir/<user id>.json
+    for user_id in user_ids:
+        report = yearly_report(user_id, year)
+        path = os.path.join(output_dir, f'{user_id}.json')
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, cls=DjangoJSONEncoder)
+    return len(user_ids)
+
+
+class Command(BaseCommand):
+    # Django command to write the yearly report of every user to files
+    help = 'Generate yearly spending reports for all users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int,
+                            default=timezone.now().year - 1)
+        parser.add_argument('--output-dir',
+                            help='Defaults to REPORT_DIR/<year>')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker processes')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Users handled by one worker at a time')
+
+    def handle(self, *args, **options):
+        year = options['year']
+        output_dir = options['output_dir'] or os.path.join(
+            settings.REPORT_DIR, str(year))
+        os.makedirs(output_dir, exist_ok=True)
+        started = time.monotonic()
+
+        user_ids = list(Transaction.objects.filter(
+                            user__isnull=False, date__year=year)
+                        .order_by('user_id').values_list('user_id', flat=True)
+                        .distinct())
+        chunks = list(chunked(user_ids, options['chunk_size']))
+
+        done = 0
+        for count in run_chunks(generate_chunk, chunks, options['workers'],
+                                year, output_dir):
+            done += count
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{done}/{len(user_ids)} users ({rate:.0f}/s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {done} reports for {year} to {output_dir} in '
+            f'{time.monotonic() - started:.2f}s'))
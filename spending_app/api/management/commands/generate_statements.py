@@ -0,0 +1,99 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.batch import chunked, run_chunks
+from api.models import Transaction, add_months
+from api.statements import FORMATS, parse_month, write_statement
+
+
+def generate_chunk(user_ids, month, formats):
+    # Runs in a worker process with its own database connection
+    rows = sum(write_statement(user_id, month, formats)
+               for user_id in user_ids)
+    return user_ids, rows
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as checkpoint:
+        return {int(line) for line in checkpoint if line.strip()}
+
+
+class Command(BaseCommand):
+    # Django command to write monthly statements of every user to media
+    help = ('Write the monthly statement of every user as CSV and JSON '
+            'files under statements/<month>/ in media storage')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month',
+                            help='YYYY-MM, defaults to the previous month')
+        parser.add_argument('--formats', default=','.join(FORMATS),
+                            help='Comma separated, from csv and json')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker processes')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Users handled by one worker at a time')
+        parser.add_argument('--checkpoint',
+                            help='File listing finished users, defaults to '
+                                 'REPORT_DIR/statements/<month>.checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint of an earlier run')
+
+    def handle(self, *args, **options):
+        try:
+            month = parse_month(options['month']) if options['month'] else \
+                add_months(timezone.now().date().replace(day=1), -1)
+        except ValueError:
+            raise CommandError('--month must look like 2021-09')
+        formats = [f for f in options['formats'].split(',') if f]
+        unknown = set(formats) - set(FORMATS)
+        if unknown or not formats:
+            raise CommandError(
+                f'Unsupported formats {", ".join(sorted(unknown))}, '
+                f'choose from {", ".join(FORMATS)}')
+
+        # Kept on the reports volume, so it outlives a restarted container
+        checkpoint_path = options['checkpoint'] or os.path.join(
+            settings.REPORT_DIR, 'statements', f'{month:%Y-%m}.checkpoint')
+        os.makedirs(os.path.dirname(checkpoint_path) or '.', exist_ok=True)
+        if options['restart'] and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        finished = read_checkpoint(checkpoint_path)
+
+        user_ids = [
+            user_id for user_id in Transaction.objects.filter(
+                user__isnull=False, date__gte=month,
+                date__lt=add_months(month, 1)
+            ).order_by('user_id').values_list('user_id', flat=True)
+            .distinct()
+            if user_id not in finished
+        ]
+        if finished:
+            self.stdout.write(f'Resuming, {len(finished)} users already done')
+        chunks = list(chunked(user_ids, options['chunk_size']))
+
+        started = time.monotonic()
+        users = rows = 0
+        with open(checkpoint_path, 'a') as checkpoint:
+            for done_ids, done_rows in run_chunks(
+                    generate_chunk, chunks, options['workers'], month,
+                    formats):
+                checkpoint.writelines(f'{user_id}\n' for user_id in done_ids)
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+                users += len(done_ids)
+                rows += done_rows
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{users}/{len(user_ids)} users, {rows} transactions '
+                    f'({users / elapsed:.1f} users/s, '
+                    f'{rows / elapsed:.0f} rows/s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {month:%Y-%m} statements of {users} users in '
+            f'{time.monotonic() - started:.2f}s'))
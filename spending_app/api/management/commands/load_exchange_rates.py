@@ -0,0 +1,43 @@
+import csv
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from api.currency import rate_cache
+from api.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    # Django command to load exchange rates from a CSV file
+    help = 'Load exchange rates from a CSV file with date,base,quote,rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        pairs = defaultdict(dict)
+        with open(options['path'], newline='') as rates_file:
+            for row in csv.DictReader(rates_file):
+                pair = (row['base'].upper(), row['quote'].upper())
+                pairs[pair][parse_date(row['date'])] = Decimal(row['rate'])
+
+        created = updated = 0
+        with transaction.atomic():
+            for (base, quote), rates in pairs.items():
+                existing = ExchangeRate.objects.filter(
+                    base=base, quote=quote, date__in=list(rates))
+                for rate in existing:
+                    rate.rate = rates.pop(rate.date)
+                ExchangeRate.objects.bulk_update(existing, ['rate'])
+                ExchangeRate.objects.bulk_create(
+                    ExchangeRate(base=base, quote=quote, date=date, rate=rate)
+                    for date, rate in rates.items())
+                created += len(rates)
+                updated += len(existing)
+        rate_cache.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {created} new and {updated} updated exchange rates'))
@@ -0,0 +1,137 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import dashboard, records
+from api.batch import chunked
+from api.models import Budget, Flow, RecurringTransaction, Tag, Transaction
+
+
+def materialize_batch(rule_id, now, batch_size):
+    # Create up to batch_size due occurrences of one rule and advance it.
+    # The rule row is locked and advanced in the same transaction as the
+    # inserts, so a crashed or concurrent run never creates duplicates.
+    with transaction.atomic():
+        rule = RecurringTransaction.objects.select_for_update(
+            skip_locked=True).filter(
+                pk=rule_id, is_active=True, next_run__lte=now).first()
+        if rule is None:
+            return 0
+
+        dates = []
+        while len(dates) < batch_size and rule.next_run <= now:
+            if rule.end_date and rule.next_run > rule.end_date:
+                rule.is_active = False
+                break
+            dates.append(rule.next_run)
+            rule.occurrence_count += 1
+            rule.next_run = rule.occurrence(rule.occurrence_count)
+
+        tag_ids = list(rule.tags.values_list('pk', flat=True))
+        occurrences = [rule.build_transaction(date) for date in dates]
+        for occurrence in occurrences:
+            occurrence.tag_ids = tag_ids
+        Transaction.objects.bulk_create(occurrences)
+        if dates and tag_ids:
+            through = Transaction.tags.through
+            created = Transaction.objects.filter(
+                recurring=rule, date__in=dates).values_list('pk', flat=True)
+            through.objects.bulk_create([
+                through(transaction_id=transaction_id, tag_id=tag_id)
+                for transaction_id in created for tag_id in tag_ids
+            ])
+            Tag.objects.refresh_usage(tag_ids)
+        if rule.flow == Flow.EXPENSES:
+            for date in dates:
+                Budget.objects.apply_spend(
+                    rule.user_id, date.date(), rule.ammount,
+                    rule.category_id, tag_ids)
+
+        rule.save(update_fields=['occurrence_count', 'next_run', 'is_active'])
+        if dates:
+            dashboard.schedule(rule.user_id)
+            records.invalidate(rule.user_id)
+        return len(dates)
+
+
+def materialize_users(user_ids, now, batch_size, close_connection=False):
+    # Materialize every due rule of the given users, batch by batch
+    created = 0
+    try:
+        rule_ids = RecurringTransaction.objects.filter(
+            user_id__in=user_ids, is_active=True, next_run__lte=now
+        ).values_list('pk', flat=True)
+        for rule_id in list(rule_ids):
+            while True:
+                count = materialize_batch(rule_id, now, batch_size)
+                created += count
+                if count < batch_size:
+                    break
+    finally:
+        # Worker threads open their own connection, release it when done
+        if close_connection:
+            connection.close()
+    return created
+
+
+class Command(BaseCommand):
+    # Django command to create due transactions from recurring rules
+    help = 'Create the transactions that recurring rules are due for'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Users handled by one worker at a time')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running as a scheduler')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='Seconds between scheduler runs')
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def run_once(self, options):
+        now = timezone.now()
+        started = time.monotonic()
+        user_ids = list(RecurringTransaction.objects.filter(
+            is_active=True, next_run__lte=now
+        ).order_by('user_id').values_list('user_id', flat=True).distinct())
+        chunks = list(chunked(user_ids, options['chunk_size']))
+        batch_size = options['batch_size']
+
+        created = 0
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as pool:
+                futures = [
+                    pool.submit(materialize_users, chunk, now, batch_size,
+                                close_connection=True)
+                    for chunk in chunks
+                ]
+                for done, future in enumerate(as_completed(futures), 1):
+                    created += future.result()
+                    self.report_progress(done, len(chunks), created, started)
+        else:
+            for done, chunk in enumerate(chunks, 1):
+                created += materialize_users(chunk, now, batch_size)
+                self.report_progress(done, len(chunks), created, started)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Materialized {created} transactions for {len(user_ids)} '
+            f'users in {elapsed:.2f}s'
+        ))
+
+    def report_progress(self, done, total, created, started):
+        rate = created / max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Chunk {done}/{total}: {created} transactions '
+            f'({rate:.0f}/s)'
+        )
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    # Django command to delete idempotency keys older than their TTL
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL)
+        expired = IdempotencyKey.objects.filter(created__lt=cutoff)
+        deleted = 0
+        while True:
+            batch = list(expired.values_list('pk', flat=True)
+                         [:options['batch_size']])
+            if not batch:
+                break
+            deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,113 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from api import metrics, tasks
+from api.batch import process_pool
+from api.models import Task, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+
+def run_in_thread(task_id):
+    try:
+        return tasks.run(task_id)
+    finally:
+        connection.close()
+
+
+def run_in_process(task_id):
+    try:
+        return tasks.run(task_id)
+    except Exception:
+        # Drop a connection the error may have left unusable, the process
+        # runs further tasks
+        connection.close()
+        raise
+
+
+class Command(BaseCommand):
+    # Django command to run queued tasks on a thread or process pool
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--pool', choices=('thread', 'process'),
+                            default='thread')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when no task is due')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if options['pool'] == 'process':
+            pool = process_pool(concurrency)
+            target = run_in_process
+        else:
+            pool = ThreadPoolExecutor(concurrency)
+            target = run_in_thread
+
+        self.requeue_stale()
+        self.stdout.write(f'Worker started with {concurrency} '
+                          f'{options["pool"]} workers')
+
+        running = {}
+        processed = 0
+        # Renew leases a few times per lease, well before they run out
+        renew_every = getattr(settings, 'TASK_LEASE', 60) / 3
+        renewed = time.monotonic()
+        with pool:
+            while True:
+                close_old_connections()
+                free = concurrency - len(running)
+                if free:
+                    running.update((pool.submit(target, task_id), task_id)
+                                   for task_id in tasks.claim(free))
+                metrics.set_gauge('tasks.in_flight', len(running))
+                if not running:
+                    if options['once']:
+                        break
+                    self.purge_finished()
+                    self.requeue_stale()
+                    time.sleep(options['poll_interval'])
+                    continue
+                if time.monotonic() - renewed >= renew_every:
+                    tasks.renew(running.values())
+                    renewed = time.monotonic()
+                done, _ = wait(
+                    running, timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception:
+                        # Running the task's bookkeeping failed, e.g. the
+                        # connection dropped. The task keeps its lease
+                        # until it runs out and requeue_stale retries it.
+                        logger.exception('Could not run task %s', task_id)
+                        metrics.incr('tasks.errors')
+                        close_old_connections()
+                processed += len(done)
+
+        stats = tasks.queue_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} tasks, {stats["depth"]} pending'))
+
+    def requeue_stale(self):
+        requeued = tasks.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale tasks')
+
+    def purge_finished(self):
+        # Keep the queue table small by dropping old finished tasks
+        cutoff = timezone.now() - timedelta(
+            seconds=getattr(settings, 'TASK_RESULT_TTL', 86400))
+        Task.objects.filter(
+            status=TaskStatus.DONE, finished__lt=cutoff).delete()
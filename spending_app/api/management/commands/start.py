@@ -0,0 +1,50 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+
+from api import audit
+from api.health import pending_migrations
+
+
+def preload():
+    # Import the URLconf and build the handler and its middleware so the
+    # first requests do not pay for it
+    get_wsgi_application()
+    get_resolver().reverse_dict
+
+
+class Command(BaseCommand):
+    # Django command to wait for the database, migrate if needed and serve
+    help = 'Wait for the database, apply pending migrations and run server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('addrport', nargs='?', default='0.0.0.0:8000')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait for the database')
+        parser.add_argument('--reload', action='store_true',
+                            help='Restart the server when code changes')
+
+    def handle(self, *args, **options):
+        # The autoreloader runs this command again in a child process,
+        # after the parent already waited and migrated
+        if os.environ.get('RUN_MAIN') != 'true':
+            self.prepare_database(options['timeout'])
+
+        preload()
+        audit.start()
+        call_command('runserver', options['addrport'],
+                     use_reloader=options['reload'])
+
+    def prepare_database(self, timeout):
+        call_command('wait_for_db', timeout=timeout)
+
+        plan = pending_migrations()
+        if plan:
+            self.stdout.write(f'Applying {len(plan)} pending migrations')
+            call_command('migrate', interactive=False)
+        else:
+            self.stdout.write('No pending migrations')
+        call_command('createcachetable')
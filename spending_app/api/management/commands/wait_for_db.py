@@ -1,19 +1,38 @@
 import time
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     # Django command to pause execution until database is available
 
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait before giving up')
+        parser.add_argument('--max-delay', type=float, default=5,
+                            help='Longest pause between attempts')
+
     def handle(self, *args, **options):
         self.stdout.write('Wating for database...')
-        db_connection = None
-        while not db_connection:
+        db_connection = connections[options['database']]
+        deadline = time.monotonic() + options['timeout']
+        delay = 0.1
+        while True:
             try:
-                db_connection = connections['default']
+                # Looking up the alias never connects, so open the
+                # connection to be sure the server accepts clients
+                db_connection.ensure_connection()
+                break
             except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second')
-                time.sleep(1)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError('Database unavailable after '
+                                       f'{options["timeout"]:g} seconds')
+                delay = min(delay, remaining)
+                self.stdout.write(
+                    f'Database unavailable, waiting {delay:g} seconds')
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
         self.stdout.write(self.style.SUCCESS('Database available!'))
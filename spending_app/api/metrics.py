@@ -0,0 +1,46 @@
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+
+
+def incr(name, amount=1):
+    # Add to a monotonically increasing counter
+    with _lock:
+        _counters[name] += amount
+
+
+def set_gauge(name, value):
+    # Record the current value of something that goes up and down
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    # Record a duration, keeping its count, total and maximum
+    with _lock:
+        timing = _timings.setdefault(
+            name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': {name: dict(timing)
+                        for name, timing in _timings.items()},
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,68 @@
+import re
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from . import health
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    # Compress responses above a size threshold with brotli or gzip
+
+    def process_response(self, request, response):
+        min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            encoding = 'br'
+            compressed = brotli.compress(response.content)
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding = 'gzip'
+            compressed = compress_string(response.content)
+        else:
+            return response
+
+        # Keep the original body if compression does not pay off
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class HealthCheckMiddleware(MiddlewareMixin):
+    # Answer load balancer probes before sessions, authentication and the
+    # URL resolver run. /healthz only shows the process is serving,
+    # /readyz also checks the database, media volume and migrations.
+
+    def process_request(self, request):
+        path = request.path_info.rstrip('/')
+        if path == '/healthz':
+            return JsonResponse({'status': 'ok'})
+        if path == '/readyz':
+            ready, checks = health.readiness()
+            return JsonResponse(
+                {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+                status=200 if ready else 503)
+        return None
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_transaction_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_user_category_name'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='category',
+            field=models.CharField(max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='flow',
+            field=models.CharField(max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='category_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='api.category'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='flow_code',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'expenses'), (2, 'income')], null=True),
+        ),
+    ]
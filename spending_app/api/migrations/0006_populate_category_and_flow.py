@@ -0,0 +1,55 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+EXPENSES, INCOME = 1, 2
+
+
+def batches(Transaction):
+    # Yield primary key ranges so each batch only locks a slice of rows
+    last = Transaction.objects.order_by('-pk').values_list('pk', flat=True)
+    last = last.first()
+    for start in range(0, (last or 0) + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+def forwards(apps, schema_editor):
+    Transaction = apps.get_model('api', 'Transaction')
+    Category = apps.get_model('api', 'Category')
+    for start, end in batches(Transaction):
+        with transaction.atomic():
+            rows = Transaction.objects.filter(pk__gte=start, pk__lt=end)
+            pairs = rows.values_list('user_id', 'category').distinct()
+            for user_id, name in pairs:
+                category, _ = Category.objects.get_or_create(
+                    user_id=user_id, name=name)
+                rows.filter(user_id=user_id, category=name)\
+                    .update(category_ref=category)
+            rows.filter(flow__iexact='income').update(flow_code=INCOME)
+            rows.exclude(flow__iexact='income').update(flow_code=EXPENSES)
+
+
+def backwards(apps, schema_editor):
+    Transaction = apps.get_model('api', 'Transaction')
+    Category = apps.get_model('api', 'Category')
+    for start, end in batches(Transaction):
+        with transaction.atomic():
+            rows = Transaction.objects.filter(pk__gte=start, pk__lt=end)
+            category_ids = rows.values_list('category_ref', flat=True)
+            for category in Category.objects.filter(pk__in=category_ids):
+                rows.filter(category_ref=category)\
+                    .update(category=category.name)
+            rows.filter(flow_code=INCOME).update(flow='income')
+            rows.filter(flow_code=EXPENSES).update(flow='expenses')
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own to keep locks short on large tables
+    atomic = False
+
+    dependencies = [
+        ('api', '0005_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
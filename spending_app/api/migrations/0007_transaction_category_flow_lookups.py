@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_populate_category_and_flow'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='transaction',
+            name='category',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='flow',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='category_ref',
+            new_name='category',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='flow_code',
+            new_name='flow',
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.category'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='flow',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'expenses'), (2, 'income')]),
+        ),
+    ]
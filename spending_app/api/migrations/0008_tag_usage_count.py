@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+# Lets `lower(name) LIKE 'prefix%'` autocomplete lookups use an index
+CREATE_PREFIX_INDEX = (
+    'CREATE INDEX api_tag_user_lower_name_prefix '
+    'ON api_tag (user_id, lower(name) text_pattern_ops)'
+)
+DROP_PREFIX_INDEX = 'DROP INDEX IF EXISTS api_tag_user_lower_name_prefix'
+
+
+def populate_usage_count(apps, schema_editor):
+    Tag = apps.get_model('api', 'Tag')
+    Through = apps.get_model('api', 'Transaction').tags.through
+    counts = Through.objects.values('tag').annotate(count=Count('pk'))
+    for row in counts.iterator():
+        Tag.objects.filter(pk=row['tag']).update(usage_count=row['count'])
+
+
+def create_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_PREFIX_INDEX)
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_PREFIX_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_transaction_category_flow_lookups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_usage_count, migrations.RunPython.noop),
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_tag_usage_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flow', models.PositiveSmallIntegerField(choices=[(1, 'expenses'), (2, 'income')])),
+                ('note', models.TextField(blank=True, max_length=500, null=True)),
+                ('ammount', models.IntegerField()),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('start_date', models.DateTimeField()),
+                ('end_date', models.DateTimeField(blank=True, null=True)),
+                ('occurrence_count', models.PositiveIntegerField(default=0)),
+                ('next_run', models.DateTimeField(db_index=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.category'),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='tags',
+            field=models.ManyToManyField(blank=True, to='api.Tag'),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.wallet'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='recurring',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.recurringtransaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('recurring', 'date'), name='unique_recurring_occurrence'),
+        ),
+    ]
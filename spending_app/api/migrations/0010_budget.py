@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_recurringtransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Budget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=10)),
+                ('limit', models.PositiveIntegerField()),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('spent', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.category')),
+                ('tag', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.tag')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='budget',
+            index=models.Index(fields=['user', 'category', 'period_start'], name='budget_user_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='budget',
+            index=models.Index(fields=['user', 'tag', 'period_start'], name='budget_user_tag_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='budget',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('category__isnull', True), ('tag__isnull', False)), models.Q(('category__isnull', False), ('tag__isnull', True)), _connector='OR'), name='budget_category_or_tag'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_budget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=10)),
+                ('quote', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('base', 'quote', 'date'), name='unique_exchange_rate_per_day'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('sql', models.TextField()),
+                ('origin', models.CharField(blank=True, max_length=255)),
+                ('stack', models.TextField(blank=True)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('total_time', models.FloatField(default=0)),
+                ('max_time', models.FloatField(default=0)),
+                ('explain', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_slowquery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['date'], name='transaction_date_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:53
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_transaction_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField(null=True)),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model', 'object_id'], name='auditlog_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user_id', 'created'], name='auditlog_user_created_idx'),
+        ),
+    ]
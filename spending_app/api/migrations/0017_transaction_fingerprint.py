@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_auditlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='is_duplicate',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,54 @@
+import hashlib
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 5000
+
+
+def transaction_fingerprint(user_id, wallet_id, date, ammount, note):
+    # A copy of api.models.transaction_fingerprint as of this migration,
+    # so later changes to the model module do not change the backfill
+    note = ' '.join((note or '').lower().split())
+    key = f'{user_id}|{wallet_id}|{date.date()}|{ammount}|{note}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def batches(Transaction):
+    # Yield primary key ranges so each batch only locks a slice of rows
+    last = Transaction.objects.order_by('-pk').values_list('pk', flat=True)
+    last = last.first()
+    for start in range(0, (last or 0) + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+def forwards(apps, schema_editor):
+    Transaction = apps.get_model('api', 'Transaction')
+    for start, end in batches(Transaction):
+        with transaction.atomic():
+            rows = list(Transaction.objects.filter(
+                pk__gte=start, pk__lt=end).only(
+                    'user_id', 'wallet_id', 'date', 'ammount', 'note'))
+            for row in rows:
+                row.fingerprint = transaction_fingerprint(
+                    row.user_id, row.wallet_id, row.date, row.ammount,
+                    row.note)
+            Transaction.objects.bulk_update(rows, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own to keep locks short on large tables,
+    # the index is built once every row has its fingerprint
+    atomic = False
+
+    dependencies = [
+        ('api', '0017_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['fingerprint'],
+                               name='transaction_fingerprint_idx'),
+        ),
+    ]
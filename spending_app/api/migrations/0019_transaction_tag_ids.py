@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 21:15
+
+import api.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_backfill_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='tag_ids',
+            field=api.models.IdArrayField(blank=True, default=list),
+        ),
+    ]
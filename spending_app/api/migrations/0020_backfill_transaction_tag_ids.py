@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+
+GIN_INDEX = 'transaction_tag_ids_gin'
+
+
+def batches(Transaction):
+    # Yield primary key ranges so each batch only locks a slice of rows
+    last = Transaction.objects.order_by('-pk').values_list('pk', flat=True)
+    last = last.first()
+    for start in range(0, (last or 0) + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+def forwards(apps, schema_editor):
+    Transaction = apps.get_model('api', 'Transaction')
+    through = Transaction.tags.through
+    for start, end in batches(Transaction):
+        with transaction.atomic():
+            tag_ids = defaultdict(list)
+            for transaction_id, tag_id in through.objects.filter(
+                    transaction_id__gte=start, transaction_id__lt=end
+            ).values_list('transaction_id', 'tag_id'):
+                tag_ids[transaction_id].append(tag_id)
+            Transaction.objects.bulk_update(
+                [Transaction(pk=pk, tag_ids=ids)
+                 for pk, ids in tag_ids.items()],
+                ['tag_ids'], batch_size=500)
+
+
+def create_gin_index(apps, schema_editor):
+    # Only PostgreSQL has array columns, elsewhere tag_ids is JSON text
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {GIN_INDEX} '
+            f'ON api_transaction USING gin (tag_ids)')
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'DROP INDEX CONCURRENTLY IF EXISTS {GIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own to keep locks short on large tables and
+    # the index is built without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('api', '0019_transaction_tag_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_backfill_transaction_tag_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 21:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_task_lease_expires'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['flow', 'date'], name='transaction_flow_date_idx'),
+        ),
+    ]
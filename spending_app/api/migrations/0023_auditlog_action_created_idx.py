@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 21:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_transaction_flow_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['action', 'created'], name='auditlog_action_created_idx'),
+        ),
+    ]
@@ -1,9 +1,19 @@
 import uuid
 import os
+import calendar
+import hashlib
+import json
+from datetime import date, datetime, timedelta
 from django.db import models
+from django.db.models import (Count, F, Lookup, OuterRef, Q, Subquery,
+                              Sum)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import FieldGetDbPrepValueMixin
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
 
 
 def transaction_image_file_path(instance, filename):
@@ -13,6 +23,43 @@ def transaction_image_file_path(instance, filename):
     return os.path.join('uploads/transaction/', filename)
 
 
+def as_day(value):
+    # Transactions may hold the raw string they were created with
+    if isinstance(value, str):
+        value = parse_datetime(value) or date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def transaction_fingerprint(user_id, wallet_id, day, ammount, note):
+    # Hash of what makes two transactions the same spend. The time of day
+    # is dropped and the note normalized, so repeated imports collide.
+    note = ' '.join((note or '').lower().split())
+    key = f'{user_id}|{wallet_id}|{as_day(day)}|{ammount}|{note}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def add_months(value, months):
+    # Shift a datetime by whole months, clamping to the last day of month
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def period_bounds(period, day):
+    # Return the first day of the period containing day and of the next one
+    if period == Period.WEEKLY:
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(weeks=1)
+    if period == Period.MONTHLY:
+        start = day.replace(day=1)
+        return start, add_months(start, 1)
+    start = day.replace(month=1, day=1)
+    return start, add_months(start, 12)
+
+
 class UserManager(BaseUserManager):
 
     def create_user(self, email, password=None, **extra_fields):
@@ -61,14 +108,105 @@ class Wallet(models.Model):
         return str(self.name)
 
 
+class Flow(models.IntegerChoices):
+    EXPENSES = 1, 'expenses'
+    INCOME = 2, 'income'
+
+
+class Category(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True
+    )
+    name = models.CharField(max_length=20)
+
+    class Meta:
+        verbose_name_plural = 'categories'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_user_category_name'),
+        ]
+
+    def __str__(self):
+        return str(self.name)
+
+
+class IdArrayField(models.Field):
+    # Sorted list of ids, a bigint[] on PostgreSQL and JSON text elsewhere
+    description = 'List of ids'
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', list)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'bigint[]'
+        return 'text'
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = json.loads(value)
+        return sorted(int(pk) for pk in value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = self.to_python(value)
+        if connection.vendor == 'postgresql':
+            return value
+        return json.dumps(value)
+
+
+@IdArrayField.register_lookup
+class IdArrayContains(FieldGetDbPrepValueMixin, Lookup):
+    # Rows holding every one of the given ids, served by the GIN index on
+    # PostgreSQL
+    lookup_name = 'contains'
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @> {rhs}::bigint[]', lhs_params + rhs_params
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return (f'NOT EXISTS (SELECT 1 FROM json_each({rhs}) wanted '
+                f'WHERE wanted.value NOT IN '
+                f'(SELECT value FROM json_each({lhs})))',
+                rhs_params + lhs_params)
+
+
+class TransactionManager(models.Manager):
+
+    def refresh_tag_ids(self, transaction_ids):
+        # Copy the tags of each of the given transactions into tag_ids
+        through = Transaction.tags.through
+        tag_ids = {pk: [] for pk in transaction_ids}
+        for transaction_id, tag_id in through.objects.filter(
+                transaction_id__in=tag_ids).values_list(
+                'transaction_id', 'tag_id'):
+            tag_ids[transaction_id].append(tag_id)
+        self.bulk_update(
+            [Transaction(pk=pk, tag_ids=ids) for pk, ids in tag_ids.items()],
+            ['tag_ids'], batch_size=500)
+        return tag_ids
+
+
 class Transaction(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         null=True
     )
-    flow = models.CharField(max_length=20)
-    category = models.CharField(max_length=20)
+    flow = models.PositiveSmallIntegerField(choices=Flow.choices)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT)
     wallet = models.ForeignKey(
         Wallet, on_delete=models.CASCADE)
     tags = models.ManyToManyField('Tag', blank=True)
@@ -76,15 +214,364 @@ class Transaction(models.Model):
     note = models.TextField(max_length=500, blank=True, null=True)
     ammount = models.IntegerField()
     image = models.ImageField(null=True, upload_to=transaction_image_file_path)
+    recurring = models.ForeignKey(
+        'RecurringTransaction',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    # See transaction_fingerprint, kept up to date by save
+    fingerprint = models.CharField(max_length=40, blank=True)
+    # Set when created while a transaction with the same fingerprint existed
+    is_duplicate = models.BooleanField(default=False)
+    # Copy of the tags' ids so reads and tag filters skip the join table,
+    # kept up to date by signals
+    tag_ids = IdArrayField()
+
+    objects = TransactionManager()
+
+    class Meta:
+        constraints = [
+            # One occurrence per recurring rule and date
+            models.UniqueConstraint(
+                fields=['recurring', 'date'],
+                name='unique_recurring_occurrence'),
+        ]
+        indexes = [
+            # Admin date hierarchy and ordering
+            models.Index(fields=['date'], name='transaction_date_idx'),
+            # Admin flow filter, newest first
+            models.Index(fields=['flow', 'date'],
+                         name='transaction_flow_date_idx'),
+            models.Index(fields=['fingerprint'],
+                         name='transaction_fingerprint_idx'),
+        ]
 
     def __str__(self):
         return str(self.category)
 
+    def compute_fingerprint(self):
+        return transaction_fingerprint(
+            self.user_id, self.wallet_id, self.date, self.ammount, self.note)
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.compute_fingerprint()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'fingerprint'}
+        super().save(*args, **kwargs)
+
+
+class Frequency(models.TextChoices):
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+
+
+class RecurringTransaction(models.Model):
+    # Rule that materializes a transaction every `interval` periods
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True
+    )
+    flow = models.PositiveSmallIntegerField(choices=Flow.choices)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE)
+    tags = models.ManyToManyField('Tag', blank=True)
+    note = models.TextField(max_length=500, blank=True, null=True)
+    ammount = models.IntegerField()
+    frequency = models.CharField(max_length=10, choices=Frequency.choices)
+    interval = models.PositiveSmallIntegerField(default=1)
+    start_date = models.DateTimeField()
+    end_date = models.DateTimeField(null=True, blank=True)
+    occurrence_count = models.PositiveIntegerField(default=0)
+    next_run = models.DateTimeField(db_index=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f'{self.category} every {self.interval} {self.frequency}'
+
+    def occurrence(self, index):
+        # Return the date of the index-th occurrence, counted from start
+        step = index * self.interval
+        if self.frequency == Frequency.DAILY:
+            return self.start_date + timedelta(days=step)
+        if self.frequency == Frequency.WEEKLY:
+            return self.start_date + timedelta(weeks=step)
+        if self.frequency == Frequency.MONTHLY:
+            return add_months(self.start_date, step)
+        return add_months(self.start_date, 12 * step)
+
+    def reschedule(self):
+        # Restart the schedule after its start, frequency or interval
+        # changed, past the last occurrence already materialized
+        last = self.transaction_set.order_by('-date')\
+            .values_list('date', flat=True).first()
+        index = 0
+        if last is not None:
+            while self.occurrence(index) <= last:
+                index += 1
+        self.occurrence_count = index
+        self.next_run = self.occurrence(index)
+
+    def build_transaction(self, date):
+        # The fingerprint is set here because bulk_create skips save
+        transaction = Transaction(
+            user_id=self.user_id,
+            flow=self.flow,
+            category_id=self.category_id,
+            wallet_id=self.wallet_id,
+            date=date,
+            note=self.note,
+            ammount=self.ammount,
+            recurring=self,
+        )
+        transaction.fingerprint = transaction.compute_fingerprint()
+        return transaction
+
+
+class TagManager(models.Manager):
+
+    def refresh_usage(self, tag_ids):
+        # Recount how many transactions use each of the given tags
+        through = Transaction.tags.through
+        usage = through.objects.filter(tag=OuterRef('pk')).order_by()\
+            .values('tag').annotate(count=Count('pk')).values('count')
+        self.filter(pk__in=tag_ids).update(
+            usage_count=Coalesce(Subquery(usage), 0))
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=100)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE, null=True)
+    # Number of transactions with this tag, kept up to date by signals
+    usage_count = models.PositiveIntegerField(default=0)
+
+    objects = TagManager()
 
     def __str__(self):
         return str(self.name)
+
+
+class Period(models.TextChoices):
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+
+
+class BudgetManager(models.Manager):
+
+    def apply_spend(self, user_id, day, amount, category_id=None,
+                    tag_ids=()):
+        # Add amount to the budgets whose current period contains day and
+        # that track the given category or any of the given tags
+        match = Q(pk__in=[])
+        if category_id is not None:
+            match |= Q(category_id=category_id)
+        if tag_ids:
+            match |= Q(tag_id__in=tag_ids)
+        return self.filter(
+            match, user_id=user_id, period_start__lte=day, period_end__gt=day
+        ).update(spent=F('spent') + amount)
+
+    def roll_over(self, user_id, today):
+        # Start a new period for the user's budgets whose period has ended
+        for budget in self.filter(user_id=user_id, period_end__lte=today):
+            budget.start_period(today)
+            budget.save()
+
+    def recount(self, user_id):
+        # Recount the spend of a user's budgets after bulk changes
+        for budget in self.filter(user_id=user_id):
+            budget.start_period(budget.period_start)
+            budget.save(update_fields=['spent'])
+
+
+class Budget(models.Model):
+    # Spending limit for a category or a tag over a repeating period
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True)
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, null=True, blank=True)
+    period = models.CharField(
+        max_length=10, choices=Period.choices, default=Period.MONTHLY)
+    limit = models.PositiveIntegerField()
+    period_start = models.DateField()
+    period_end = models.DateField()
+    # Expenses in the current period, updated on every matching write
+    spent = models.IntegerField(default=0)
+
+    objects = BudgetManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'category', 'period_start'],
+                         name='budget_user_category_idx'),
+            models.Index(fields=['user', 'tag', 'period_start'],
+                         name='budget_user_tag_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(category__isnull=True, tag__isnull=False) |
+                Q(category__isnull=False, tag__isnull=True),
+                name='budget_category_or_tag'),
+        ]
+
+    def __str__(self):
+        return f'{self.category or self.tag} {self.period}'
+
+    def matching_transactions(self):
+        transactions = Transaction.objects.filter(
+            user_id=self.user_id,
+            flow=Flow.EXPENSES,
+            date__gte=self.period_start,
+            date__lt=self.period_end,
+        )
+        if self.category_id is not None:
+            return transactions.filter(category_id=self.category_id)
+        return transactions.filter(tags=self.tag_id)
+
+    def start_period(self, day):
+        # Move the budget to the period containing day and recount it
+        self.period_start, self.period_end = period_bounds(self.period, day)
+        self.spent = self.matching_transactions()\
+            .aggregate(total=Sum('ammount'))['total'] or 0
+
+
+class ExchangeRate(models.Model):
+    # Price of one unit of base currency in quote currency on a date
+    base = models.CharField(max_length=10)
+    quote = models.CharField(max_length=10)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['base', 'quote', 'date'],
+                name='unique_exchange_rate_per_day'),
+        ]
+
+    def __str__(self):
+        return f'{self.base}/{self.quote} {self.date}: {self.rate}'
+
+
+class IdempotencyKey(models.Model):
+    # Stored response of a write request, replayed on client retries
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    # Empty while the first request is still being processed
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.key})'
+
+
+class TaskStatus(models.TextChoices):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class Task(models.Model):
+    # Deferred call of a registered task function, run by run_worker
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=10, choices=TaskStatus.choices,
+        default=TaskStatus.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # A running task belongs to its worker until then, renewed while the
+    # worker is alive
+    lease_expires = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class SlowQuery(models.Model):
+    # Statement shape that exceeded SLOW_QUERY_THRESHOLD, aggregated over
+    # every slow execution
+    fingerprint = models.CharField(max_length=40, unique=True)
+    sql = models.TextField()
+    origin = models.CharField(max_length=255, blank=True)
+    stack = models.TextField(blank=True)
+    calls = models.PositiveIntegerField(default=0)
+    total_time = models.FloatField(default=0)
+    max_time = models.FloatField(default=0)
+    explain = models.TextField(blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f'{self.origin} ({self.calls} calls)'
+
+
+class AuditAction(models.TextChoices):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+
+class AuditLog(models.Model):
+    # Append-only record of writes made through the api, filled in batches
+    # by the audit flusher thread. The user is a plain id so entries stay
+    # when the account is deleted.
+    user_id = models.BigIntegerField(null=True)
+    action = models.CharField(max_length=10, choices=AuditAction.choices)
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField(null=True)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id'],
+                         name='auditlog_object_idx'),
+            models.Index(fields=['user_id', 'created'],
+                         name='auditlog_user_created_idx'),
+            # Admin action filter, newest first
+            models.Index(fields=['action', 'created'],
+                         name='auditlog_action_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.action} {self.model} {self.object_id}'
@@ -0,0 +1,41 @@
+import cProfile
+import os
+import random
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+
+def requested(request):
+    # Staff can profile a single request with ?profile=1 or X-Profile: 1
+    flag = request.META.get('HTTP_X_PROFILE') or \
+        request.query_params.get('profile')
+    return flag not in (None, '', '0') and request.user.is_staff
+
+
+def sampled():
+    # Profile one in PROFILE_SAMPLE_RATE requests, 0 disables sampling
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    return rate > 0 and random.randrange(rate) == 0
+
+
+def start(request):
+    if not (sampled() or requested(request)):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def save(profiler, request):
+    # Write the stats in the pstats format read by snakeviz, flameprof
+    # and similar flamegraph tools, and return the file name
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{}-{}-{}.prof'.format(
+        timezone.now().strftime('%Y%m%d%H%M%S'), request.method.lower(),
+        slugify(request.path)[:80], uuid.uuid4().hex[:8])
+    profiler.dump_stats(os.path.join(directory, name))
+    return name
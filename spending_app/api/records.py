@@ -0,0 +1,220 @@
+import sys
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .db_router import shared_cache
+from .models import Flow, Tag, Transaction
+
+EPOCH = datetime(1970, 1, 1)
+# Shared by every record without tags
+NO_TAGS = ()
+
+
+class TransactionRecord:
+    # A transaction in a fraction of the memory of a model instance: the
+    # date as whole seconds, the category name interned so equal names
+    # share one string and the tag ids packed in an array
+
+    __slots__ = ('id', 'seconds', 'flow', 'category', 'wallet_id',
+                 'ammount', 'note', 'tag_ids')
+
+    def __init__(self, id, date, flow, category, wallet_id, ammount, note,
+                 tag_ids=()):
+        self.id = id
+        self.seconds = int((date - EPOCH).total_seconds())
+        self.flow = flow
+        self.category = sys.intern(category)
+        self.wallet_id = wallet_id
+        self.ammount = ammount
+        self.note = note or None
+        self.tag_ids = array('q', tag_ids) if tag_ids else NO_TAGS
+
+    @property
+    def date(self):
+        return EPOCH + timedelta(seconds=self.seconds)
+
+    def size(self):
+        # Bytes held by this record alone, interned and shared values aside
+        size = sys.getsizeof(self) + sys.getsizeof(self.seconds) + \
+            sys.getsizeof(self.ammount)
+        if self.note is not None:
+            size += sys.getsizeof(self.note)
+        if self.tag_ids:
+            size += sys.getsizeof(self.tag_ids)
+        return size
+
+
+class UserRecords:
+    # A user's transactions newest first, with the names of their tags
+
+    def __init__(self, records, tag_names, version):
+        self.records = records
+        self.tag_names = tag_names
+        self.version = version
+        self.built = time.monotonic()
+        self.size = sys.getsizeof(records) + sum(
+            record.size() for record in records) + sum(
+            sys.getsizeof(name) for name in tag_names.values())
+
+    def month_spend(self, month):
+        # Expenses per category from the first day of month on
+        start = int((datetime(month.year, month.month, month.day) - EPOCH)
+                    .total_seconds())
+        totals = Counter()
+        for record in self.records:
+            if record.seconds < start:
+                break
+            if record.flow == Flow.EXPENSES:
+                totals[record.category] += record.ammount
+        return totals.most_common()
+
+    def search(self, keyword):
+        # Ids of the transactions with a matching tag name, else category
+        # name, else note, like the database search of the transaction list
+        keyword = keyword.lower()
+        tag_ids = {pk for pk, name in self.tag_names.items()
+                   if keyword in name}
+        if tag_ids:
+            ids = [record.id for record in self.records
+                   if not tag_ids.isdisjoint(record.tag_ids)]
+            if ids:
+                return ids
+        ids = [record.id for record in self.records
+               if keyword in record.category.lower()]
+        if ids:
+            return ids
+        return [record.id for record in self.records
+                if record.note is not None and keyword in record.note.lower()]
+
+
+def version_key(user_id):
+    return f'records:version:{user_id}'
+
+
+def current_version(user_id):
+    # Writes change the version in the SHARED_CACHE, so a process notices
+    # records built before another process's write
+    cache = shared_cache()
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def build(user_id, version):
+    # None when the user has more than RECORD_CACHE_MAX_ROWS transactions,
+    # those are read from the database instead
+    limit = getattr(settings, 'RECORD_CACHE_MAX_ROWS', 20000)
+    rows = list(Transaction.objects.filter(user_id=user_id)
+                .order_by('-date', '-pk')
+                .values_list('pk', 'date', 'flow', 'category__name',
+                             'wallet_id', 'ammount', 'note', 'tag_ids')
+                [:limit + 1])
+    if len(rows) > limit:
+        return None
+    tag_names = {pk: name.lower() for pk, name in Tag.objects.filter(
+        user_id=user_id).values_list('pk', 'name')}
+    records = [TransactionRecord(*row) for row in rows]
+    return UserRecords(records, tag_names, version)
+
+
+class RecordCache:
+    # Thread safe LRU cache of per-user records evicting the least recently
+    # used users once the records take more than max_bytes
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def peek(self, user_id, version=None):
+        # The user's records when cached and current, never built
+        max_age = getattr(settings, 'RECORD_CACHE_MAX_AGE', 10 * 60)
+        if version is None:
+            version = current_version(user_id)
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry.version == version and \
+                    time.monotonic() - entry.built < max_age:
+                self.entries.move_to_end(user_id)
+                return entry
+        return None
+
+    def get(self, user_id):
+        version = current_version(user_id)
+        entry = self.peek(user_id, version)
+        if entry is not None:
+            return entry
+        entry = build(user_id, version)
+        if entry is None or entry.size > self.max_bytes:
+            self.discard(user_id)
+            return entry
+        with self.lock:
+            previous = self.entries.pop(user_id, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.entries[user_id] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+        return entry
+
+    def discard(self, user_id):
+        with self.lock:
+            entry = self.entries.pop(user_id, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+record_cache = RecordCache(
+    getattr(settings, 'RECORD_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def get(user_id):
+    # The user's records, or None when they are too many to keep
+    return record_cache.get(user_id)
+
+
+def search(user_id, keyword):
+    # Ids of the user's transactions matching keyword, None unless the
+    # records are already cached and at most RECORD_SEARCH_MAX_IDS match.
+    # Rebuilding records after each write, or sending the database a long
+    # list of ids, costs more than the indexed query.
+    entry = record_cache.peek(user_id)
+    if entry is None:
+        return None
+    ids = entry.search(keyword)
+    if len(ids) > getattr(settings, 'RECORD_SEARCH_MAX_IDS', 500):
+        return None
+    return ids
+
+
+def invalidate(user_id):
+    # Forget the user's records in every process. The version changes
+    # again after commit, in case another process rebuilt the records
+    # from the data committed before this write.
+    if user_id is None:
+        return
+
+    def bump():
+        shared_cache().set(version_key(user_id), uuid.uuid4().hex, None)
+
+    record_cache.discard(user_id)
+    bump()
+    transaction.on_commit(bump)
@@ -0,0 +1,31 @@
+from rest_framework.renderers import JSONRenderer
+
+
+def to_columns(rows, dictionary_fields=()):
+    # Turn a list of objects into parallel arrays, dictionary encoding
+    # the given fields as a list of distinct values plus integer codes
+    columns = {}
+    fields = list(rows[0]) if rows else []
+    for field in fields:
+        values = [row.get(field) for row in rows]
+        if field in dictionary_fields:
+            dictionary = {}
+            codes = [dictionary.setdefault(value, len(dictionary))
+                     for value in values]
+            columns[field] = {'dictionary': list(dictionary), 'codes': codes}
+        else:
+            columns[field] = values
+    return {'count': len(rows), 'columns': columns}
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    # Render list responses as columns, selected with ?format=columnar
+    media_type = 'application/vnd.spending.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        view = (renderer_context or {}).get('view')
+        if isinstance(data, list) and getattr(view, 'action', None) == 'list':
+            data = to_columns(
+                data, getattr(view, 'columnar_dictionary_fields', ()))
+        return super().render(data, accepted_media_type, renderer_context)
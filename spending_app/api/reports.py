@@ -0,0 +1,121 @@
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import ExtractMonth
+
+from .models import Flow, Transaction
+
+PERCENTILES = (50, 90, 95)
+
+
+def load(user_id, year):
+    # Read a user's transactions of one year as columns instead of model
+    # instances: ids, months, amounts, flows and category codes, plus the
+    # category names the codes index
+    rows = list(Transaction.objects.filter(
+        user_id=user_id, date__year=year
+    ).annotate(month=ExtractMonth('date')).order_by().values_list(
+        'pk', 'month', 'ammount', 'flow', 'category__name'))
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return {'ids': empty, 'months': empty, 'amounts': empty,
+                'flows': empty, 'codes': empty, 'categories': []}
+    ids, months, amounts, flows, names = zip(*rows)
+    categories, codes = np.unique(np.array(names), return_inverse=True)
+    return {
+        'ids': np.array(ids, dtype=np.int64),
+        'months': np.array(months, dtype=np.int64),
+        'amounts': np.array(amounts, dtype=np.int64),
+        'flows': np.array(flows, dtype=np.int64),
+        'codes': codes.reshape(-1).astype(np.int64),
+        'categories': categories.tolist(),
+    }
+
+
+def group_slices(codes, size):
+    # Sort order grouping equal codes together and each group's bounds
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes,
+                                                        minlength=size))))
+    return order, bounds
+
+
+def compute(columns):
+    # Yearly statistics, monthly spikes and unusual transactions of one
+    # user, computed on whole columns at once
+    categories = columns['categories']
+    size = len(categories)
+    flows, amounts = columns['flows'], columns['amounts']
+    income = int(amounts[flows == Flow.INCOME].sum())
+
+    expenses = flows == Flow.EXPENSES
+    ids = columns['ids'][expenses]
+    amounts = amounts[expenses]
+    codes = columns['codes'][expenses]
+    months = columns['months'][expenses]
+    spent = int(amounts.sum())
+
+    monthly = np.zeros((size, 12), dtype=np.int64)
+    np.add.at(monthly, (codes, months - 1), amounts)
+
+    # Months where a category's spend is well above its monthly average
+    spike_z = getattr(settings, 'REPORT_SPIKE_Z', 2.0)
+    mean = monthly.mean(axis=1, keepdims=True)
+    std = monthly.std(axis=1, keepdims=True)
+    spikes = (std > 0) & (monthly > mean + spike_z * std)
+
+    # Percentiles and median absolute deviation per category
+    order, bounds = group_slices(codes, size)
+    stats = np.zeros((size, len(PERCENTILES)))
+    mad = np.zeros(size)
+    for code in range(size):
+        group = amounts[order[bounds[code]:bounds[code + 1]]]
+        if group.size:
+            stats[code] = np.percentile(group, PERCENTILES)
+            mad[code] = np.median(np.abs(group - stats[code, 0]))
+
+    # Robust z-score of each expense against its category
+    anomaly_z = getattr(settings, 'REPORT_ANOMALY_Z', 3.5)
+    scale = mad[codes]
+    scores = np.zeros(amounts.size)
+    np.divide(0.6745 * (amounts - stats[codes, 0]), scale, out=scores,
+              where=scale > 0)
+    unusual = np.flatnonzero(scores > anomaly_z)
+    unusual = unusual[np.argsort(-scores[unusual], kind='stable')]
+    unusual = unusual[:getattr(settings, 'REPORT_MAX_ANOMALIES', 50)]
+
+    counts = np.bincount(codes, minlength=size)
+    totals = monthly.sum(axis=1)
+    return {
+        'income': income,
+        'expenses': spent,
+        'net': income - spent,
+        'monthly_expenses': monthly.sum(axis=0).tolist(),
+        'categories': [
+            {
+                'category': categories[code],
+                'count': int(counts[code]),
+                'total': int(totals[code]),
+                'mean': round(float(totals[code] / counts[code]), 2),
+                'median': float(stats[code, 0]),
+                'p90': float(stats[code, 1]),
+                'p95': float(stats[code, 2]),
+                'monthly': monthly[code].tolist(),
+                'spike_months': (np.flatnonzero(spikes[code]) + 1).tolist(),
+            }
+            for code in np.argsort(-totals, kind='stable') if counts[code]
+        ],
+        'anomalies': [
+            {
+                'id': int(ids[index]),
+                'category': categories[codes[index]],
+                'month': int(months[index]),
+                'ammount': int(amounts[index]),
+                'score': round(float(scores[index]), 2),
+            }
+            for index in unusual
+        ],
+    }
+
+
+def yearly_report(user_id, year):
+    return {'year': year, **compute(load(user_id, year))}
@@ -1,6 +1,23 @@
 
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Transaction, Wallet, Tag
+from . import categorizer
+from .models import (Budget, Category, Flow, RecurringTransaction,
+                     Transaction, Wallet, Tag, transaction_fingerprint)
+
+
+class FlowField(serializers.ChoiceField):
+    # Accept and return flow names while storing the integer code
+    def __init__(self, **kwargs):
+        super().__init__(choices=Flow.labels, **kwargs)
+
+    def to_internal_value(self, data):
+        name = super().to_internal_value(data)
+        return Flow.values[Flow.labels.index(name)]
+
+    def to_representation(self, value):
+        return Flow(value).label
 
 
 class WalletSerializer(serializers.ModelSerializer):
@@ -15,20 +32,120 @@ class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
+        read_only_fields = ('id', 'usage_count')
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = '__all__'
         read_only_fields = ('id',)
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class CategoryNameSerializer(serializers.ModelSerializer):
+    # Base serializer for objects that refer to a category by its name
+    category = serializers.CharField(source='category.name', max_length=20)
+
+    def resolve_category(self, user, validated_data):
+        # Replace the category name with the user's Category row
+        if 'category' not in validated_data:
+            return
+        name = validated_data.pop('category')['name']
+        validated_data['category'] = None
+        if name is not None:
+            validated_data['category'], _ = Category.objects.get_or_create(
+                user=user, name=name)
+
+    def create(self, validated_data):
+        self.resolve_category(validated_data.get('user'), validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self.resolve_category(instance.user, validated_data)
+        return super().update(instance, validated_data)
+
+
+class TagIdsField(serializers.ManyRelatedField):
+    # Read tag ids from Transaction.tag_ids instead of the join table
+
+    def get_attribute(self, instance):
+        return instance.tag_ids
+
+    def to_representation(self, iterable):
+        return list(iterable)
+
+
+class TransactionSerializer(CategoryNameSerializer):
     # Serializer for trasaction objects
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
+    tags = TagIdsField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()),
+        required=False
     )
+    # Suggested from the note when left out, see fill_suggestions
+    category = serializers.CharField(
+        source='category.name', max_length=20, required=False)
+    flow = FlowField()
 
     class Meta:
         model = Transaction
-        fields = '__all__'
-        read_only_fields = ('id',)
+        exclude = ('fingerprint', 'tag_ids')
+        read_only_fields = ('id', 'recurring', 'is_duplicate')
+
+    def get_user_id(self):
+        if self.instance is not None:
+            return self.instance.user_id
+        return self.context['request'].user.pk
+
+    def validate(self, attrs):
+        if self.instance is None:
+            self.fill_suggestions(attrs)
+        self.check_duplicate(attrs)
+        return attrs
+
+    def fill_suggestions(self, attrs):
+        # Categorize new transactions sent without a category or tags from
+        # the user's earlier notes
+        if 'category' in attrs and 'tags' in self.initial_data:
+            return
+        category, tag_ids = categorizer.suggest(
+            self.get_user_id(), [attrs.get('note')])[0]
+        if 'category' not in attrs:
+            if category is None:
+                raise serializers.ValidationError(
+                    {'category': 'This field is required.'})
+            attrs['category'] = {'name': category}
+        if 'tags' not in self.initial_data:
+            attrs['tags'] = tag_ids
+
+    def check_duplicate(self, attrs):
+        # Reject or flag a transaction matching an existing one, depending
+        # on the DUPLICATE_TRANSACTIONS setting
+        mode = getattr(settings, 'DUPLICATE_TRANSACTIONS', 'flag')
+        if mode not in ('flag', 'reject'):
+            return
+        instance = self.instance
+        user_id = self.get_user_id()
+
+        def value(name):
+            return attrs[name] if name in attrs else \
+                getattr(instance, name, None)
+
+        fingerprint = transaction_fingerprint(
+            user_id, value('wallet').pk, value('date'), value('ammount'),
+            value('note'))
+        duplicates = Transaction.objects.filter(fingerprint=fingerprint)
+        if instance is not None:
+            duplicates = duplicates.exclude(pk=instance.pk)
+        duplicate = duplicates.values_list('pk', flat=True).first()
+        if duplicate is not None:
+            if mode == 'reject':
+                raise serializers.ValidationError(
+                    f'Duplicate of transaction {duplicate}')
+            attrs['is_duplicate'] = True
+        elif getattr(instance, 'is_duplicate', False):
+            # Edited away from its duplicate, it is no longer flagged
+            attrs['is_duplicate'] = False
 
 
 class TransactionDetailSerializer(TransactionSerializer):
@@ -43,3 +160,89 @@ class TransactionImageSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+
+class RecurringTransactionSerializer(CategoryNameSerializer):
+    # Serializer for recurring transaction rules
+    tags = serializers.PrimaryKeyRelatedField(
+        many=True,
+        queryset=Tag.objects.all(),
+        required=False
+    )
+    flow = FlowField()
+
+    class Meta:
+        model = RecurringTransaction
+        fields = '__all__'
+        read_only_fields = ('id', 'user', 'occurrence_count', 'next_run')
+
+    # Changing these moves the upcoming occurrences
+    schedule_fields = ('start_date', 'frequency', 'interval')
+
+    def validate(self, attrs):
+        def value(name):
+            return attrs[name] if name in attrs else \
+                getattr(self.instance, name, None)
+
+        start_date, end_date = value('start_date'), value('end_date')
+        if start_date and end_date and end_date < start_date:
+            raise serializers.ValidationError(
+                {'end_date': 'Must not be before the start date.'})
+        return attrs
+
+    def create(self, validated_data):
+        validated_data['next_run'] = validated_data['start_date']
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        rescheduled = any(
+            name in validated_data and
+            validated_data[name] != getattr(instance, name)
+            for name in self.schedule_fields)
+        rule = super().update(instance, validated_data)
+        if rescheduled:
+            rule.reschedule()
+            rule.save(update_fields=['occurrence_count', 'next_run'])
+        return rule
+
+
+class BudgetSerializer(CategoryNameSerializer):
+    # Serializer for budgets and their spend in the current period
+    category = serializers.CharField(
+        source='category.name', max_length=20, required=False,
+        allow_null=True)
+    remaining = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Budget
+        fields = '__all__'
+        read_only_fields = ('id', 'user', 'spent', 'period_start',
+                            'period_end')
+
+    def get_remaining(self, budget):
+        return budget.limit - budget.spent
+
+    def validate(self, attrs):
+        # A budget tracks either a category or a tag
+        if 'category' in attrs:
+            category = attrs['category']['name']
+        else:
+            category = getattr(self.instance, 'category', None)
+        tag = attrs.get('tag', getattr(self.instance, 'tag', None))
+        if (category is None) == (tag is None):
+            raise serializers.ValidationError(
+                'Set either a category or a tag.')
+        return attrs
+
+    def create(self, validated_data):
+        self.resolve_category(validated_data.get('user'), validated_data)
+        budget = Budget(**validated_data)
+        budget.start_period(timezone.now().date())
+        budget.save()
+        return budget
+
+    def update(self, instance, validated_data):
+        budget = super().update(instance, validated_data)
+        budget.start_period(timezone.now().date())
+        budget.save()
+        return budget
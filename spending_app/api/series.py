@@ -0,0 +1,85 @@
+from django.db import connections, router
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_datetime
+
+from .models import Flow, Transaction
+
+INTERVALS = ('day', 'week', 'month')
+
+# Running balance per wallet over the per-bucket net flow, computed by
+# the database with a window function over the grouped query
+RUNNING_BALANCE_SQL = (
+    'SELECT buckets.wallet_id, buckets.bucket, '
+    'SUM(buckets.delta) OVER ('
+    'PARTITION BY buckets.wallet_id ORDER BY buckets.bucket) '
+    'FROM ({}) buckets ORDER BY buckets.bucket'
+)
+
+
+def downsample(length, points):
+    # Evenly spaced indexes into a series, always keeping the last one
+    if length <= points:
+        return list(range(length))
+    if points == 1:
+        return [length - 1]
+    return [round(i * (length - 1) / (points - 1)) for i in range(points)]
+
+
+def running_balances(wallet_ids, interval):
+    # Return [(wallet_id, bucket, running net flow)] ordered by bucket
+    signed = Case(
+        When(flow=Flow.INCOME, then=F('ammount')),
+        default=-F('ammount'),
+        output_field=IntegerField(),
+    )
+    buckets = Transaction.objects.filter(wallet_id__in=wallet_ids)\
+        .annotate(bucket=Trunc('date', interval))\
+        .order_by().values('wallet_id', 'bucket')\
+        .annotate(delta=Sum(signed))
+    sql, params = buckets.query.sql_with_params()
+    database = router.db_for_read(Transaction)
+    with connections[database].cursor() as cursor:
+        cursor.execute(RUNNING_BALANCE_SQL.format(sql), params)
+        rows = cursor.fetchall()
+    return [
+        (wallet_id, parse_datetime(bucket) if isinstance(bucket, str)
+         else bucket, balance)
+        for wallet_id, bucket, balance in rows
+    ]
+
+
+def balance_series(wallets, interval, points):
+    # Balance of every wallet and of all of them at the end of each bucket,
+    # starting from the wallet balance and downsampled to `points` buckets
+    opening = {wallet.pk: wallet.balance for wallet in wallets}
+    rows = running_balances(list(opening), interval)
+
+    buckets = sorted({bucket for _, bucket, _ in rows})
+    position = {bucket: index for index, bucket in enumerate(buckets)}
+    series = {wallet_id: [None] * len(buckets) for wallet_id in opening}
+    for wallet_id, bucket, balance in rows:
+        series[wallet_id][position[bucket]] = opening[wallet_id] + balance
+    for wallet_id, balances in series.items():
+        # carry the balance forward through buckets without transactions
+        last = opening[wallet_id]
+        for index, balance in enumerate(balances):
+            last = balances[index] = last if balance is None else balance
+
+    keep = downsample(len(buckets), points)
+    return {
+        'interval': interval,
+        'dates': [buckets[index] for index in keep],
+        'wallets': [
+            {
+                'id': wallet.pk,
+                'name': wallet.name,
+                'balances': [series[wallet.pk][index] for index in keep],
+            }
+            for wallet in wallets
+        ],
+        'total': [
+            sum(series[wallet_id][index] for wallet_id in series)
+            for index in keep
+        ],
+    }
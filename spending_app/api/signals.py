@@ -0,0 +1,182 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import categorizer, dashboard, records
+from .models import (Budget, Category, Flow, Tag, Transaction, Wallet,
+                     as_day)
+
+
+@receiver(m2m_changed, sender=Transaction.tags.through)
+def update_tag_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    # Keep Tag.usage_count in sync when transactions gain or lose tags
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Tag.objects.refresh_usage([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_tag_ids = list(
+            instance.tags.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        Tag.objects.refresh_usage(instance._cleared_tag_ids)
+    elif action in ('post_add', 'post_remove'):
+        Tag.objects.refresh_usage(pk_set)
+
+
+@receiver(m2m_changed, sender=Transaction.tags.through)
+def update_tag_ids(sender, instance, action, reverse, pk_set, **kwargs):
+    # Keep Transaction.tag_ids in sync with the tags join table
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.tag_ids = Transaction.objects.refresh_tag_ids(
+                [instance.pk])[instance.pk]
+    elif action == 'pre_clear':
+        instance._cleared_transaction_ids = list(
+            instance.transaction_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        Transaction.objects.refresh_tag_ids(
+            instance._cleared_transaction_ids)
+    elif action in ('post_add', 'post_remove'):
+        Transaction.objects.refresh_tag_ids(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_transactions(sender, instance, **kwargs):
+    instance._deleted_transaction_ids = list(
+        instance.transaction_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def update_deleted_tag_transactions(sender, instance, **kwargs):
+    # Deleting a tag removes its join rows without m2m_changed
+    Transaction.objects.refresh_tag_ids(
+        getattr(instance, '_deleted_transaction_ids', []))
+
+
+@receiver(pre_delete, sender=Transaction)
+def remember_deleted_transaction_tags(sender, instance, **kwargs):
+    instance._deleted_tag_ids = list(
+        instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Transaction)
+def update_deleted_transaction_tag_usage(sender, instance, **kwargs):
+    Tag.objects.refresh_usage(getattr(instance, '_deleted_tag_ids', []))
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_spend(sender, instance, **kwargs):
+    instance._previous_spend = None
+    if instance.pk:
+        instance._previous_spend = Transaction.objects.filter(
+            pk=instance.pk).values(
+                'flow', 'category_id', 'date', 'ammount').first()
+
+
+@receiver(post_save, sender=Transaction)
+def update_budgets_on_save(sender, instance, created, **kwargs):
+    # Move the transaction's old amount out of budgets and the new one in
+    tag_ids = [] if created else list(
+        instance.tags.values_list('pk', flat=True))
+    previous = getattr(instance, '_previous_spend', None)
+    if previous and previous['flow'] == Flow.EXPENSES:
+        Budget.objects.apply_spend(
+            instance.user_id, as_day(previous['date']), -previous['ammount'],
+            previous['category_id'], tag_ids)
+    if instance.flow == Flow.EXPENSES:
+        Budget.objects.apply_spend(
+            instance.user_id, as_day(instance.date), instance.ammount,
+            instance.category_id, tag_ids)
+
+
+@receiver(m2m_changed, sender=Transaction.tags.through)
+def update_budgets_on_tag_change(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    if reverse:
+        # A tag gained or lost transactions, recount its budgets
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            for budget in Budget.objects.filter(tag=instance):
+                budget.start_period(budget.period_start)
+                budget.save(update_fields=['spent'])
+        return
+    if instance.flow != Flow.EXPENSES:
+        return
+    if action == 'pre_clear':
+        instance._budget_cleared_tag_ids = list(
+            instance.tags.values_list('pk', flat=True))
+        return
+    if action == 'post_add':
+        amount, tag_ids = instance.ammount, pk_set
+    elif action == 'post_remove':
+        amount, tag_ids = -instance.ammount, pk_set
+    elif action == 'post_clear':
+        amount, tag_ids = -instance.ammount, \
+            instance._budget_cleared_tag_ids
+    else:
+        return
+    Budget.objects.apply_spend(
+        instance.user_id, as_day(instance.date), amount, tag_ids=tag_ids)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_budgets_on_delete(sender, instance, **kwargs):
+    if instance.flow == Flow.EXPENSES:
+        Budget.objects.apply_spend(
+            instance.user_id, as_day(instance.date), -instance.ammount,
+            instance.category_id, getattr(instance, '_deleted_tag_ids', []))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def refresh_dashboard(sender, instance, **kwargs):
+    dashboard.schedule(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Transaction.tags.through)
+def refresh_dashboard_on_tag_change(sender, instance, action, reverse,
+                                    **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        dashboard.schedule(instance.user_id)
+
+
+@receiver(post_save, sender=Transaction)
+def update_categorizer(sender, instance, created, **kwargs):
+    # New transactions extend the cached model, changed ones rebuild it
+    if created:
+        categorizer.learn(instance)
+    else:
+        categorizer.model_cache.discard(instance.user_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def discard_categorizer(sender, instance, **kwargs):
+    categorizer.model_cache.discard(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Transaction.tags.through)
+def update_categorizer_tags(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    if reverse:
+        return
+    if action == 'post_add':
+        categorizer.learn_tags(instance, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        categorizer.model_cache.discard(instance.user_id)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_records(sender, instance, **kwargs):
+    # Cached records hold category and tag names besides the transactions
+    records.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Transaction.tags.through)
+def invalidate_records_on_tag_change(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        records.invalidate(instance.user_id)
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+import traceback
+from functools import partial
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+from django.db.utils import DatabaseError
+
+logger = logging.getLogger('api.slow_queries')
+
+_local = threading.local()
+
+re_placeholder_list = re.compile(r'\bIN \(\s*%s(?:\s*,\s*%s)*\s*\)')
+re_whitespace = re.compile(r'\s+')
+
+
+def threshold():
+    # Milliseconds, None disables recording
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+
+
+def normalize(sql):
+    # Queries differing only in the length of an IN list share a shape
+    sql = re_placeholder_list.sub('IN (%s, ...)', sql)
+    return re_whitespace.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()
+
+
+def project_stack():
+    # Frames from our own code, outermost first, skipping this module
+    root = str(settings.BASE_DIR)
+    frames = []
+    for frame in traceback.extract_stack()[:-1]:
+        if not frame.filename.startswith(root) or \
+                frame.filename == __file__:
+            continue
+        path = frame.filename[len(root) + 1:]
+        frames.append(f'{path}:{frame.lineno} in {frame.name}')
+    return frames
+
+
+def explain(connection, sql, params):
+    # EXPLAIN ANALYZE runs the statement again, so only reads are sampled
+    if connection.vendor != 'postgresql':
+        return ''
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    rate = getattr(settings, 'SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0)
+    if random.random() >= rate:
+        return ''
+    # In a savepoint, so a failing EXPLAIN leaves the caller's transaction
+    # usable on PostgreSQL
+    with transaction.atomic(using=connection.alias), \
+            connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def record(connection, sql, params, duration):
+    from .models import SlowQuery
+
+    stack = project_stack()
+    origin = stack[-1] if stack else ''
+    try:
+        plan = explain(connection, sql, params)
+    except DatabaseError:
+        plan = ''
+    logger.warning('slow query', extra={'data': {
+        'duration_ms': round(duration, 2),
+        'database': connection.alias,
+        'sql': sql,
+        'origin': origin,
+        'stack': stack,
+        'explain': plan,
+    }})
+
+    # Stored once the caller's transaction commits, so the row is not
+    # written in, or rolled back with, the transaction of the request
+    database = router.db_for_write(SlowQuery)
+    transaction.on_commit(partial(
+        save, sql, origin, stack, duration, plan), using=database)
+
+
+def save(sql, origin, stack, duration, plan):
+    from .models import SlowQuery
+
+    _local.recording = True
+    try:
+        key = fingerprint(sql)
+        changes = {
+            'origin': origin[:255],
+            'stack': '\n'.join(stack),
+            'calls': F('calls') + 1,
+            'total_time': F('total_time') + duration,
+            'max_time': Greatest('max_time', Value(duration, FloatField())),
+        }
+        if plan:
+            changes['explain'] = plan
+        updated = SlowQuery.objects.filter(fingerprint=key).update(**changes)
+        if not updated:
+            SlowQuery.objects.get_or_create(fingerprint=key, defaults={
+                'sql': normalize(sql),
+                'origin': origin[:255],
+                'stack': '\n'.join(stack),
+                'calls': 1,
+                'total_time': duration,
+                'max_time': duration,
+                'explain': plan,
+            })
+    except Exception:
+        logger.exception('Could not record slow query')
+    finally:
+        _local.recording = False
+
+
+def recorder(execute, sql, params, many, context):
+    # Execute wrapper timing each statement. Statements issued while
+    # recording, the EXPLAIN and the SlowQuery writes, are not timed.
+    limit = threshold()
+    if limit is None or getattr(_local, 'recording', False):
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = (time.perf_counter() - start) * 1000
+    if duration >= limit:
+        _local.recording = True
+        try:
+            record(context['connection'], sql, params, duration)
+        except Exception:
+            logger.exception('Could not record slow query')
+        finally:
+            _local.recording = False
+    return result
+
+
+def install(connection, **kwargs):
+    if threshold() is not None and recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.append(recorder)
+
+
+def setup():
+    # Wrap every database connection opened from now on
+    connection_created.connect(install)
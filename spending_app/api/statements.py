@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import date
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Flow, Transaction, add_months
+
+FORMATS = ('csv', 'json')
+COLUMNS = ('id', 'date', 'flow', 'category', 'wallet', 'currency', 'ammount',
+           'note')
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 2000
+
+
+def parse_month(value):
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
+
+
+def statement_name(user_id, month, extension):
+    return f'statements/{month:%Y-%m}/{user_id}.{extension}'
+
+
+def rows(user_id, month):
+    # Stream the month's transactions of a user. iterator() reads through
+    # a server-side cursor on PostgreSQL instead of loading every row.
+    queryset = Transaction.objects.filter(
+        user_id=user_id, date__gte=month, date__lt=add_months(month, 1)
+    ).order_by('date', 'pk').values_list(
+        'pk', 'date', 'flow', 'category__name', 'wallet__name',
+        'wallet__currency', 'ammount', 'note')
+    for row in queryset.iterator(chunk_size=FETCH_SIZE):
+        yield dict(zip(COLUMNS, row), flow=Flow(row[2]).label)
+
+
+class CSVWriter:
+
+    def __init__(self, stream, user_id, month):
+        self.writer = csv.DictWriter(stream, COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self, totals):
+        pass
+
+
+class JSONWriter:
+    # Writes the object piece by piece so rows are never all in memory
+
+    def __init__(self, stream, user_id, month):
+        self.stream = stream
+        self.first = True
+        stream.write(f'{{"user": {user_id}, "month": "{month:%Y-%m}", '
+                     f'"transactions": [')
+
+    def write(self, row):
+        if not self.first:
+            self.stream.write(', ')
+        self.first = False
+        json.dump(row, self.stream, cls=DjangoJSONEncoder)
+
+    def close(self, totals):
+        self.stream.write('], "totals": ')
+        json.dump(totals, self.stream)
+        self.stream.write('}')
+
+
+WRITERS = {'csv': CSVWriter, 'json': JSONWriter}
+
+
+def write_statement(user_id, month, formats=FORMATS):
+    # Write the user's statement of the month to media storage in each
+    # format and return the number of transactions in it
+    files = {extension: tempfile.TemporaryFile() for extension in formats}
+    try:
+        streams = {extension: io.TextIOWrapper(file, encoding='utf-8',
+                                               newline='')
+                   for extension, file in files.items()}
+        writers = [WRITERS[extension](stream, user_id, month)
+                   for extension, stream in streams.items()]
+        totals = {'income': 0, 'expenses': 0, 'count': 0}
+        for row in rows(user_id, month):
+            totals['income' if row['flow'] == Flow.INCOME.label
+                   else 'expenses'] += row['ammount']
+            totals['count'] += 1
+            for writer in writers:
+                writer.write(row)
+        for writer in writers:
+            writer.close(totals)
+
+        for extension, stream in streams.items():
+            stream.flush()
+            stream.detach()
+            files[extension].seek(0)
+            name = statement_name(user_id, month, extension)
+            # Reruns replace the previous file instead of adding a suffix
+            default_storage.delete(name)
+            default_storage.save(name, File(files[extension]))
+        return totals['count']
+    finally:
+        for file in files.values():
+            file.close()
@@ -0,0 +1,139 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Avg, Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Task, TaskStatus
+
+
+def task(func):
+    # Mark func as a task that can be queued with func.delay(...)
+    func.is_task = True
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    func.delay = lambda *args, **kwargs: enqueue(func, *args, **kwargs)
+    return func
+
+
+def enqueue(func, *args, run_at=None, **kwargs):
+    # Queue a call of a task function, or run it now when TASKS_EAGER is set
+    if getattr(settings, 'TASKS_EAGER', False):
+        func(*args, **kwargs)
+        return None
+    return Task.objects.create(
+        name=func.task_name, args=list(args), kwargs=kwargs,
+        run_at=run_at or timezone.now())
+
+
+def lease_expiry(now):
+    return now + timedelta(seconds=getattr(settings, 'TASK_LEASE', 60))
+
+
+def claim(limit):
+    # Mark up to limit due tasks as running and return them. Rows locked by
+    # another worker are skipped, so several workers never share a task.
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(Task.objects.select_for_update(skip_locked=True).filter(
+            status=TaskStatus.PENDING, run_at__lte=now
+        ).order_by('run_at').values_list('pk', flat=True)[:limit])
+        Task.objects.filter(pk__in=ids).update(
+            status=TaskStatus.RUNNING, started=now,
+            lease_expires=lease_expiry(now), attempts=F('attempts') + 1)
+    return ids
+
+
+def renew(task_ids):
+    # Extend the leases of the tasks a live worker is still running
+    return Task.objects.filter(
+        pk__in=task_ids, status=TaskStatus.RUNNING
+    ).update(lease_expires=lease_expiry(timezone.now()))
+
+
+def retry_delay(attempts):
+    # Exponential backoff: base, 2 * base, 4 * base, ... up to the maximum
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 5)
+    maximum = getattr(settings, 'TASK_RETRY_MAX_DELAY', 3600)
+    return min(base * 2 ** (attempts - 1), maximum)
+
+
+def run(task_id):
+    # Run one claimed task and record its outcome
+    task = Task.objects.get(pk=task_id)
+    metrics.observe('tasks.wait', (task.started - task.created)
+                    .total_seconds())
+    started = time.monotonic()
+    try:
+        func = import_string(task.name)
+        if not getattr(func, 'is_task', False):
+            raise ValueError(f'{task.name} is not a task')
+        func(*task.args, **task.kwargs)
+    except Exception:
+        task.last_error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            task.status = TaskStatus.FAILED
+            task.finished = timezone.now()
+            metrics.incr('tasks.failed')
+        else:
+            task.status = TaskStatus.PENDING
+            task.run_at = timezone.now() + timedelta(
+                seconds=retry_delay(task.attempts))
+            metrics.incr('tasks.retried')
+    else:
+        task.status = TaskStatus.DONE
+        task.finished = timezone.now()
+        metrics.incr('tasks.done')
+    metrics.observe('tasks.duration', time.monotonic() - started)
+    # Only while still holding the task, it may have been requeued after
+    # the lease ran out
+    Task.objects.filter(
+        pk=task.pk, status=TaskStatus.RUNNING, started=task.started
+    ).update(status=task.status, run_at=task.run_at, finished=task.finished,
+             last_error=task.last_error, lease_expires=None)
+    return task.status
+
+
+def run_pending(limit=100):
+    # Run due tasks in the calling thread, used by tests and cron jobs
+    return [run(task_id) for task_id in claim(limit)]
+
+
+def requeue_stale():
+    # Put tasks back in the queue whose worker died while running them,
+    # live workers keep renewing the leases of theirs
+    return Task.objects.filter(
+        status=TaskStatus.RUNNING, lease_expires__lt=timezone.now()
+    ).update(status=TaskStatus.PENDING, lease_expires=None)
+
+
+def queue_stats():
+    # Queue depth and latency, read from the table so all workers count
+    now = timezone.now()
+    pending = Task.objects.filter(status=TaskStatus.PENDING)
+    oldest = pending.filter(run_at__lte=now).aggregate(
+        oldest=Min('run_at'))['oldest']
+    latency = Task.objects.filter(
+        started__gte=now - timedelta(hours=1)
+    ).aggregate(latency=Avg(F('started') - F('created')))['latency']
+    by_status = dict(Task.objects.values_list('status')
+                     .annotate(count=Count('pk')).order_by())
+    return {
+        'depth': by_status.get(TaskStatus.PENDING, 0),
+        'by_status': by_status,
+        'oldest_due_seconds': (now - oldest).total_seconds()
+        if oldest else 0,
+        'avg_latency_seconds': latency.total_seconds() if latency else 0,
+    }
+
+
+@task
+def delete_media_files(names):
+    # Remove files that are no longer referenced from media storage
+    for name in names:
+        default_storage.delete(name)
@@ -1,6 +1,13 @@
+from datetime import date, datetime
+from unittest.mock import patch
+
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from api.admin import EstimatedCountPaginator
+from api.models import Budget, Category, Flow, Transaction, Wallet
 
 User = get_user_model()
 
@@ -39,3 +46,96 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:api_user_add')
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+
+
+class TransactionAdminTests(TestCase):
+    # Test the admin pages of the large tables
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_superuser(
+            email='johndoe@email.com',
+            password='password123'
+        )
+        self.client.force_login(self.admin_user)
+        wallet = Wallet.objects.create(
+            user=self.admin_user, name='cash', currency='EUR')
+        category = Category.objects.create(user=self.admin_user, name='food')
+        for _ in range(5):
+            Transaction.objects.create(
+                user=self.admin_user, wallet=wallet, category=category,
+                flow=Flow.EXPENSES, ammount=10, date=datetime.now())
+
+    def test_transactions_listed(self):
+        # Test related rows are joined instead of fetched per row
+        url = reverse('admin:api_transaction_changelist')
+        with self.assertNumQueries(6):
+            res = self.client.get(url)
+        self.assertContains(res, 'cash')
+        self.assertContains(res, 'food')
+
+    def test_transaction_change_page(self):
+        # Test the edit page does not render every related row
+        transaction = Transaction.objects.first()
+        url = reverse('admin:api_transaction_change', args=[transaction.id])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'vForeignKeyRawIdAdminField')
+
+    def test_transactions_searched_by_email(self):
+        # Test searching transactions by the exact user email
+        url = reverse('admin:api_transaction_changelist')
+        res = self.client.get(url, {'q': 'nobody@email.com'})
+        self.assertContains(res, '0 results')
+
+    def test_wallet_and_tag_pages(self):
+        # Test the wallet and tag changelists work
+        for name in ('wallet', 'tag'):
+            res = self.client.get(reverse(f'admin:api_{name}_changelist'))
+            self.assertEqual(res.status_code, 200)
+
+    def test_other_changelists(self):
+        # Test the other changelists work
+        for name in ('category', 'recurringtransaction', 'budget',
+                     'exchangerate', 'idempotencykey', 'task'):
+            res = self.client.get(reverse(f'admin:api_{name}_changelist'))
+            self.assertEqual(res.status_code, 200)
+
+    def test_budgets_listed(self):
+        # Test budget rows do not each fetch their category
+        url = reverse('admin:api_budget_changelist')
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            return len(queries)
+
+        for name in ('rent', 'fun', 'car'):
+            budget = Budget(
+                user=self.admin_user, limit=100,
+                category=Category.objects.create(
+                    user=self.admin_user, name=name))
+            budget.start_period(date.today())
+            budget.save()
+            if name == 'rent':
+                single = count_queries()
+        self.assertEqual(count_queries(), single)
+
+    def test_audit_log_read_only(self):
+        # Test audit entries can be listed but not changed
+        res = self.client.get(reverse('admin:api_auditlog_changelist'))
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get(reverse('admin:api_auditlog_add'))
+        self.assertEqual(res.status_code, 403)
+
+    def test_paginator_estimate(self):
+        # Test unfiltered lists use the estimate of large tables only
+        queryset = Transaction.objects.order_by('pk')
+        with patch('api.admin.estimated_count', return_value=10 ** 6):
+            self.assertEqual(
+                EstimatedCountPaginator(queryset, 50).count, 10 ** 6)
+            self.assertEqual(EstimatedCountPaginator(
+                queryset.filter(flow=Flow.EXPENSES), 50).count, 5)
+        with patch('api.admin.estimated_count', return_value=100):
+            self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 5)
+        self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 5)
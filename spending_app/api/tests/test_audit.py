@@ -0,0 +1,154 @@
+import threading
+from datetime import datetime
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import audit, metrics
+from api.models import AuditLog, Category, Transaction, Wallet
+
+User = get_user_model()
+
+TRANSACTIONS_URL = reverse('api:transaction-list')
+
+
+def transaction_detail_url(transaction_id):
+    return reverse('api:transaction-detail', args=[transaction_id])
+
+
+class AuditLogTests(TestCase):
+    # Test audit entries of api writes
+
+    def setUp(self):
+        audit.buffer.take(10 ** 6)
+        metrics.reset()
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR')
+        self.category = Category.objects.create(user=self.user, name='food')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_writes_audited(self):
+        # Test creating, updating and deleting a transaction is audited
+        payload = {'flow': 'expenses', 'category': 'food',
+                   'wallet': self.wallet.id, 'ammount': 10,
+                   'date': datetime.now()}
+        response = self.client.post(TRANSACTIONS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = transaction_detail_url(response.data['id'])
+        self.client.patch(url, {'ammount': 20})
+        self.client.delete(url)
+
+        self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(audit.flush(), 3)
+
+        entries = AuditLog.objects.order_by('id')
+        self.assertEqual([e.action for e in entries],
+                         ['create', 'update', 'delete'])
+        self.assertTrue(all(e.user_id == self.user.id for e in entries))
+        self.assertTrue(all(e.model == 'api.Transaction' for e in entries))
+        self.assertEqual(entries[0].object_id, response.data['id'])
+        self.assertEqual(entries[0].changes['wallet'], self.wallet.id)
+        self.assertEqual(entries[1].changes, {'ammount': 20})
+        self.assertEqual(entries[2].object_id, response.data['id'])
+
+    def test_wallet_delete_audited(self):
+        # Test the batched wallet deletion is audited
+        self.client.delete(reverse('api:wallet-detail', args=[self.wallet.id]))
+        audit.flush()
+        entry = AuditLog.objects.get()
+        self.assertEqual((entry.action, entry.model, entry.object_id),
+                         ('delete', 'api.Wallet', self.wallet.id))
+
+    def test_account_delete_audited(self):
+        # Test deleting the account is audited
+        user_id = self.user.id
+        self.client.delete(reverse('user:profile'))
+        audit.flush()
+        entry = AuditLog.objects.get()
+        self.assertEqual(
+            (entry.action, entry.model, entry.object_id, entry.user_id),
+            ('delete', User._meta.label, user_id, user_id))
+
+    def test_entries_kept_after_user_deleted(self):
+        # Test entries do not reference the user row
+        audit.record('create', Transaction, 1, self.user)
+        audit.flush()
+        user_id = self.user.id
+        self.user.delete()
+        self.assertEqual(AuditLog.objects.get().user_id, user_id)
+
+    @override_settings(AUDIT_BUFFER_SIZE=2, AUDIT_BACKPRESSURE_TIMEOUT=0)
+    def test_full_buffer_drops(self):
+        # Test entries are dropped and counted when the buffer is full
+        results = [audit.record('create', Transaction, i, self.user)
+                   for i in range(3)]
+        self.assertEqual(results, [True, True, False])
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['audit.dropped'], 1)
+        self.assertEqual(counters['audit.backpressure'], 1)
+
+    @override_settings(AUDIT_BUFFER_SIZE=1, AUDIT_BACKPRESSURE_TIMEOUT=5)
+    def test_full_buffer_waits_for_flush(self):
+        # Test a full buffer makes writers wait for room
+        audit.record('create', Transaction, 1, self.user)
+        timer = threading.Timer(0.05, audit.buffer.take, [1])
+        timer.start()
+        self.assertTrue(audit.record('create', Transaction, 2, self.user))
+        timer.join()
+        self.assertNotIn('audit.dropped', metrics.snapshot()['counters'])
+
+    def test_failed_write_counted(self):
+        # Test a failing batch is logged and counted instead of raised
+        audit.record('create', Transaction, 1, self.user)
+        with patch.object(audit.buffer, 'write', side_effect=ValueError):
+            self.assertEqual(audit.flush(), 0)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['audit.flush_errors'], 1)
+        self.assertEqual(counters['audit.dropped'], 1)
+
+    @override_settings(AUDIT_FLUSH_INTERVAL=0.01)
+    def test_background_flusher(self):
+        # Test the flusher thread writes buffered entries
+        written = []
+        flushed = threading.Event()
+        buffer = audit.AuditBuffer()
+
+        def write(batch):
+            written.extend(batch)
+            flushed.set()
+
+        with patch.object(buffer, 'write', write), \
+                patch('atexit.register') as register:
+            buffer.start()
+            buffer.put({'object_id': 1})
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(written, [{'object_id': 1}])
+        register.assert_called_once_with(buffer.flush)
+
+    @override_settings(AUDIT_FLUSH_INTERVAL=0.01)
+    def test_flusher_restarted_after_fork(self):
+        # Test a forked child runs a flusher of its own for its own entries
+        written = []
+        flushed = threading.Event()
+        buffer = audit.AuditBuffer()
+
+        def write(batch):
+            written.extend(batch)
+            flushed.set()
+
+        # What a child inherits, a started buffer without a live thread
+        buffer.started = True
+        buffer.thread = threading.Thread(target=buffer.run)
+        buffer.put({'object_id': 1})
+        with patch.object(buffer, 'write', write):
+            buffer.after_fork()
+            self.assertTrue(buffer.thread.is_alive())
+            buffer.put({'object_id': 2})
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(written, [{'object_id': 2}])
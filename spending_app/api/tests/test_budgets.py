@@ -0,0 +1,160 @@
+from datetime import date, datetime, timedelta
+
+from django.db.models.signals import m2m_changed
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import signals
+from api.models import (Budget, Category, Flow, Period, Tag, Transaction,
+                        Wallet, period_bounds)
+
+User = get_user_model()
+BUDGET_URL = reverse('api:budget-list')
+
+
+class BudgetTests(TestCase):
+    # Test budgets and their incrementally maintained spend
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='testwallet', currency='EUR', balance=100)
+        self.food = Category.objects.create(user=self.user, name='food')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, ammount, category=None, **params):
+        defaults = {
+            'user': self.user,
+            'flow': Flow.EXPENSES,
+            'date': datetime.now(),
+            'wallet': self.wallet,
+            'category': category or self.food,
+            'ammount': ammount,
+        }
+        defaults.update(params)
+        return Transaction.objects.create(**defaults)
+
+    def test_period_bounds(self):
+        # Test periods start on monday, the 1st and january 1st
+        day = date(2021, 9, 15)
+        self.assertEqual(period_bounds(Period.WEEKLY, day),
+                         (date(2021, 9, 13), date(2021, 9, 20)))
+        self.assertEqual(period_bounds(Period.MONTHLY, day),
+                         (date(2021, 9, 1), date(2021, 10, 1)))
+        self.assertEqual(period_bounds(Period.YEARLY, day),
+                         (date(2021, 1, 1), date(2022, 1, 1)))
+
+    def test_create_budget_counts_current_period(self):
+        # Test a new budget starts from the expenses already in its period
+        self.create_transaction(30)
+        self.create_transaction(500, date=datetime.now() - timedelta(days=400))
+        self.create_transaction(1000, flow=Flow.INCOME)
+
+        response = self.client.post(
+            BUDGET_URL, {'category': 'food', 'limit': 100})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['spent'], 30)
+        self.assertEqual(response.data['remaining'], 70)
+
+    def test_budget_requires_category_or_tag(self):
+        # Test a budget must track exactly one category or tag
+        tag = Tag.objects.create(user=self.user, name='trip')
+        response = self.client.post(BUDGET_URL, {'limit': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            BUDGET_URL, {'category': 'food', 'tag': tag.id, 'limit': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_spend_follows_transaction_writes(self):
+        # Test creating, editing and deleting expenses updates the budget
+        budget = Budget(user=self.user, category=self.food, limit=100)
+        budget.start_period(date.today())
+        budget.save()
+
+        transaction = self.create_transaction(40)
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 40)
+
+        transaction.ammount = 25
+        transaction.save()
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 25)
+
+        transaction.category = Category.objects.create(
+            user=self.user, name='car')
+        transaction.save()
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 0)
+
+        self.create_transaction(10).delete()
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 0)
+
+    def test_tag_budget_follows_tag_changes(self):
+        # Test tagging and untagging expenses updates tag budgets
+        tag = Tag.objects.create(user=self.user, name='trip')
+        budget = Budget(user=self.user, tag=tag, limit=100)
+        budget.start_period(date.today())
+        budget.save()
+        transaction = self.create_transaction(15)
+
+        transaction.tags.add(tag)
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 15)
+
+        transaction.tags.clear()
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 0)
+
+    def test_tag_budget_clear_without_usage_receiver(self):
+        # Test clearing tags updates budgets on its own, without the tag
+        # usage receiver
+        tag = Tag.objects.create(user=self.user, name='trip')
+        budget = Budget(user=self.user, tag=tag, limit=100)
+        budget.start_period(date.today())
+        budget.save()
+        transaction = self.create_transaction(15)
+        transaction.tags.add(tag)
+
+        m2m_changed.disconnect(signals.update_tag_usage,
+                               sender=Transaction.tags.through)
+        self.addCleanup(m2m_changed.connect, signals.update_tag_usage,
+                        sender=Transaction.tags.through)
+        transaction.tags.clear()
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 0)
+
+    def test_list_rolls_over_finished_periods(self):
+        # Test listing moves ended budgets into the current period
+        self.create_transaction(20)
+        budget = Budget.objects.create(
+            user=self.user, category=self.food, limit=100, spent=90,
+            period_start=date(2020, 1, 1), period_end=date(2020, 2, 1))
+
+        response = self.client.get(BUDGET_URL)
+
+        budget.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['spent'], 20)
+        self.assertEqual(budget.period_start, date.today().replace(day=1))
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_retrieve_rolls_over_on_primary(self):
+        # Test a single budget is rolled over and read back from the primary
+        self.create_transaction(20)
+        budget = Budget.objects.create(
+            user=self.user, category=self.food, limit=100, spent=90,
+            period_start=date(2020, 1, 1), period_end=date(2020, 2, 1))
+
+        response = self.client.get(
+            reverse('api:budget-detail', args=[budget.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['spent'], 20)
+        self.assertEqual(response.data['period_start'],
+                         date.today().replace(day=1).isoformat())
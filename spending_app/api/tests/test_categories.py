@@ -0,0 +1,38 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from django.urls import reverse
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from api.models import Category
+
+User = get_user_model()
+CATEGORY_URL = reverse('api:category-list')
+
+
+class PrivateCategoryApiTests(TestCase):
+    # Tests for the authorized user categories API
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_categories_limited_to_user(self):
+        # Test to list only the authenticated users categories
+        user2 = User.objects.create_user(
+            email='test2@email.com', password='password123')
+        Category.objects.create(name='car', user=user2)
+        category = Category.objects.create(name='food', user=self.user)
+        response = self.client.get(CATEGORY_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['name'], category.name)
+
+    def test_create_existing_category(self):
+        # Test creating an existing category returns the same row
+        category = Category.objects.create(name='food', user=self.user)
+        response = self.client.post(CATEGORY_URL, {'name': 'food'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], category.id)
+        self.assertEqual(Category.objects.count(), 1)
@@ -0,0 +1,136 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import categorizer
+from api.models import Category, Flow, Tag, Transaction, Wallet
+
+User = get_user_model()
+
+TRANSACTIONS_URL = reverse('api:transaction-list')
+SUGGEST_URL = reverse('api:transaction-suggest')
+
+
+class CategorizerTests(TestCase):
+    # Test suggesting categories and tags from transaction notes
+
+    def setUp(self):
+        categorizer.model_cache.clear()
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR')
+        self.food = Category.objects.create(user=self.user, name='food')
+        self.transport = Category.objects.create(
+            user=self.user, name='transport')
+        self.work = Tag.objects.create(user=self.user, name='work')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, category, note, tags=()):
+        transaction = Transaction.objects.create(
+            user=self.user, wallet=self.wallet, category=category,
+            flow=Flow.EXPENSES, ammount=10, note=note, date=datetime.now())
+        transaction.tags.set(tags)
+        return transaction
+
+    def create_history(self):
+        self.create_transaction(self.food, 'Lunch at the office',
+                                [self.work])
+        self.create_transaction(self.food, 'lunch with team', [self.work])
+        self.create_transaction(self.food, 'Groceries')
+        self.create_transaction(self.transport, 'Bus ticket')
+        self.create_transaction(self.transport, 'Taxi to the airport')
+
+    def test_predict(self):
+        # Test the model picks the category and tags of similar notes
+        self.create_history()
+        self.assertEqual(
+            categorizer.suggest(self.user.id, ['LUNCH', 'bus to office',
+                                               'something else']),
+            [('food', [self.work.id]), ('transport', []), (None, [])])
+
+    def test_model_cached_and_updated(self):
+        # Test the cached model learns new transactions without a rebuild
+        self.create_history()
+        categorizer.suggest(self.user.id, ['lunch'])
+        self.create_transaction(self.transport, 'Train ticket')
+        with self.assertNumQueries(0):
+            self.assertEqual(categorizer.suggest(self.user.id, ['train']),
+                             [('transport', [])])
+
+    def test_changed_transaction_rebuilds(self):
+        # Test editing a transaction drops the cached model
+        transaction = self.create_transaction(self.food, 'Coffee')
+        categorizer.suggest(self.user.id, ['coffee'])
+        transaction.category = self.transport
+        transaction.save()
+        self.assertIsNone(categorizer.model_cache.peek(self.user.id))
+        self.assertEqual(categorizer.suggest(self.user.id, ['coffee']),
+                         [('transport', [])])
+
+    def test_deleted_tags_not_suggested(self):
+        # Test tags deleted after training are left out
+        self.create_history()
+        categorizer.suggest(self.user.id, ['lunch'])
+        self.work.delete()
+        self.assertEqual(categorizer.suggest(self.user.id, ['lunch']),
+                         [('food', [])])
+
+    def test_model_cache_lru(self):
+        # Test the least recently used model is evicted
+        cache = categorizer.ModelCache(max_size=2)
+        for user_id in (1, 2, 1, 3):
+            cache.get(user_id)
+        self.assertEqual(list(cache.entries), [1, 3])
+
+    def test_create_fills_category_and_tags(self):
+        # Test transactions created without a category are categorized
+        self.create_history()
+        payload = {'flow': 'expenses', 'wallet': self.wallet.id,
+                   'ammount': 12, 'note': 'lunch', 'date': datetime.now()}
+        response = self.client.post(TRANSACTIONS_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['category'], 'food')
+        self.assertEqual(response.data['tags'], [self.work.id])
+
+    def test_create_keeps_given_values(self):
+        # Test a given category and empty tags are not replaced
+        self.create_history()
+        payload = {'flow': 'expenses', 'wallet': self.wallet.id,
+                   'ammount': 12, 'note': 'lunch', 'date': datetime.now(),
+                   'category': 'transport', 'tags': []}
+        response = self.client.post(TRANSACTIONS_URL, payload,
+                                    format='json')
+        self.assertEqual(response.data['category'], 'transport')
+        self.assertEqual(response.data['tags'], [])
+
+    def test_create_without_category_unknown_note(self):
+        # Test a category is still required when nothing can be suggested
+        payload = {'flow': 'expenses', 'wallet': self.wallet.id,
+                   'ammount': 12, 'note': 'lunch', 'date': datetime.now()}
+        response = self.client.post(TRANSACTIONS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('category', response.data)
+
+    def test_suggest_endpoint(self):
+        # Test suggestions for a batch of notes
+        self.create_history()
+        response = self.client.post(
+            SUGGEST_URL, {'notes': ['team lunch', 'taxi']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'note': 'team lunch', 'category': 'food',
+             'tags': [self.work.id]},
+            {'note': 'taxi', 'category': 'transport', 'tags': []},
+        ])
+
+    def test_suggest_invalid(self):
+        # Test the notes must be a list of strings
+        response = self.client.post(SUGGEST_URL, {'notes': 'lunch'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
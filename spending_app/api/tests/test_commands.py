@@ -1,23 +1,76 @@
 from unittest.mock import patch
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
+from api.health import pending_migrations
+from api.management.commands.start import preload
+
+ENSURE_CONNECTION = \
+    'django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection'
 
 
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
         # Test waiting for db when db is available
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
+        with patch(ENSURE_CONNECTION) as ec:
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+            self.assertEqual(ec.call_count, 1)
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         # Test waiting for db
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
+        with patch(ENSURE_CONNECTION) as ec:
+            ec.side_effect = [OperationalError] * 5 + [None]
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+            self.assertEqual(ec.call_count, 6)
+        delays = [call.args[0] for call in ts.call_args_list]
+        self.assertEqual(delays, [0.1, 0.2, 0.4, 0.8, 1.6])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        # Test giving up when the database never becomes available
+        with patch(ENSURE_CONNECTION, side_effect=OperationalError), \
+                patch('time.monotonic', side_effect=[0, 1, 2, 31]):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=30)
+        self.assertEqual(ts.call_count, 2)
+
+
+@patch('api.audit.start')
+class StartCommandTests(TestCase):
+    # Test the combined startup command
+
+    @patch('api.management.commands.start.preload')
+    @patch('api.management.commands.start.call_command')
+    def test_start_skips_migrate(self, cc, preload, start):
+        # Test migrate is skipped when every migration is applied
+        call_command('start')
+        commands = [call.args[0] for call in cc.call_args_list]
+        self.assertEqual(commands,
+                         ['wait_for_db', 'createcachetable', 'runserver'])
+        preload.assert_called_once()
+        start.assert_called_once()
+        self.assertFalse(cc.call_args.kwargs['use_reloader'])
+
+    @patch('api.management.commands.start.pending_migrations',
+           return_value=['0042_pending'])
+    @patch('api.management.commands.start.preload')
+    @patch('api.management.commands.start.call_command')
+    def test_start_applies_pending_migrations(self, cc, preload, pm, start):
+        # Test migrate runs when migrations are pending
+        call_command('start', '127.0.0.1:9000')
+        commands = [call.args[0] for call in cc.call_args_list]
+        self.assertEqual(commands, ['wait_for_db', 'migrate',
+                                    'createcachetable', 'runserver'])
+        self.assertEqual(cc.call_args.args[1], '127.0.0.1:9000')
+
+    def test_pending_migrations(self, start):
+        # Test the test database has no pending migrations
+        self.assertEqual(pending_migrations(), [])
+
+    def test_preload(self, start):
+        # Test the URLconf is imported before serving
+        preload()
@@ -0,0 +1,138 @@
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.currency import (ExchangeRateMissing, RateCache, convert_amounts,
+                          rate_cache)
+from api.models import Category, ExchangeRate, Flow, Transaction, Wallet
+from api.views import ConvertedListMixin
+
+User = get_user_model()
+TRANSACTION_URL = reverse('api:transaction-list')
+WALLET_URL = reverse('api:wallet-list')
+
+
+class ExchangeRateTests(TestCase):
+    # Test loading, caching and applying exchange rates
+
+    def setUp(self):
+        rate_cache.clear()
+        ExchangeRate.objects.create(
+            base='USD', quote='EUR', date=date(2021, 9, 1), rate='0.8')
+        ExchangeRate.objects.create(
+            base='USD', quote='EUR', date=date(2021, 9, 10), rate='0.9')
+
+    def test_rate_cache_evicts_least_recently_used(self):
+        # Test the cache drops the oldest entry when full
+        cache = RateCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_rate_cache_expires(self):
+        # Test rates are looked up again once their ttl has passed
+        cache = RateCache(max_size=2, ttl=60)
+        with patch('api.currency.time.monotonic', return_value=100):
+            cache.put('a', 1)
+        with patch('api.currency.time.monotonic', return_value=159):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('api.currency.time.monotonic', return_value=160):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.entries, {})
+
+    def test_converted_list_requires_inputs(self):
+        # Test a viewset cannot use the mixin without its hook
+        with self.assertRaises(ImproperlyConfigured):
+            type('BrokenViewSet', (ConvertedListMixin,),
+                 {'converted_field': 'converted'})
+
+    def test_convert_uses_latest_rate_on_or_before_date(self):
+        # Test each amount uses the rate in effect on its date
+        converted = convert_amounts(
+            [100, 100, 100, 100], ['usd', 'USD', 'USD', 'EUR'],
+            [date(2021, 9, 1), date(2021, 9, 9), date(2021, 9, 30),
+             date(2021, 9, 30)], 'eur')
+        self.assertEqual(converted, [Decimal('80.00'), Decimal('80.00'),
+                                     Decimal('90.00'), Decimal('100.00')])
+
+    def test_convert_uses_inverse_pair(self):
+        # Test converting the other way inverts the stored rate
+        converted = convert_amounts([90], ['EUR'], [date(2021, 9, 10)], 'USD')
+        self.assertEqual(converted, [Decimal('100.00')])
+
+    def test_convert_cached_without_queries(self):
+        # Test repeated conversions are served from the cache
+        convert_amounts([1], ['USD'], [date(2021, 9, 5)], 'EUR')
+        with self.assertNumQueries(0):
+            convert_amounts([2], ['USD'], [date(2021, 9, 5)], 'EUR')
+
+    def test_convert_missing_rate(self):
+        # Test converting without a known rate raises an error
+        with self.assertRaises(ExchangeRateMissing):
+            convert_amounts([1], ['GBP'], [date(2021, 9, 5)], 'EUR')
+
+    def test_load_exchange_rates_command(self):
+        # Test loading rates adds new rows and updates existing ones
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as rates_file:
+            rates_file.write('date,base,quote,rate\n'
+                             '2021-09-01,usd,eur,0.85\n'
+                             '2021-09-02,GBP,EUR,1.15\n')
+            rates_file.flush()
+            call_command('load_exchange_rates', rates_file.name,
+                         stdout=StringIO())
+
+        self.assertEqual(ExchangeRate.objects.get(
+            base='USD', date=date(2021, 9, 1)).rate, Decimal('0.85'))
+        self.assertTrue(ExchangeRate.objects.filter(base='GBP').exists())
+
+
+class ConvertedListApiTests(TestCase):
+    # Test listing amounts in a requested currency
+
+    def setUp(self):
+        rate_cache.clear()
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='testwallet', currency='USD', balance=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        ExchangeRate.objects.create(
+            base='USD', quote='EUR', date=date(2021, 9, 1), rate='0.5')
+        Transaction.objects.create(
+            user=self.user,
+            flow=Flow.EXPENSES,
+            date='2021-09-02T14:07:09',
+            wallet=self.wallet,
+            category=Category.objects.create(user=self.user, name='car'),
+            ammount=40,
+        )
+
+    def test_list_transactions_in_currency(self):
+        # Test transactions get an amount converted to the currency
+        response = self.client.get(TRANSACTION_URL, {'currency': 'EUR'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['converted_ammount'], 20)
+
+    def test_list_wallets_in_currency(self):
+        # Test wallets get a balance converted to the currency
+        response = self.client.get(WALLET_URL, {'currency': 'EUR'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['converted_balance'], 50)
+
+    def test_list_unknown_currency(self):
+        # Test asking for a currency without rates is a bad request
+        response = self.client.get(TRANSACTION_URL, {'currency': 'JPY'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import dashboard, tasks
+from api.models import (Category, Flow, Tag, Task, Transaction,
+                        Wallet)
+
+User = get_user_model()
+
+DASHBOARD_URL = reverse('api:dashboard')
+
+
+class DashboardTests(TestCase):
+    # Test the precomputed dashboard endpoint
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR', balance=100)
+        self.food = Category.objects.create(user=self.user, name='food')
+        self.salary = Category.objects.create(user=self.user, name='salary')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, category, ammount, flow=Flow.EXPENSES,
+                           date=None):
+        return Transaction.objects.create(
+            user=self.user, wallet=self.wallet, category=category,
+            flow=flow, ammount=ammount, date=date or datetime.now())
+
+    def test_dashboard_payload(self):
+        # Test balances, this month's spend and recent transactions
+        self.create_transaction(self.food, 10)
+        self.create_transaction(self.food, 5)
+        self.create_transaction(self.salary, 1000, flow=Flow.INCOME)
+        self.create_transaction(
+            self.food, 70, date=datetime.now() - timedelta(days=40))
+
+        response = self.client.get(DASHBOARD_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['wallets'][0]['balance'], 100)
+        self.assertEqual(response.data['month_spend'],
+                         [{'category': 'food', 'total': 15}])
+        self.assertEqual(len(response.data['recent_transactions']), 4)
+        self.assertEqual(
+            response.data['recent_transactions'][-1]['ammount'], 70)
+
+    def test_dashboard_cached(self):
+        # Test a cached dashboard is served by a single read of the cache
+        # shared by every process
+        self.client.get(DASHBOARD_URL)
+        key = dashboard.cache_key(
+            self.user.id, dashboard.month_start(datetime.now()))
+        self.assertIsNotNone(caches['shared'].get(key))
+        with self.assertNumQueries(1):
+            response = self.client.get(DASHBOARD_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(DASHBOARD_RECENT_TRANSACTIONS=2)
+    def test_recent_transactions_limited(self):
+        # Test only the latest transactions are included
+        for ammount in (1, 2, 3):
+            self.create_transaction(self.food, ammount)
+        payload = dashboard.compute(self.user.id)
+        self.assertEqual(
+            [t['ammount'] for t in payload['recent_transactions']], [3, 2])
+
+    def test_recent_tags_from_column(self):
+        # Test the tags of recent transactions come from tag_ids, without
+        # reading the join table
+        tag = Tag.objects.create(user=self.user, name='work')
+        self.create_transaction(self.food, 1).tags.add(tag)
+        with CaptureQueriesContext(connection) as queries:
+            payload = dashboard.compute(self.user.id)
+        self.assertEqual(payload['recent_transactions'][0]['tags'], [tag.id])
+        self.assertFalse(any('api_transaction_tags' in query['sql']
+                             for query in queries))
+
+    def test_write_queues_one_refresh(self):
+        # Test writes queue a single recompute of the user's dashboard
+        self.client.get(DASHBOARD_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction(self.food, 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction(self.food, 20)
+
+        task = Task.objects.get()
+        self.assertEqual(task.name, 'api.dashboard.refresh_task')
+        self.assertEqual(task.args, [self.user.id])
+        cached = self.client.get(DASHBOARD_URL).data
+        self.assertEqual(cached['month_spend'], [])
+
+        tasks.run_pending()
+        response = self.client.get(DASHBOARD_URL)
+        self.assertEqual(response.data['month_spend'],
+                         [{'category': 'food', 'total': 30}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.save()
+        self.assertEqual(Task.objects.filter(status='pending').count(), 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_refresh(self):
+        # Test the dashboard is recomputed right away with eager tasks
+        self.client.get(DASHBOARD_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction(self.food, 10)
+        response = self.client.get(DASHBOARD_URL)
+        self.assertEqual(response.data['month_spend'],
+                         [{'category': 'food', 'total': 10}])
+
+    def test_dashboard_requires_auth(self):
+        # Test authentication is required
+        response = APIClient().get(DASHBOARD_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api import db_router
+from api.models import Wallet
+
+User = get_user_model()
+WALLET_URL = reverse('api:wallet-list')
+
+
+class PrimaryReplicaRouterTests(TestCase):
+    # Test routing of reads and writes between primary and replicas
+
+    def setUp(self):
+        self.router = db_router.PrimaryReplicaRouter()
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        caches['shared'].clear()
+
+    def tearDown(self):
+        db_router.set_replica_reads(False)
+
+    def test_reads_use_primary_without_replicas(self):
+        # Test reads go to the primary when no replicas are configured
+        db_router.set_replica_reads(True)
+        self.assertEqual(self.router.db_for_read(Wallet), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_reads_use_replica_when_enabled(self):
+        # Test enabled reads go to a replica and writes to the primary
+        self.assertEqual(self.router.db_for_read(Wallet), 'default')
+        db_router.set_replica_reads(True)
+        self.assertEqual(self.router.db_for_read(Wallet), 'replica_0')
+        self.assertEqual(self.router.db_for_write(Wallet), 'default')
+
+    def test_migrations_only_on_primary(self):
+        # Test replicas never get migrated directly
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'api'))
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_cache_reads_use_primary(self):
+        # Test the database cache is never read from a replica
+        cache_model = caches['shared'].cache_model_class
+        db_router.set_replica_reads(True)
+        self.assertEqual(self.router.db_for_read(cache_model), 'default')
+
+    @override_settings(READ_YOUR_WRITES_WINDOW=5,
+                       DATABASE_REPLICAS=['replica_0'])
+    def test_write_pins_user_to_primary(self):
+        # Test a successful write keeps the user on the primary
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertFalse(db_router.is_pinned_to_primary(self.user))
+        client.post(WALLET_URL, {'name': 'wallet', 'currency': 'EUR'})
+        self.assertTrue(db_router.is_pinned_to_primary(self.user))
+        self.assertTrue(caches['shared'].get(
+            db_router.primary_pin_key(self.user.pk)))
+        self.assertFalse(db_router.replica_reads_enabled())
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_replica_reads_reset_when_handler_raises(self):
+        # Test a crashing request does not leave its thread on the replica
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(self.user)
+        with patch('api.views.WalletViewSet.get_queryset',
+                   side_effect=RuntimeError):
+            response = client.get(WALLET_URL)
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(db_router.replica_reads_enabled())
@@ -0,0 +1,106 @@
+from datetime import date, datetime
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import deletion, tasks
+from api.models import (Budget, Category, Flow, RecurringTransaction, Tag,
+                        Task, Transaction, Wallet)
+
+User = get_user_model()
+
+
+def wallet_detail_url(wallet_id):
+    return reverse('api:wallet-detail', args=[wallet_id])
+
+
+class DeletionTests(TestCase):
+    # Test batched deletion of wallets and users
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR', balance=0)
+        self.other_wallet = Wallet.objects.create(
+            user=self.user, name='bank', currency='EUR', balance=0)
+        self.category = Category.objects.create(user=self.user, name='food')
+        self.tag = Tag.objects.create(user=self.user, name='weekly')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transactions(self, wallet, count, image=''):
+        for _ in range(count):
+            transaction = Transaction.objects.create(
+                user=self.user, wallet=wallet, flow=Flow.EXPENSES,
+                category=self.category, ammount=10, date=datetime.now(),
+                image=image)
+            transaction.tags.add(self.tag)
+
+    @override_settings(DELETION_BATCH_SIZE=2)
+    def test_delete_wallet_in_batches(self):
+        # Test a wallet is deleted with its transactions and tag links
+        self.create_transactions(self.wallet, 5, image='uploads/a.jpg')
+        self.create_transactions(self.other_wallet, 1)
+        budget = Budget(user=self.user, category=self.category, limit=100)
+        budget.start_period(date.today())
+        budget.save()
+        self.assertEqual(budget.spent, 60)
+
+        deleted = deletion.delete_wallet(self.wallet.pk)
+
+        self.assertEqual(deleted, 5)
+        self.assertFalse(Wallet.objects.filter(pk=self.wallet.pk).exists())
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(Transaction.tags.through.objects.count(), 1)
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.usage_count, 1)
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 10)
+        task = Task.objects.get()
+        self.assertEqual(task.args, [['uploads/a.jpg'] * 5])
+
+    def test_delete_user_removes_everything(self):
+        # Test deleting a user removes all of their data
+        self.create_transactions(self.wallet, 3)
+        RecurringTransaction.objects.create(
+            user=self.user, wallet=self.wallet, category=self.category,
+            flow=Flow.EXPENSES, ammount=5, frequency='monthly',
+            start_date=datetime.now(), next_run=datetime.now())
+
+        deletion.delete_user(self.user.pk)
+
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(Category.objects.exists())
+        self.assertFalse(Wallet.objects.exists())
+
+    def test_delete_wallet_api(self):
+        # Test deleting a small wallet through the api
+        self.create_transactions(self.wallet, 2)
+        response = self.client.delete(wallet_detail_url(self.wallet.pk))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Wallet.objects.filter(pk=self.wallet.pk).exists())
+
+    @override_settings(BACKGROUND_DELETION_THRESHOLD=2)
+    def test_delete_large_wallet_in_background(self):
+        # Test large wallets are queued for deletion by the worker
+        self.create_transactions(self.wallet, 3)
+        response = self.client.delete(wallet_detail_url(self.wallet.pk))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(Wallet.objects.filter(pk=self.wallet.pk).exists())
+
+        tasks.run_pending()
+        self.assertFalse(Wallet.objects.filter(pk=self.wallet.pk).exists())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_delete_other_users_wallet(self):
+        # Test wallets of other users cannot be deleted
+        user2 = User.objects.create_user(
+            email='test2@email.com', password='password123')
+        wallet = Wallet.objects.create(
+            user=user2, name='cash', currency='EUR', balance=0)
+        response = self.client.delete(wallet_detail_url(wallet.pk))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import (Category, Flow, Frequency, RecurringTransaction,
+                        Tag, Transaction, Wallet)
+
+User = get_user_model()
+
+TRANSACTIONS_URL = reverse('api:transaction-list')
+
+
+class DuplicateTransactionTests(TestCase):
+    # Test transaction fingerprints and duplicate handling
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR')
+        self.category = Category.objects.create(user=self.user, name='food')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, ammount=10, note='Lunch', date=None):
+        return Transaction.objects.create(
+            user=self.user, wallet=self.wallet, category=self.category,
+            flow=Flow.EXPENSES, ammount=ammount, note=note,
+            date=date or datetime(2021, 9, 10, 12, 0))
+
+    def test_fingerprint(self):
+        # Test the fingerprint ignores the time of day and note formatting
+        first = self.create_transaction()
+        second = self.create_transaction(
+            note='  lunch ', date=datetime(2021, 9, 10, 18, 30))
+        other = self.create_transaction(ammount=11)
+        self.assertEqual(len(first.fingerprint), 40)
+        self.assertEqual(first.fingerprint, second.fingerprint)
+        self.assertNotEqual(first.fingerprint, other.fingerprint)
+
+    def test_fingerprint_updated_on_save(self):
+        # Test saving with update_fields refreshes the fingerprint
+        transaction = self.create_transaction()
+        previous = transaction.fingerprint
+        transaction.ammount = 20
+        transaction.save(update_fields=['ammount'])
+        transaction.refresh_from_db()
+        self.assertNotEqual(transaction.fingerprint, previous)
+
+    def test_recurring_fingerprint(self):
+        # Test transactions built for bulk inserts carry a fingerprint
+        rule = RecurringTransaction.objects.create(
+            user=self.user, wallet=self.wallet, category=self.category,
+            flow=Flow.EXPENSES, ammount=10, frequency=Frequency.MONTHLY,
+            start_date=datetime(2021, 9, 10), next_run=datetime(2021, 9, 10))
+        transaction = rule.build_transaction(datetime(2021, 9, 10))
+        self.assertEqual(transaction.fingerprint,
+                         transaction.compute_fingerprint())
+
+    def payload(self, **params):
+        return {'flow': 'expenses', 'category': 'food',
+                'wallet': self.wallet.id, 'ammount': 10, 'note': 'Lunch',
+                'date': datetime(2021, 9, 10, 12, 0), **params}
+
+    def test_duplicate_flagged(self):
+        # Test a duplicate is saved and flagged by default
+        self.create_transaction()
+        response = self.client.post(TRANSACTIONS_URL, self.payload())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['is_duplicate'])
+        self.assertNotIn('fingerprint', response.data)
+
+        response = self.client.post(TRANSACTIONS_URL,
+                                    self.payload(ammount=11))
+        self.assertFalse(response.data['is_duplicate'])
+
+    def test_duplicate_flag_cleared(self):
+        # Test editing a flagged transaction away from its duplicate
+        # clears the flag
+        self.create_transaction()
+        response = self.client.post(TRANSACTIONS_URL, self.payload())
+        self.assertTrue(response.data['is_duplicate'])
+
+        url = reverse('api:transaction-detail', args=[response.data['id']])
+        response = self.client.patch(url, {'ammount': 11})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Transaction.objects.get(
+            pk=response.data['id']).is_duplicate)
+
+    @override_settings(DUPLICATE_TRANSACTIONS='reject')
+    def test_duplicate_rejected(self):
+        # Test duplicates are refused when rejecting is configured
+        original = self.create_transaction()
+        response = self.client.post(TRANSACTIONS_URL, self.payload())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        # Updating a transaction does not match itself
+        url = reverse('api:transaction-detail', args=[original.id])
+        response = self.client.patch(url, {'note': 'lunch'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_find_duplicates_report(self):
+        # Test duplicates are reported without changes
+        first = self.create_transaction()
+        second = self.create_transaction(date=datetime(2021, 9, 10, 20, 0))
+        self.create_transaction(date=datetime(2021, 9, 10) + timedelta(1))
+        out = StringIO()
+        call_command('find_duplicates', stdout=out, prefix_length=1)
+        self.assertIn(f'Transaction {first.id} has duplicates {second.id}',
+                      out.getvalue())
+        self.assertIn('Found 1 duplicate transactions', out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_find_duplicates_merge(self):
+        # Test merging keeps the oldest transaction with every tag
+        tag = Tag.objects.create(user=self.user, name='work')
+        first = self.create_transaction()
+        second = self.create_transaction()
+        third = self.create_transaction()
+        second.tags.add(tag)
+        third.tags.add(tag)
+        other_user = User.objects.create_user(
+            email='other@email.com', password='password123')
+
+        call_command('find_duplicates', stdout=StringIO(), merge=True,
+                     user=other_user.id)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+        call_command('find_duplicates', stdout=StringIO(), merge=True)
+        self.assertEqual(list(Transaction.objects.values_list(
+            'pk', flat=True)), [first.id])
+        self.assertEqual(list(first.tags.all()), [tag])
+        first.refresh_from_db()
+        self.assertEqual(first.tag_ids, [tag.pk])
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 1)
@@ -0,0 +1,136 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import IdempotencyKey, Transaction, Wallet
+
+User = get_user_model()
+TRANSACTION_URL = reverse('api:transaction-list')
+
+
+class IdempotencyKeyTests(TestCase):
+    # Test replaying writes sent with an Idempotency-Key header
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='testwallet', currency='EUR', balance=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'flow': 'expenses',
+            'date': '2021-09-02T14:07:09',
+            'wallet': self.wallet.id,
+            'category': 'food',
+            'ammount': 5,
+        }
+
+    def test_retry_replays_first_response(self):
+        # Test a retried create returns the stored response only once
+        first = self.client.post(TRANSACTION_URL, self.payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.client.post(TRANSACTION_URL, self.payload,
+                                  HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_requests_without_key_not_stored(self):
+        # Test writes without the header behave as before
+        self.client.post(TRANSACTION_URL, self.payload)
+        self.client.post(TRANSACTION_URL, self.payload)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_failed_request_can_be_retried(self):
+        # Test a rejected request does not consume its key
+        invalid = dict(self.payload, category='')
+        response = self.client.post(TRANSACTION_URL, invalid,
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(TRANSACTION_URL, self.payload,
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_key_reused_for_other_request(self):
+        # Test a key cannot be replayed against another endpoint
+        transaction = self.client.post(
+            TRANSACTION_URL, self.payload, HTTP_IDEMPOTENCY_KEY='abc')
+        url = reverse('api:transaction-upload-image',
+                      args=[transaction.data['id']])
+        response = self.client.post(url, {}, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_expired_key_not_replayed(self):
+        # Test a key past its TTL runs the request again
+        first = self.client.post(TRANSACTION_URL, self.payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        IdempotencyKey.objects.update(
+            created=timezone.now() - timedelta(days=2))
+
+        second = self.client.post(TRANSACTION_URL, self.payload,
+                                  HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(second.data['id'], first.data['id'])
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_unfinished_request_blocks_then_expires(self):
+        # Test a key left in progress conflicts until its timeout passes
+        IdempotencyKey.objects.create(
+            user=self.user, key='abc', method='POST', path=TRANSACTION_URL)
+        response = self.client.post(TRANSACTION_URL, self.payload,
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        IdempotencyKey.objects.update(
+            created=timezone.now() - timedelta(minutes=10))
+        response = self.client.post(TRANSACTION_URL, self.payload,
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_purged_key_claimed_again(self):
+        # Test a key deleted between the failed insert and the lookup is
+        # claimed again instead of failing
+        IdempotencyKey.objects.create(
+            user=self.user, key='abc', method='POST', path=TRANSACTION_URL)
+        lookup = IdempotencyKey.objects.filter
+
+        def purged(*args, **kwargs):
+            IdempotencyKey.objects.all().delete()
+            return lookup(*args, **kwargs)
+
+        with patch.object(IdempotencyKey.objects, 'filter',
+                          side_effect=purged):
+            response = self.client.post(TRANSACTION_URL, self.payload,
+                                        HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_purge_expired_keys(self):
+        # Test the purge command only deletes keys older than the TTL
+        old = IdempotencyKey.objects.create(
+            user=self.user, key='old', method='POST', path='/')
+        IdempotencyKey.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timedelta(days=2))
+        IdempotencyKey.objects.create(
+            user=self.user, key='new', method='POST', path='/')
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list('key', flat=True)),
+            ['new'])
@@ -0,0 +1,97 @@
+import gzip
+import json
+from unittest.mock import patch
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from api import health
+from api.middleware import CompressionMiddleware
+
+BODY = b'{"category": "food", "flow": "expenses"}' * 100
+
+
+class CompressionMiddlewareTests(TestCase):
+    # Test compressing large responses
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get_response(self, body, accept_encoding='gzip'):
+        request = self.factory.get(
+            '/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        middleware = CompressionMiddleware(lambda request: HttpResponse(body))
+        return middleware(request)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024)
+    def test_large_response_gzipped(self):
+        # Test a response over the threshold is gzip compressed
+        response = self.get_response(BODY)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024)
+    def test_small_response_not_compressed(self):
+        # Test a response under the threshold is left alone
+        response = self.get_response(BODY[:100])
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY[:100])
+
+    def test_response_not_compressed_when_not_accepted(self):
+        # Test clients without gzip support get the plain body
+        response = self.get_response(BODY, accept_encoding='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(MEDIA_ROOT='/tmp')
+class HealthCheckTests(TestCase):
+    # Test the health and readiness endpoints
+
+    def setUp(self):
+        health.reset()
+
+    def test_healthz(self):
+        # Test the liveness endpoint answers without a database query
+        with self.assertNumQueries(0):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'status': 'ok'})
+
+    def test_readyz(self):
+        # Test the readiness endpoint reports every check
+        response = self.client.get('/readyz/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['checks'], {
+            'database': 'ok', 'media': 'ok', 'migrations': 'ok'})
+
+    def test_readyz_bypasses_sessions(self):
+        # Test probes get no session cookie or CSRF handling
+        response = self.client.get('/readyz')
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_readyz_cached(self):
+        # Test the checks are reused for a few seconds
+        with patch.object(health, 'run_checks',
+                          return_value=(True, {})) as run_checks:
+            self.client.get('/readyz')
+            self.client.get('/readyz')
+        self.assertEqual(run_checks.call_count, 1)
+
+    @override_settings(MEDIA_ROOT='/nonexistent/media')
+    def test_readyz_media_not_writable(self):
+        # Test the endpoint fails when uploads cannot be stored
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        checks = json.loads(response.content)['checks']
+        self.assertNotEqual(checks['media'], 'ok')
+        self.assertEqual(checks['database'], 'ok')
+
+    def test_readyz_pending_migrations(self):
+        # Test the endpoint fails while migrations are pending
+        with patch.object(health, 'pending_migrations',
+                          return_value=['0042_pending']):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.content)['checks']['migrations'],
+                         '1 unapplied migrations')
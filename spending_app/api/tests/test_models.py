@@ -55,14 +55,20 @@ class ModelTests(TestCase):
         )
         transaction = models.Transaction.objects.create(
             user=user,
-            flow='expenses',
+            flow=models.Flow.EXPENSES,
             wallet=wallet,
             date='2021-09-02T14:07:09',
-            category='car',
+            category=models.Category.objects.create(user=user, name='car'),
             note='gas',
             ammount=5,
         )
-        self.assertEqual(str(transaction), transaction.category)
+        self.assertEqual(str(transaction), transaction.category.name)
+
+    def test_category_str(self):
+        # Test the category string representation
+        category = models.Category.objects.create(
+            user=sample_user(), name='food')
+        self.assertEqual(str(category), category.name)
 
     def test_wallet_str(self):
         # Test the wallet string representation
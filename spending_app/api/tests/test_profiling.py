@@ -0,0 +1,76 @@
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+TRANSACTIONS_URL = reverse('api:transaction-list')
+
+
+class ProfilingTests(TestCase):
+    # Test profiling single api requests
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        settings = override_settings(PROFILE_DIR=self.profile_dir,
+                                     PROFILE_SAMPLE_RATE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_staff_profile_requested(self):
+        # Test staff get a profile of the request and its rendering
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(TRANSACTIONS_URL, {'profile': 1})
+
+        self.assertEqual(response.status_code, 200)
+        path = os.path.join(self.profile_dir, response['X-Profile'])
+        stats = pstats.Stats(path)
+        functions = {name for _, _, name in stats.stats}
+        self.assertIn('list', functions)
+        self.assertIn('render', functions)
+
+    def test_profiler_stopped_when_handler_raises(self):
+        # Test a crashing request does not leave the thread profiled
+        self.user.is_staff = True
+        self.user.save()
+        self.client.raise_request_exception = False
+        with patch('api.views.TransactionViewSet.get_queryset',
+                   side_effect=RuntimeError):
+            response = self.client.get(TRANSACTIONS_URL, {'profile': 1})
+        self.assertEqual(response.status_code, 500)
+        self.assertIsNone(sys.getprofile())
+
+    def test_profile_header(self):
+        # Test the header works like the query flag
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(TRANSACTIONS_URL, HTTP_X_PROFILE='1')
+        self.assertTrue(response.has_header('X-Profile'))
+
+    def test_profile_requires_staff(self):
+        # Test other users cannot profile requests
+        response = self.client.get(TRANSACTIONS_URL, {'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile'))
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_sampled_requests_profiled(self):
+        # Test sampling profiles requests of any user
+        with override_settings(PROFILE_SAMPLE_RATE=1):
+            response = self.client.get(TRANSACTIONS_URL)
+        self.assertEqual(os.listdir(self.profile_dir),
+                         [response['X-Profile']])
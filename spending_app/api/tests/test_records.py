@@ -0,0 +1,174 @@
+from datetime import date, datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api import records
+from api.models import Category, Flow, Tag, Transaction, Wallet
+
+User = get_user_model()
+
+TRANSACTION_URL = reverse('api:transaction-list')
+
+
+class RecordTests(TestCase):
+    # Test the compact per-user transaction cache
+
+    def setUp(self):
+        caches['shared'].clear()
+        records.record_cache.clear()
+        self.addCleanup(records.record_cache.clear)
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.salary = Category.objects.create(user=self.user, name='salary')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, category, ammount, day=1, note=None,
+                           flow=Flow.EXPENSES, month=9):
+        return Transaction.objects.create(
+            user=self.user, wallet=self.wallet, category=category,
+            flow=flow, ammount=ammount, note=note,
+            date=datetime(2021, month, day, 12, 30))
+
+    def test_records(self):
+        # Test records keep the values with shared category names
+        first = self.create_transaction(self.food, 10, note='pizza')
+        first.tags.add(Tag.objects.create(user=self.user, name='out'))
+        self.create_transaction(self.food, 5, day=2)
+
+        entry = records.get(self.user.pk)
+
+        newest, oldest = entry.records
+        self.assertEqual(oldest.id, first.pk)
+        self.assertEqual(oldest.date, datetime(2021, 9, 1, 12, 30))
+        self.assertEqual(list(oldest.tag_ids), [first.tags.get().pk])
+        self.assertEqual(oldest.note, 'pizza')
+        self.assertIs(newest.category, oldest.category)
+        self.assertIs(newest.tag_ids, records.NO_TAGS)
+        self.assertFalse(hasattr(newest, '__dict__'))
+        self.assertGreater(entry.size, 0)
+
+    def test_month_spend(self):
+        # Test expenses per category from the first of the month on
+        self.create_transaction(self.food, 10)
+        self.create_transaction(self.food, 5, day=20)
+        self.create_transaction(self.salary, 1000, flow=Flow.INCOME)
+        self.create_transaction(self.food, 70, month=8)
+
+        spend = records.get(self.user.pk).month_spend(date(2021, 9, 1))
+
+        self.assertEqual(spend, [('Food', 15)])
+
+    def test_search(self):
+        # Test tag names match first, then category names, then notes
+        tagged = self.create_transaction(self.salary, 10, note='bonus')
+        tagged.tags.add(Tag.objects.create(user=self.user, name='Work'))
+        food = self.create_transaction(self.food, 5, note='work lunch')
+        entry = records.get(self.user.pk)
+
+        self.assertEqual(entry.search('WORK'), [tagged.pk])
+        self.assertEqual(entry.search('foo'), [food.pk])
+        self.assertEqual(entry.search('lunch'), [food.pk])
+        self.assertEqual(entry.search('nothing'), [])
+
+    def test_writes_invalidate(self):
+        # Test transaction, tag and category changes rebuild the records
+        transaction = self.create_transaction(self.food, 10)
+        entry = records.get(self.user.pk)
+        self.assertIs(records.get(self.user.pk), entry)
+
+        transaction.tags.add(Tag.objects.create(user=self.user, name='x'))
+        self.assertEqual(len(records.get(self.user.pk).records[0].tag_ids),
+                         1)
+        self.food.name = 'groceries'
+        self.food.save()
+        self.assertEqual(records.get(self.user.pk).records[0].category,
+                         'groceries')
+        transaction.delete()
+        self.assertEqual(records.get(self.user.pk).records, [])
+
+    def test_other_process_write_invalidates(self):
+        # Test a version changed in the shared cache drops local records
+        self.create_transaction(self.food, 10)
+        entry = records.get(self.user.pk)
+        caches['shared'].set(records.version_key(self.user.pk), 'other', None)
+        self.assertIsNot(records.get(self.user.pk), entry)
+
+    def test_evicts_least_recently_used(self):
+        # Test users are evicted once the cache holds too many bytes
+        self.create_transaction(self.food, 10)
+        other = User.objects.create_user(
+            email='other@email.com', password='password123')
+        sizes = [records.build(user_id, None).size
+                 for user_id in (self.user.pk, other.pk)]
+        cache_ = records.RecordCache(sum(sizes) - 1)
+
+        cache_.get(self.user.pk)
+        self.assertEqual(list(cache_.entries), [self.user.pk])
+        cache_.get(other.pk)
+        self.assertEqual(list(cache_.entries), [other.pk])
+        cache_.get(self.user.pk)
+        self.assertEqual(list(cache_.entries), [self.user.pk])
+        self.assertEqual(cache_.size, sizes[0])
+
+    @override_settings(RECORD_CACHE_MAX_ROWS=1)
+    def test_too_many_transactions(self):
+        # Test users over the row limit are searched in the database
+        self.create_transaction(self.food, 10, note='lunch')
+        self.create_transaction(self.salary, 10)
+        self.assertIsNone(records.get(self.user.pk))
+
+        response = self.client.get(TRANSACTION_URL, {'keyword': 'lunch'})
+
+        self.assertEqual(len(response.data), 1)
+
+    def test_search_endpoint(self):
+        # Test the transaction list searches the cached records
+        self.create_transaction(self.food, 10, note='lunch')
+        self.create_transaction(self.salary, 10)
+        records.get(self.user.pk)
+
+        self.assertEqual(len(records.search(self.user.pk, 'lunch')), 1)
+        response = self.client.get(TRANSACTION_URL, {'keyword': 'lunch'})
+
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['note'], 'lunch')
+
+    def test_search_without_cached_records(self):
+        # Test a search does not build records, it queries the database
+        self.create_transaction(self.food, 10, note='lunch')
+
+        response = self.client.get(TRANSACTION_URL, {'keyword': 'lunch'})
+
+        self.assertEqual(len(response.data), 1)
+        self.assertIsNone(records.search(self.user.pk, 'lunch'))
+        self.assertEqual(records.record_cache.entries, {})
+
+    @override_settings(RECORD_SEARCH_MAX_IDS=1)
+    def test_search_many_matches(self):
+        # Test searches matching many transactions query the database
+        # instead of filtering by a long list of ids
+        self.create_transaction(self.food, 10, note='lunch')
+        self.create_transaction(self.food, 20, note='lunch')
+        records.get(self.user.pk)
+        self.assertIsNone(records.search(self.user.pk, 'lunch'))
+
+        response = self.client.get(TRANSACTION_URL, {'keyword': 'lunch'})
+
+        self.assertEqual(len(response.data), 2)
+
+    def test_benchmark_command(self):
+        # Test the memory of model instances and records is reported
+        self.create_transaction(self.food, 10, note='lunch')
+        out = StringIO()
+        call_command('benchmark_records', stdout=out)
+        self.assertIn('1 transactions', out.getvalue())
+        self.assertIn('records:', out.getvalue())
@@ -0,0 +1,163 @@
+from datetime import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import (Category, Flow, Frequency, RecurringTransaction, Tag,
+                        Transaction, Wallet)
+
+User = get_user_model()
+RECURRING_URL = reverse('api:recurringtransaction-list')
+
+
+class RecurringTransactionTests(TestCase):
+    # Test recurring rules and materializing their occurrences
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='testwallet', currency='EUR', balance=100)
+        self.category = Category.objects.create(user=self.user, name='rent')
+
+    def create_rule(self, **params):
+        start = params.pop('start_date', datetime(2021, 1, 31, 9, 0))
+        defaults = {
+            'user': self.user,
+            'wallet': self.wallet,
+            'category': self.category,
+            'flow': Flow.EXPENSES,
+            'ammount': 500,
+            'frequency': Frequency.MONTHLY,
+            'start_date': start,
+            'next_run': start,
+        }
+        defaults.update(params)
+        return RecurringTransaction.objects.create(**defaults)
+
+    def materialize(self):
+        out = StringIO()
+        call_command('materialize_recurring', '--workers', '1',
+                     '--batch-size', '2', stdout=out)
+        return out.getvalue()
+
+    def test_monthly_occurrences_keep_start_day(self):
+        # Test monthly rules clamp short months without drifting
+        rule = self.create_rule()
+        self.assertEqual(rule.occurrence(1), datetime(2021, 2, 28, 9, 0))
+        self.assertEqual(rule.occurrence(2), datetime(2021, 3, 31, 9, 0))
+        self.assertEqual(rule.occurrence(12), datetime(2022, 1, 31, 9, 0))
+
+    def test_materialize_creates_due_transactions_once(self):
+        # Test due occurrences are created once, with the rule's tags
+        tag = Tag.objects.create(user=self.user, name='home')
+        rule = self.create_rule(
+            frequency=Frequency.WEEKLY,
+            start_date=datetime(2021, 1, 1),
+            end_date=datetime(2021, 1, 29),
+        )
+        rule.tags.add(tag)
+
+        output = self.materialize()
+
+        transactions = Transaction.objects.filter(recurring=rule)
+        self.assertEqual(transactions.count(), 5)
+        self.assertIn('Materialized 5 transactions for 1 users', output)
+        self.assertEqual(transactions.filter(tags=tag).count(), 5)
+        self.assertEqual(
+            transactions.filter(tag_ids__contains=[tag.pk]).count(), 5)
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 5)
+        rule.refresh_from_db()
+        self.assertFalse(rule.is_active)
+
+        self.materialize()
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_future_rules_not_materialized(self):
+        # Test rules starting in the future create nothing yet
+        self.create_rule(start_date=datetime(2999, 1, 1))
+        self.materialize()
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_create_rule_through_api(self):
+        # Test creating a rule schedules its first run at the start date
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {
+            'flow': 'income',
+            'category': 'salary',
+            'wallet': self.wallet.id,
+            'ammount': 1000,
+            'frequency': 'monthly',
+            'start_date': '2021-09-25T08:00:00',
+        }
+
+        response = client.post(RECURRING_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        rule = RecurringTransaction.objects.get(id=response.data['id'])
+        self.assertEqual(rule.user, self.user)
+        self.assertEqual(rule.next_run, datetime(2021, 9, 25, 8, 0))
+        self.assertEqual(rule.category.name, 'salary')
+
+    def test_create_rule_without_category_rejected(self):
+        # Test a rule needs a category
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {
+            'flow': 'expenses',
+            'wallet': self.wallet.id,
+            'ammount': 10,
+            'frequency': 'monthly',
+            'start_date': '2021-09-25T08:00:00',
+        }
+
+        response = client.post(RECURRING_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('category', response.data)
+        self.assertFalse(RecurringTransaction.objects.exists())
+
+    def test_update_schedule_through_api(self):
+        # Test a new start or frequency moves the next run past the
+        # occurrences already materialized
+        rule = self.create_rule(start_date=datetime(2021, 1, 1))
+        rule.next_run = datetime(2021, 3, 1)
+        rule.occurrence_count = 2
+        rule.save()
+        for date in (datetime(2021, 1, 1), datetime(2021, 2, 1)):
+            Transaction.objects.create(**{
+                **{field: getattr(rule, field) for field in
+                   ('user', 'wallet', 'category', 'flow', 'ammount')},
+                'date': date, 'recurring': rule})
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('api:recurringtransaction-detail', args=[rule.id])
+
+        response = client.patch(url, {'frequency': 'weekly'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rule.refresh_from_db()
+        self.assertEqual(rule.next_run, datetime(2021, 2, 5))
+        self.assertEqual(rule.occurrence_count, 5)
+
+        response = client.patch(url, {'ammount': 10})
+        rule.refresh_from_db()
+        self.assertEqual(rule.next_run, datetime(2021, 2, 5))
+
+    def test_end_date_before_start_rejected(self):
+        # Test a rule cannot end before it starts
+        rule = self.create_rule(start_date=datetime(2021, 5, 1))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('api:recurringtransaction-detail', args=[rule.id])
+
+        response = client.patch(url, {'end_date': '2021-04-01T00:00:00'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('end_date', response.data)
@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import reports
+from api.models import Category, Flow, Transaction, Wallet
+
+User = get_user_model()
+
+REPORT_URL = reverse('api:transaction-report')
+
+
+class ReportTests(TestCase):
+    # Test the yearly statistics and anomaly flags
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.wallet = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR')
+        self.food = Category.objects.create(user=self.user, name='food')
+        self.rent = Category.objects.create(user=self.user, name='rent')
+        self.salary = Category.objects.create(user=self.user, name='salary')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, category, ammount, month, day=1,
+                           flow=Flow.EXPENSES, year=2021):
+        return Transaction.objects.create(
+            user=self.user, wallet=self.wallet, category=category,
+            flow=flow, ammount=ammount, date=datetime(year, month, day))
+
+    def create_year(self):
+        for month in range(1, 13):
+            self.create_transaction(self.rent, 500, month)
+            self.create_transaction(self.salary, 2000, month,
+                                    flow=Flow.INCOME)
+            for day in (5, 15, 25):
+                self.create_transaction(self.food, 10 + day % 3, month, day)
+        return self.create_transaction(self.food, 400, 12, 24)
+
+    def test_yearly_report(self):
+        # Test totals, per category statistics, spikes and anomalies
+        unusual = self.create_year()
+        self.create_transaction(self.food, 1000, 1, year=2020)
+
+        report = reports.yearly_report(self.user.id, 2021)
+
+        self.assertEqual(report['income'], 24000)
+        self.assertEqual(report['expenses'], 6000 + 12 * 33 + 400)
+        self.assertEqual(report['net'], report['income'] - report['expenses'])
+        self.assertEqual(report['monthly_expenses'][0], 533)
+        self.assertEqual(report['monthly_expenses'][11], 933)
+
+        rent, food = report['categories']
+        self.assertEqual((rent['category'], rent['count'], rent['median']),
+                         ('rent', 12, 500.0))
+        self.assertEqual(rent['spike_months'], [])
+        self.assertEqual(food['count'], 37)
+        self.assertEqual(food['spike_months'], [12])
+        self.assertEqual(food['median'], 11.0)
+        self.assertEqual([a['id'] for a in report['anomalies']],
+                         [unusual.id])
+        self.assertEqual(report['anomalies'][0]['month'], 12)
+
+    def test_empty_report(self):
+        # Test a year without transactions
+        report = reports.yearly_report(self.user.id, 2021)
+        self.assertEqual(report['expenses'], 0)
+        self.assertEqual(report['categories'], [])
+        self.assertEqual(report['monthly_expenses'], [0] * 12)
+
+    def test_report_endpoint(self):
+        # Test the report of the requested year is returned
+        self.create_year()
+        response = self.client.get(REPORT_URL, {'year': 2021})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['year'], 2021)
+        self.assertEqual(response.data['income'], 24000)
+
+        response = self.client.get(REPORT_URL, {'year': 'last'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_report_year_out_of_range(self):
+        # Test years no date can have are rejected
+        for year in (0, -1, 10000):
+            response = self.client.get(REPORT_URL, {'year': year})
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+            self.assertIn('year', response.data)
+
+    def test_generate_reports(self):
+        # Test the command writes one file per user with transactions
+        self.create_year()
+        User.objects.create_user(email='other@email.com',
+                                 password='password123')
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+
+        out = StringIO()
+        call_command('generate_reports', year=2021, workers=1,
+                     output_dir=output_dir, stdout=out)
+
+        self.assertEqual(os.listdir(output_dir), [f'{self.user.id}.json'])
+        with open(os.path.join(output_dir, f'{self.user.id}.json')) as f:
+            self.assertEqual(json.load(f)['income'], 24000)
+        self.assertIn('Wrote 1 reports for 2021', out.getvalue())
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Category, Flow, Transaction, Wallet
+from api.series import downsample
+
+User = get_user_model()
+SERIES_URL = reverse('api:wallet-balance-series')
+
+
+class BalanceSeriesTests(TestCase):
+    # Test the wallet balance over time endpoint
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.cash = Wallet.objects.create(
+            user=self.user, name='cash', currency='EUR', balance=100)
+        self.bank = Wallet.objects.create(
+            user=self.user, name='bank', currency='EUR', balance=0)
+        self.category = Category.objects.create(user=self.user, name='misc')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, wallet, flow, ammount, date):
+        return Transaction.objects.create(
+            user=self.user, wallet=wallet, flow=flow, ammount=ammount,
+            date=date, category=self.category)
+
+    def test_downsample_keeps_last_point(self):
+        # Test downsampling spreads points and ends on the last one
+        self.assertEqual(downsample(3, 5), [0, 1, 2])
+        self.assertEqual(downsample(10, 4), [0, 3, 6, 9])
+        self.assertEqual(downsample(10, 1), [9])
+
+    def test_monthly_balance_series(self):
+        # Test running balances per wallet and in total
+        self.create_transaction(self.cash, Flow.EXPENSES, 30,
+                                datetime(2021, 1, 5))
+        self.create_transaction(self.cash, Flow.EXPENSES, 20,
+                                datetime(2021, 1, 20))
+        self.create_transaction(self.bank, Flow.INCOME, 500,
+                                datetime(2021, 2, 1))
+        self.create_transaction(self.cash, Flow.INCOME, 10,
+                                datetime(2021, 3, 3))
+
+        response = self.client.get(SERIES_URL, {'interval': 'month'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['dates']), 3)
+        self.assertEqual(response.data['dates'][0], datetime(2021, 1, 1))
+        balances = {wallet['name']: wallet['balances']
+                    for wallet in response.data['wallets']}
+        self.assertEqual(balances['cash'], [50, 50, 60])
+        self.assertEqual(balances['bank'], [0, 500, 500])
+        self.assertEqual(response.data['total'], [50, 550, 560])
+
+    def test_balance_series_downsampled(self):
+        # Test the number of points is capped by the points parameter
+        for day in range(1, 11):
+            self.create_transaction(self.cash, Flow.INCOME, 1,
+                                    datetime(2021, 1, day))
+
+        response = self.client.get(SERIES_URL, {'points': 4})
+
+        self.assertEqual(len(response.data['dates']), 4)
+        self.assertEqual(response.data['total'], [101, 104, 107, 110])
+
+    def test_balance_series_invalid_interval(self):
+        # Test an unknown interval is a bad request
+        response = self.client.get(SERIES_URL, {'interval': 'hour'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
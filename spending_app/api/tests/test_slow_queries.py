@@ -0,0 +1,122 @@
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api import slow_queries
+from api.models import SlowQuery, Wallet
+
+User = get_user_model()
+
+TRANSACTIONS_URL = reverse('api:transaction-list')
+
+
+class SlowQueryTests(TestCase):
+    # Test recording queries over the slow query threshold
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_normalize(self):
+        # Test IN lists of any length share a fingerprint
+        self.assertEqual(
+            slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            slow_queries.fingerprint('SELECT * FROM t  WHERE id IN (%s)'))
+        self.assertEqual(
+            slow_queries.normalize('SELECT 1\n FROM t WHERE a IN (%s,%s)'),
+            'SELECT 1 FROM t WHERE a IN (%s, ...)')
+
+    @override_settings(SLOW_QUERY_THRESHOLD=None)
+    def test_disabled(self):
+        # Test nothing is recorded without a threshold
+        with connection.execute_wrapper(slow_queries.recorder):
+            Wallet.objects.count()
+        self.assertFalse(SlowQuery.objects.exists())
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    @patch.object(slow_queries, 'logger')
+    def test_slow_query_recorded(self, logger):
+        # Test slow queries are stored with the code that ran them
+        with self.captureOnCommitCallbacks(execute=True), \
+                connection.execute_wrapper(slow_queries.recorder):
+            Wallet.objects.count()
+            Wallet.objects.count()
+
+        query = SlowQuery.objects.get(sql__contains='api_wallet')
+        self.assertEqual(query.calls, 2)
+        self.assertGreaterEqual(query.total_time, query.max_time)
+        self.assertIn('api/tests/test_slow_queries.py', query.origin)
+        self.assertEqual(query.explain, '')
+        data = logger.warning.call_args.kwargs['extra']['data']
+        self.assertIn('api_wallet', data['sql'])
+        self.assertEqual(data['database'], 'default')
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    @patch.object(slow_queries, 'logger')
+    def test_view_origin(self, logger):
+        # Test the stack of a request includes the view
+        with self.captureOnCommitCallbacks(execute=True), \
+                connection.execute_wrapper(slow_queries.recorder):
+            self.client.get(TRANSACTIONS_URL)
+        stacks = '\n'.join(SlowQuery.objects.values_list('stack', flat=True))
+        self.assertIn('api/views.py', stacks)
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    @patch.object(slow_queries, 'logger')
+    def test_recorded_after_commit(self, logger):
+        # Test slow queries are stored once the transaction commits, not
+        # in the transaction that ran them
+        with self.captureOnCommitCallbacks() as callbacks, \
+                connection.execute_wrapper(slow_queries.recorder):
+            Wallet.objects.count()
+        self.assertFalse(SlowQuery.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(SlowQuery.objects.filter(
+            sql__contains='api_wallet').exists())
+
+    @override_settings(SLOW_QUERY_EXPLAIN_SAMPLE_RATE=1)
+    def test_explain_postgresql(self):
+        # Test sampled SELECTs are explained on PostgreSQL only
+        pg = MagicMock(vendor='postgresql', alias='default')
+        cursor = pg.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [('Seq Scan on t',), ('Buffers: 1',)]
+
+        plan = slow_queries.explain(pg, 'SELECT * FROM t WHERE a = %s', [1])
+        self.assertEqual(plan, 'Seq Scan on t\nBuffers: 1')
+        cursor.execute.assert_called_once_with(
+            'EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM t WHERE a = %s', [1])
+        self.assertEqual(slow_queries.explain(pg, 'DELETE FROM t', []), '')
+        self.assertEqual(
+            slow_queries.explain(connection, 'SELECT 1', []), '')
+
+    @override_settings(SLOW_QUERY_THRESHOLD=10 ** 6)
+    def test_fast_query_ignored(self):
+        # Test queries under the threshold are not recorded
+        with connection.execute_wrapper(slow_queries.recorder):
+            Wallet.objects.count()
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+class SlowQueryAdminTests(TestCase):
+    # Test the slow query admin page
+
+    def test_changelist(self):
+        # Test the top offenders are listed
+        admin = User.objects.create_superuser(
+            email='admin@email.com', password='password123')
+        self.client.force_login(admin)
+        SlowQuery.objects.create(
+            fingerprint='a' * 40, sql='SELECT 1', origin='api/views.py:1',
+            calls=2, total_time=500, max_time=300)
+        response = self.client.get(
+            reverse('admin:api_slowquery_changelist'))
+        self.assertContains(response, 'api/views.py:1')
+        self.assertContains(response, '250.0')
@@ -0,0 +1,134 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from api.models import Category, Flow, Transaction, Wallet
+from api.statements import write_statement
+
+User = get_user_model()
+
+
+class StatementTests(TestCase):
+    # Test writing monthly statements to media storage
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(
+            MEDIA_ROOT=self.media,
+            REPORT_DIR=os.path.join(self.media, 'reports'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.checkpoint = os.path.join(self.media, 'checkpoint')
+
+        self.users = [User.objects.create_user(
+            email=f'test{i}@email.com', password='password123')
+            for i in range(3)]
+        for user in self.users:
+            wallet = Wallet.objects.create(
+                user=user, name='cash', currency='EUR')
+            category = Category.objects.create(user=user, name='food')
+            for day, ammount, flow in ((2, 10, Flow.EXPENSES),
+                                       (1, 100, Flow.INCOME)):
+                Transaction.objects.create(
+                    user=user, wallet=wallet, category=category, flow=flow,
+                    ammount=ammount, note='lunch, "work"',
+                    date=datetime(2021, 9, day))
+            Transaction.objects.create(
+                user=user, wallet=wallet, category=category, ammount=5,
+                flow=Flow.EXPENSES,
+                date=datetime(2021, 10, 1))
+
+    def path(self, user, extension):
+        return os.path.join(self.media, 'statements', '2021-09',
+                            f'{user.id}.{extension}')
+
+    def generate(self, *args):
+        out = StringIO()
+        call_command('generate_statements', '--month', '2021-09',
+                     '--workers', '1', '--chunk-size', '2',
+                     '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_write_statement(self):
+        # Test the CSV and JSON files hold the month's transactions in order
+        user = self.users[0]
+        self.assertEqual(write_statement(user.id, date(2021, 9, 1)), 2)
+
+        with open(self.path(user, 'csv'), newline='') as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([row['ammount'] for row in rows], ['100', '10'])
+        self.assertEqual(rows[0]['flow'], 'income')
+        self.assertEqual(rows[0]['note'], 'lunch, "work"')
+
+        with open(self.path(user, 'json')) as file:
+            statement = json.load(file)
+        self.assertEqual(statement['month'], '2021-09')
+        self.assertEqual(len(statement['transactions']), 2)
+        self.assertEqual(statement['transactions'][1]['category'], 'food')
+        self.assertEqual(statement['totals'],
+                         {'income': 100, 'expenses': 10, 'count': 2})
+
+    def test_rerun_replaces_files(self):
+        # Test writing again overwrites the statement instead of a copy
+        user = self.users[0]
+        write_statement(user.id, date(2021, 9, 1), ['csv'])
+        write_statement(user.id, date(2021, 9, 1), ['csv'])
+        self.assertEqual(os.listdir(os.path.dirname(self.path(user, 'csv'))),
+                         [f'{user.id}.csv'])
+
+    def test_generate_statements(self):
+        # Test every user gets statements and is recorded in the checkpoint
+        output = self.generate()
+
+        self.assertIn('3/3 users, 6 transactions', output)
+        for user in self.users:
+            self.assertTrue(os.path.exists(self.path(user, 'csv')))
+            self.assertTrue(os.path.exists(self.path(user, 'json')))
+        with open(self.checkpoint) as file:
+            self.assertEqual(sorted(int(line) for line in file),
+                             sorted(user.id for user in self.users))
+
+    def test_resume_skips_finished_users(self):
+        # Test a rerun only handles users missing from the checkpoint
+        with open(self.checkpoint, 'w') as file:
+            file.write(f'{self.users[0].id}\n{self.users[1].id}\n')
+
+        output = self.generate('--formats', 'json')
+
+        self.assertIn('Resuming, 2 users already done', output)
+        self.assertIn('1/1 users', output)
+        self.assertFalse(os.path.exists(self.path(self.users[0], 'json')))
+        self.assertTrue(os.path.exists(self.path(self.users[2], 'json')))
+        self.assertFalse(os.path.exists(self.path(self.users[2], 'csv')))
+
+        self.generate('--restart')
+        self.assertTrue(os.path.exists(self.path(self.users[0], 'csv')))
+
+    def test_resume_with_transactions_without_user(self):
+        # Test transactions without a user are skipped, so the checkpoint
+        # only lists user ids
+        wallet = Wallet.objects.create(
+            user=self.users[0], name='card', currency='EUR')
+        Transaction.objects.create(
+            wallet=wallet, category=Category.objects.first(), ammount=1,
+            flow=Flow.EXPENSES, date=datetime(2021, 9, 3))
+
+        self.assertIn('3/3 users', self.generate())
+        self.assertIn('Resuming, 3 users already done', self.generate())
+
+    def test_default_checkpoint_in_report_dir(self):
+        # Test the checkpoint is kept next to the reports by default
+        call_command('generate_statements', '--month', '2021-09',
+                     '--workers', '1', stdout=StringIO())
+        path = os.path.join(self.media, 'reports', 'statements',
+                            '2021-09.checkpoint')
+        with open(path) as file:
+            self.assertEqual(len(file.readlines()), 3)
@@ -3,11 +3,12 @@ from rest_framework.test import APIClient
 from django.urls import reverse
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from api.models import Tag
+from api.models import Category, Flow, Tag, Transaction, Wallet
 from api.serializers import TagSerializer
 
 User = get_user_model()
 TAG_URL = reverse('api:tag-list')
+AUTOCOMPLETE_URL = reverse('api:tag-autocomplete')
 
 
 class PublicTagApiTests(TestCase):
@@ -63,3 +64,83 @@ class PrivateTagApiTests(TestCase):
         payload = {'name': ''}
         response = self.client.post(TAG_URL, payload)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def create_transaction(self, *tags):
+        # Create a transaction with the given tags
+        wallet, _ = Wallet.objects.get_or_create(
+            user=self.user, name='testwallet', currency='EUR')
+        category, _ = Category.objects.get_or_create(
+            user=self.user, name='food')
+        transaction = Transaction.objects.create(
+            user=self.user,
+            flow=Flow.EXPENSES,
+            date='2021-09-02T14:07:09',
+            wallet=wallet,
+            category=category,
+            ammount=5,
+        )
+        transaction.tags.add(*tags)
+        return transaction
+
+    def test_usage_count_follows_transactions(self):
+        # Test the tag usage counter is kept in sync with transactions
+        tag = Tag.objects.create(name='groceries', user=self.user)
+        transaction = self.create_transaction(tag)
+        self.create_transaction(tag)
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 2)
+
+        transaction.tags.clear()
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 1)
+
+        Transaction.objects.all().delete()
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 0)
+
+    def test_tag_ids_follow_tags(self):
+        # Test the denormalized tag ids are kept in sync with the tags
+        first = Tag.objects.create(name='groceries', user=self.user)
+        second = Tag.objects.create(name='weekly', user=self.user)
+        transaction = self.create_transaction(second, first)
+        self.assertEqual(transaction.tag_ids, [first.pk, second.pk])
+
+        transaction.tags.remove(second)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.tag_ids, [first.pk])
+
+        second.transaction_set.add(transaction)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.tag_ids, [first.pk, second.pk])
+
+        first.delete()
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.tag_ids, [second.pk])
+
+        second.transaction_set.clear()
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.tag_ids, [])
+
+    def test_autocomplete_ranked_by_usage(self):
+        # Test autocomplete returns matching tags, most used first
+        rare = Tag.objects.create(name='Gifts', user=self.user)
+        common = Tag.objects.create(name='groceries', user=self.user)
+        Tag.objects.create(name='rent', user=self.user)
+        self.create_transaction(common)
+        self.create_transaction(common, rare)
+
+        response = self.client.get(AUTOCOMPLETE_URL, {'prefix': 'g'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in response.data], ['groceries', 'Gifts'])
+        self.assertEqual(response.data[0]['usage_count'], 2)
+
+        response = self.client.get(
+            AUTOCOMPLETE_URL, {'prefix': 'g', 'limit': 1})
+        self.assertEqual(len(response.data), 1)
+
+    def test_autocomplete_invalid_limit(self):
+        # Test autocomplete rejects a non numeric limit
+        response = self.client.get(AUTOCOMPLETE_URL, {'limit': 'many'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,179 @@
+from concurrent.futures import Executor, Future
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api import tasks
+from api.models import Task, TaskStatus
+
+calls = []
+
+
+@tasks.task
+def record_call(value):
+    calls.append(value)
+
+
+@tasks.task
+def always_fail():
+    raise RuntimeError('boom')
+
+
+@tasks.task
+def lose_lease():
+    # Another worker claims this task again while it is still running
+    Task.objects.filter(name__endswith='lose_lease').update(
+        started=timezone.now() + timedelta(minutes=1))
+
+
+def not_a_task():
+    pass
+
+
+class InlineExecutor(Executor):
+    # Runs submitted calls right away so they share the test transaction
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+class TaskQueueTests(TestCase):
+    # Test queueing and running background tasks
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        # Test a queued task runs once and is marked done
+        task = record_call.delay(5)
+        self.assertEqual(task.status, TaskStatus.PENDING)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(tasks.run_pending(), [TaskStatus.DONE])
+        self.assertEqual(tasks.run_pending(), [])
+        self.assertEqual(calls, [5])
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_tasks_run_immediately(self):
+        # Test eager mode skips the queue
+        self.assertIsNone(record_call.delay(7))
+        self.assertEqual(calls, [7])
+        self.assertFalse(Task.objects.exists())
+
+    def test_delayed_task_waits_for_run_at(self):
+        # Test tasks are not run before their scheduled time
+        tasks.enqueue(record_call, 1,
+                      run_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(tasks.run_pending(), [])
+
+    @override_settings(TASK_RETRY_BACKOFF=10)
+    def test_failed_task_retried_with_backoff(self):
+        # Test failures are retried later and give up after max attempts
+        task = always_fail.delay()
+        Task.objects.filter(pk=task.pk).update(max_attempts=2)
+
+        self.assertEqual(tasks.run_pending(), [TaskStatus.PENDING])
+        task.refresh_from_db()
+        self.assertIn('boom', task.last_error)
+        self.assertGreater(task.run_at, timezone.now())
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        self.assertEqual(tasks.run_pending(), [TaskStatus.FAILED])
+
+    def test_retry_delay_grows_exponentially(self):
+        # Test the backoff doubles and is capped
+        with self.settings(TASK_RETRY_BACKOFF=5, TASK_RETRY_MAX_DELAY=30):
+            self.assertEqual(
+                [tasks.retry_delay(n) for n in range(1, 6)],
+                [5, 10, 20, 30, 30])
+
+    def test_only_registered_functions_run(self):
+        # Test rows naming other functions fail instead of running them
+        task = Task.objects.create(
+            name='api.tests.test_tasks.not_a_task', run_at=timezone.now(),
+            max_attempts=1)
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatus.FAILED)
+
+    def test_only_expired_leases_requeued(self):
+        # Test tasks of live workers stay running, abandoned ones are queued
+        live = record_call.delay(1)
+        dead = record_call.delay(2)
+        tasks.claim(2)
+        Task.objects.filter(pk__in=[live.pk, dead.pk]).update(
+            started=timezone.now() - timedelta(hours=1),
+            lease_expires=timezone.now() - timedelta(seconds=1))
+        tasks.renew([live.pk])
+
+        self.assertEqual(tasks.requeue_stale(), 1)
+        live.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(live.status, TaskStatus.RUNNING)
+        self.assertEqual(dead.status, TaskStatus.PENDING)
+        self.assertIsNone(dead.lease_expires)
+
+    def test_requeued_task_not_overwritten(self):
+        # Test a worker finishing after losing its lease leaves the task to
+        # the worker that claimed it again
+        task = lose_lease.delay()
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatus.RUNNING)
+
+    def test_queue_stats(self):
+        # Test queue depth counts pending tasks
+        record_call.delay(1)
+        record_call.delay(2)
+        stats = tasks.queue_stats()
+        self.assertEqual(stats['depth'], 2)
+        self.assertGreaterEqual(stats['oldest_due_seconds'], 0)
+
+    @patch('api.management.commands.run_worker.ThreadPoolExecutor',
+           InlineExecutor)
+    @patch('api.management.commands.run_worker.connection')
+    def test_run_worker_once(self, connection):
+        # Test the worker drains due tasks and exits with --once
+        record_call.delay(3)
+        out = StringIO()
+        call_command('run_worker', '--once', '--concurrency', '1',
+                     stdout=out)
+        self.assertEqual(calls, [3])
+        self.assertIn('Processed 1 tasks, 0 pending', out.getvalue())
+
+    @patch('api.management.commands.run_worker.ThreadPoolExecutor',
+           InlineExecutor)
+    @patch('api.management.commands.run_worker.connection')
+    def test_run_worker_survives_database_errors(self, connection):
+        # Test a task whose bookkeeping fails is left to its lease while
+        # the worker goes on with the queue
+        broken = record_call.delay(1)
+        record_call.delay(2)
+        run = tasks.run
+
+        def flaky_run(task_id):
+            if task_id == broken.pk:
+                raise DatabaseError('connection lost')
+            return run(task_id)
+
+        with patch.object(tasks, 'run', flaky_run), \
+                self.assertLogs('api.management.commands.run_worker'):
+            call_command('run_worker', '--once', '--concurrency', '1',
+                         stdout=StringIO())
+        self.assertEqual(calls, [2])
+        broken.refresh_from_db()
+        self.assertEqual(broken.status, TaskStatus.RUNNING)
+        self.assertIsNotNone(broken.lease_expires)
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import admission, metrics, throttling
+
+User = get_user_model()
+TRANSACTION_URL = reverse('api:transaction-list')
+METRICS_URL = reverse('api:metrics')
+REPORT_URL = reverse('api:transaction-report')
+
+
+class TokenBucketTests(TestCase):
+    # Test the token bucket primitives
+
+    def test_parse_rate(self):
+        # Test rates are turned into capacity and tokens per second
+        self.assertEqual(throttling.parse_rate('60/min'), (60, 1))
+        self.assertEqual(throttling.parse_rate('10/s'), (10, 10))
+
+    def test_bucket_refills_over_time(self):
+        # Test an empty bucket waits until a token is refilled
+        buckets = throttling.LocalBuckets()
+        with patch('time.monotonic', return_value=100.0):
+            self.assertEqual(buckets.take('key', 2, 1), 0)
+            self.assertEqual(buckets.take('key', 2, 1), 0)
+            self.assertAlmostEqual(buckets.take('key', 2, 1), 1)
+        with patch('time.monotonic', return_value=101.0):
+            self.assertEqual(buckets.take('key', 2, 1), 0)
+
+
+class RateLimitApiTests(TestCase):
+    # Test rate limits and admission control on the api
+
+    def setUp(self):
+        throttling.local_buckets.buckets.clear()
+        admission._semaphores.clear()
+        metrics.reset()
+        self.user = User.objects.create_user(
+            email='test@email.com', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(RATE_LIMITS={'user': '100/min', 'search': '1/min'})
+    def test_search_rate_limited(self):
+        # Test searches over the limit get a 429 with Retry-After
+        first = self.client.get(TRANSACTION_URL, {'keyword': 'food'})
+        second = self.client.get(TRANSACTION_URL, {'keyword': 'food'})
+        plain = self.client.get(TRANSACTION_URL)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(second['Retry-After'], '60')
+        self.assertEqual(plain.status_code, status.HTTP_200_OK)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['throttle.rejected.search'], 1)
+
+    @override_settings(CONCURRENCY_LIMITS={'search': 1},
+                       CONCURRENCY_QUEUE_TIMEOUT=0)
+    def test_search_rejected_when_busy(self):
+        # Test searches are turned away while all slots are taken
+        slot = admission.acquire('search')
+        response = self.client.get(TRANSACTION_URL, {'keyword': 'food'})
+        slot.release()
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        response = self.client.get(TRANSACTION_URL, {'keyword': 'food'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(CONCURRENCY_LIMITS={'report': 1},
+                       CONCURRENCY_QUEUE_TIMEOUT=0)
+    def test_slot_released_when_handler_raises(self):
+        # Test a crashing request gives its slot back
+        self.client.raise_request_exception = False
+        with patch('api.views.yearly_report', side_effect=RuntimeError):
+            for _ in range(2):
+                response = self.client.get(REPORT_URL, {'year': 2021})
+                self.assertEqual(response.status_code,
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = self.client.get(REPORT_URL, {'year': 2021})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(admission.get_semaphore('report')._value, 1)
+
+    def test_metrics_staff_only(self):
+        # Test only staff users can read the metrics
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('counters', response.data)
@@ -6,7 +6,7 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from api.models import Transaction, Wallet, Tag
+from api.models import Category, Flow, Transaction, Wallet, Tag
 from api.serializers import TransactionSerializer, TransactionDetailSerializer
 
 TRANSACTION_URL = reverse('api:transaction-list')
@@ -29,6 +29,11 @@ def create_sample_tag(user, name):
     return Tag.objects.create(user=user, name=name)
 
 
+def create_sample_category(user, name):
+    # Creates or returns a sample category
+    return Category.objects.get_or_create(user=user, name=name)[0]
+
+
 class PublicTransactionsApiTests(TestCase):
     # Test the publicly available Transaction API
 
@@ -56,19 +61,19 @@ class PrivateTransactionsApiTests(TestCase):
         # Test retrieving transactions
         Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-10-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             note='gas',
             ammount=5,
         )
         Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             note='gas',
             ammount=5,
         )
@@ -80,14 +85,36 @@ class PrivateTransactionsApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, serializer.data)
 
+    def test_retrieve_transactions_columnar(self):
+        # Test listing transactions as dictionary encoded columns
+        for category in ('car', 'food', 'car'):
+            Transaction.objects.create(
+                user=self.user,
+                flow=Flow.EXPENSES,
+                date='2021-10-02T14:07:09',
+                wallet=self.wallet,
+                category=create_sample_category(self.user, category),
+                ammount=5,
+            )
+
+        response = self.client.get(TRANSACTION_URL, {'format': 'columnar'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        columns = response.json()['columns']
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(columns['ammount'], [5, 5, 5])
+        self.assertEqual(columns['category']['dictionary'], ['car', 'food'])
+        self.assertEqual(columns['category']['codes'], [0, 1, 0])
+        self.assertEqual(columns['flow']['dictionary'], ['expenses'])
+
     def test_view_transaction_details(self):
         # Test to view transaction details
         transaction = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             ammount=5,
         )
         transaction.tags.add(create_sample_tag(self.user, 'baigna'))
@@ -102,26 +129,27 @@ class PrivateTransactionsApiTests(TestCase):
             email='test2@email.com', password='password123')
         Transaction.objects.create(
             user=user2,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(user2, 'car'),
             note='gas',
             ammount=5,
         )
         transaction = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='food',
+            category=create_sample_category(self.user, 'food'),
             note='salad',
             ammount=5,
         )
         response = self.client.get(TRANSACTION_URL)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['category'], transaction.category)
+        self.assertEqual(response.data[0]['category'],
+                         transaction.category.name)
 
     def test_create_transaction_successful(self):
         # Test create transaction successful
@@ -163,6 +191,39 @@ class PrivateTransactionsApiTests(TestCase):
         self.assertEqual(len(tags), 2)
         self.assertIn(tag1, tags)
 
+    def test_create_transaction_reuses_category(self):
+        # Test categories are stored once per user and returned by name
+        category = create_sample_category(self.user, 'food')
+        payload = {
+            "flow": "income",
+            "date": "2021-09-02T14:07:09",
+            "wallet": self.wallet.id,
+            "category": "food",
+            "ammount": 5,
+        }
+
+        response = self.client.post(TRANSACTION_URL, payload)
+
+        transaction = Transaction.objects.get(id=response.data['id'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['category'], 'food')
+        self.assertEqual(response.data['flow'], 'income')
+        self.assertEqual(transaction.category, category)
+        self.assertEqual(transaction.flow, Flow.INCOME)
+        self.assertEqual(Category.objects.filter(user=self.user).count(), 1)
+
+    def test_create_transaction_invalid_flow(self):
+        # Test creating a transaction with an unknown flow fails
+        payload = {
+            'flow': 'sideways',
+            'date': '2021-09-02T14:07:09',
+            'wallet': self.wallet.id,
+            'category': 'food',
+            'ammount': 5,
+        }
+        response = self.client.post(TRANSACTION_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_transaction_invalid(self):
         # Creating a new tag with invalid payload
         payload = {
@@ -180,10 +241,10 @@ class PrivateTransactionsApiTests(TestCase):
         # Test updating a transaction with patch
         transaction = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             ammount=5,
         )
         transaction.tags.add(create_sample_tag(user=self.user, name='testtag'))
@@ -194,7 +255,7 @@ class PrivateTransactionsApiTests(TestCase):
         self.client.patch(url, payload)
 
         transaction.refresh_from_db()
-        self.assertEqual(transaction.category, payload['category'])
+        self.assertEqual(transaction.category.name, payload['category'])
         tags = transaction.tags.all()
         self.assertEqual(len(tags), 1)
         self.assertIn(new_tag, tags)
@@ -203,10 +264,10 @@ class PrivateTransactionsApiTests(TestCase):
         # Test updating a transaction with put
         transaction = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             ammount=5,
         )
         transaction.tags.add(create_sample_tag(user=self.user, name='testtag'))
@@ -221,7 +282,7 @@ class PrivateTransactionsApiTests(TestCase):
         self.client.put(url, payload)
         transaction.refresh_from_db()
         self.assertEqual(transaction.ammount, payload['ammount'])
-        self.assertEqual(transaction.flow, payload['flow'])
+        self.assertEqual(transaction.get_flow_display(), payload['flow'])
         tags = transaction.tags.all()
 
         self.assertEqual(len(tags), 0)
@@ -230,19 +291,19 @@ class PrivateTransactionsApiTests(TestCase):
         # Test returning transactions with filtered notes,categorys or tags
         transaction1 = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='food',
+            category=create_sample_category(self.user, 'food'),
             ammount=40,
         )
         transaction2 = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
             note='testnote1',
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             ammount=50,
         )
 
@@ -260,7 +321,8 @@ class PrivateTransactionsApiTests(TestCase):
         # Test filter by category
         self.assertEqual(response2.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response2.data), 1)
-        self.assertEqual(response2.data[0]['category'], transaction1.category)
+        self.assertEqual(response2.data[0]['category'],
+                         transaction1.category.name)
 
         response3 = self.client.get(TRANSACTION_URL, {'keyword': 'testnote'})
         # Test filter by notes
@@ -268,22 +330,68 @@ class PrivateTransactionsApiTests(TestCase):
         self.assertEqual(len(response3.data), 1)
         self.assertEqual(response3.data[0]['note'], transaction2.note)
 
+    def test_filter_transactions_by_tags(self):
+        # Test filtering transactions having all of the given tags
+        food = create_sample_category(self.user, 'food')
+        first = create_sample_tag(user=self.user, name='first')
+        second = create_sample_tag(user=self.user, name='second')
+        transactions = [Transaction.objects.create(
+            user=self.user,
+            flow=Flow.EXPENSES,
+            date='2021-09-02T14:07:09',
+            wallet=self.wallet,
+            category=food,
+            ammount=ammount,
+        ) for ammount in (10, 20, 30)]
+        transactions[0].tags.add(first, second)
+        transactions[1].tags.add(first)
+
+        response1 = self.client.get(TRANSACTION_URL,
+                                    {'tags': f'{first.pk},{second.pk}'})
+        response2 = self.client.get(TRANSACTION_URL, {'tags': first.pk})
+        response3 = self.client.get(TRANSACTION_URL, {'tags': 'first'})
+
+        self.assertEqual([item['ammount'] for item in response1.data], [10])
+        self.assertEqual(response1.data[0]['tags'], [first.pk, second.pk])
+        self.assertEqual(len(response2.data), 2)
+        self.assertEqual(response3.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_reads_tags_without_join(self):
+        # Test listing tagged transactions is a single query
+        food = create_sample_category(self.user, 'food')
+        tag = create_sample_tag(user=self.user, name='tag')
+        for _ in range(5):
+            Transaction.objects.create(
+                user=self.user,
+                flow=Flow.EXPENSES,
+                date='2021-09-02T14:07:09',
+                wallet=self.wallet,
+                category=food,
+                ammount=10,
+            ).tags.add(tag)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(TRANSACTION_URL)
+
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]['tags'], [tag.pk])
+
     def test_filter_transactions_invalid(self):
         # Test returning recipes with specific tags
         transaction1 = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='food',
+            category=create_sample_category(self.user, 'food'),
             ammount=40,
         )
         transaction2 = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=self.wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             ammount=50,
         )
 
@@ -309,10 +417,10 @@ class RecipeImageUploadTests(TestCase):
             user=self.user, name='testwallet', currency='EUR', balance=100)
         self.transaction = Transaction.objects.create(
             user=self.user,
-            flow='expenses',
+            flow=Flow.EXPENSES,
             date='2021-09-02T14:07:09',
             wallet=wallet,
-            category='car',
+            category=create_sample_category(self.user, 'car'),
             ammount=5,
         )
 
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600,
+           'd': 86400, 'day': 86400}
+# Drop idle local buckets once this many users have one
+MAX_LOCAL_BUCKETS = 10000
+
+
+def parse_rate(rate):
+    # '60/min' -> (60 tokens capacity, 1 token per second)
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period]
+
+
+class LocalBuckets:
+    # Token buckets kept in this process's memory
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key, capacity, refill_rate):
+        # Take one token, return 0 or the seconds until one is available
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / refill_rate
+            self.buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self.buckets) > MAX_LOCAL_BUCKETS:
+                self.prune(now, capacity / refill_rate)
+        return wait
+
+    def prune(self, now, refill_time):
+        # Buckets idle long enough to be full again carry no state
+        self.buckets = {
+            key: (tokens, updated)
+            for key, (tokens, updated) in self.buckets.items()
+            if now - updated < refill_time
+        }
+
+
+class CacheBuckets:
+    # Token buckets shared between processes through a Django cache.
+    # Updates are not atomic, so concurrent requests may overshoot a bit.
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, capacity, refill_rate):
+        cache = caches[self.alias]
+        now = time.time()
+        tokens, updated = cache.get(f'rate-limit:{key}', (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / refill_rate
+        cache.set(f'rate-limit:{key}', (tokens - 1 if not wait else tokens,
+                                        now), int(capacity / refill_rate) + 1)
+        return wait
+
+
+local_buckets = LocalBuckets()
+
+
+def get_buckets():
+    alias = getattr(settings, 'RATE_LIMIT_CACHE', None)
+    return CacheBuckets(alias) if alias else local_buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # Base token bucket throttle, rates come from settings.RATE_LIMITS.
+    # Subclasses set scope or override get_scope, like DRF's throttles.
+    scope = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        rate = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+        if scope is None or rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = f'user-{request.user.pk}'
+        else:
+            ident = f'ip-{self.get_ident(request)}'
+        self.wait_time = get_buckets().take(
+            f'{scope}:{ident}', *parse_rate(rate))
+        if self.wait_time:
+            metrics.incr(f'throttle.rejected.{scope}')
+            return False
+        metrics.incr(f'throttle.allowed.{scope}')
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    # Limit every user across all endpoints
+    scope = 'user'
+
+
+class EndpointRateThrottle(TokenBucketThrottle):
+    # Limit every user per endpoint scope, see view.get_throttle_scope
+    def get_scope(self, view):
+        get_scope = getattr(view, 'get_throttle_scope', None)
+        if get_scope is not None:
+            return get_scope()
+        return getattr(view, 'throttle_scope', None)
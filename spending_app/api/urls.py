@@ -1,15 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import TransactionViewSet, WalletViewSet, TagViewSet
+from .views import (TransactionViewSet, WalletViewSet, TagViewSet,
+                    CategoryViewSet, RecurringTransactionViewSet,
+                    BudgetViewSet, DashboardView, MetricsView)
 
 router = DefaultRouter()
 router.register('transactions', TransactionViewSet)
 router.register('wallets', WalletViewSet)
 router.register('tags', TagViewSet)
+router.register('categories', CategoryViewSet)
+router.register('recurring', RecurringTransactionViewSet)
+router.register('budgets', BudgetViewSet)
 
 app_name = 'api'
 
 urlpatterns = [
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls))
 ]
@@ -1,16 +1,170 @@
+from datetime import MAXYEAR, MINYEAR
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.functions import Lower
+from django.utils import timezone
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
+from rest_framework.views import APIView
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
+                                        SAFE_METHODS)
+from rest_framework.settings import api_settings
 
-from .models import Tag, Transaction, Wallet
+from . import (admission, audit, categorizer, dashboard, db_router,
+               deletion, metrics, profiling, records, tasks)
+from .currency import ExchangeRateMissing, convert_amounts
+from .idempotency import idempotent
+from .reports import yearly_report
+from .series import INTERVALS, balance_series
+from .models import (AuditAction, Budget, Category, RecurringTransaction,
+                     Tag, Transaction, Wallet)
+from .renderers import ColumnarJSONRenderer
 from .serializers import (TransactionImageSerializer, TransactionSerializer,
                           WalletSerializer, TagSerializer,
-                          TransactionDetailSerializer)
+                          TransactionDetailSerializer, CategorySerializer,
+                          RecurringTransactionSerializer, BudgetSerializer)
+
+
+class AuditMixin:
+    # Queue an audit entry for every write made through the viewset,
+    # perform_create of each viewset calls audit itself
+
+    def audit(self, action, instance, changes=None, pk=None):
+        audit.record(action, instance, pk or instance.pk, self.request.user,
+                     changes)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.audit(AuditAction.UPDATE, serializer.instance,
+                   serializer.validated_data)
+
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        super().perform_destroy(instance)
+        self.audit(AuditAction.DELETE, instance, pk=pk)
+
+
+class ProfilingMixin:
+    # Profile the view and the rendering of requests flagged by staff or
+    # sampled by PROFILE_SAMPLE_RATE, the stats file is named in X-Profile
+    profiler = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.profiler = profiling.start(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if self.profiler is not None:
+            response.render()
+            self.profiler.disable()
+            response['X-Profile'] = profiling.save(self.profiler, request)
+            self.profiler = None
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        # Stop the profiler on every exit, finalize_response is skipped when
+        # the handler raises an unhandled exception
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
+                self.profiler = None
+
+
+class ReplicaReadMixin:
+    # Serve read-only actions from a read replica unless the user just wrote
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        db_router.set_replica_reads(
+            self.action in self.replica_actions and
+            not db_router.is_pinned_to_primary(request.user)
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        db_router.set_replica_reads(False)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            db_router.pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        # Reset the thread on every exit, finalize_response is skipped when
+        # the handler raises an unhandled exception
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            db_router.set_replica_reads(False)
+
+
+class AdmissionControlMixin:
+    # Cap how many expensive requests of a scope run at the same time
+
+    def get_admission_scope(self):
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        self.admission_slot = None
+        super().initial(request, *args, **kwargs)
+        scope = self.get_admission_scope()
+        if scope is not None:
+            self.admission_slot = admission.acquire(scope)
+
+    def dispatch(self, request, *args, **kwargs):
+        # Release the slot on every exit, finalize_response is skipped when
+        # the handler raises an unhandled exception
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if getattr(self, 'admission_slot', None) is not None:
+                self.admission_slot.release()
+                self.admission_slot = None
+
+
+class ConvertedListMixin:
+    # Add amounts converted to ?currency= to list responses. Viewsets set
+    # converted_field and define get_conversion_inputs(objects), returning
+    # parallel lists of amounts, currencies and dates.
+    converted_field = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.converted_field is None or \
+                not hasattr(cls, 'get_conversion_inputs'):
+            raise ImproperlyConfigured(
+                f'{cls.__name__} needs converted_field and '
+                f'get_conversion_inputs')
 
-class BaseSpendingProfileAttrViewSet(viewsets.GenericViewSet,
+    def list(self, request, *args, **kwargs):
+        target = request.query_params.get('currency')
+        if not target:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(queryset, many=True)
+        data = serializer.data
+        try:
+            converted = convert_amounts(
+                *self.get_conversion_inputs(queryset), target)
+        except ExchangeRateMissing as error:
+            return Response(
+                {'currency': [str(error)]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        for row, amount in zip(data, converted):
+            row[self.converted_field] = amount
+        return Response(data)
+
+
+class BaseSpendingProfileAttrViewSet(AuditMixin, ProfilingMixin,
+                                     AdmissionControlMixin, ReplicaReadMixin,
+                                     viewsets.GenericViewSet,
                                      mixins.ListModelMixin,
                                      mixins.CreateModelMixin):
     # Base viewset for spending app user profile attributes
@@ -20,48 +174,185 @@ class BaseSpendingProfileAttrViewSet(viewsets.GenericViewSet,
     def perform_create(self, serializer):
         # Create a new object
         serializer.save(user=self.request.user)
+        self.audit(AuditAction.CREATE, serializer.instance,
+                   serializer.validated_data)
 
 
-class WalletViewSet(BaseSpendingProfileAttrViewSet):
+class WalletViewSet(ConvertedListMixin, BaseSpendingProfileAttrViewSet,
+                    mixins.DestroyModelMixin):
     # Manage wallets in the database
     serializer_class = WalletSerializer
     queryset = Wallet.objects.all()
+    converted_field = 'converted_balance'
+    replica_actions = ('list', 'retrieve', 'balance_series')
+    series_points = 100
+    series_max_points = 1000
+
+    def destroy(self, request, *args, **kwargs):
+        # delete large wallets in the background, small ones right away
+        wallet = self.get_object()
+        self.audit(AuditAction.DELETE, wallet)
+        if deletion.is_large(Transaction.objects.filter(wallet=wallet)):
+            deletion.delete_wallet_task.delay(wallet.pk)
+            return Response(status=status.HTTP_202_ACCEPTED)
+        deletion.delete_wallet(wallet.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_admission_scope(self):
+        return 'series' if self.action == 'balance_series' else None
+
+    def get_throttle_scope(self):
+        return 'series' if self.action == 'balance_series' else None
 
     def get_queryset(self):
         # return all the wallets for the current authenticated user
         return self.queryset.filter(user=self.request.user)\
             .order_by('-balance')
 
+    def get_conversion_inputs(self, wallets):
+        today = timezone.now().date()
+        return ([wallet.balance for wallet in wallets],
+                [wallet.currency for wallet in wallets],
+                [today] * len(wallets))
+
+    @action(methods=['GET'], detail=False, url_path='balance-series')
+    def balance_series(self, request):
+        # return the balance over time of every wallet and their total
+        interval = request.query_params.get('interval', 'day')
+        if interval not in INTERVALS:
+            return Response(
+                {'interval': [f'Choose one of {", ".join(INTERVALS)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            points = int(request.query_params.get(
+                'points', self.series_points))
+        except ValueError:
+            return Response(
+                {'points': ['A valid integer is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        points = max(1, min(points, self.series_max_points))
+
+        wallets = list(self.get_queryset())
+        return Response(balance_series(wallets, interval, points))
+
 
 class TagViewSet(BaseSpendingProfileAttrViewSet):
     # Manage tags in the database
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
+    replica_actions = ('list', 'retrieve', 'autocomplete')
+    autocomplete_limit = 10
+    autocomplete_max_limit = 50
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        # return the most used tags whose name starts with the prefix
+        prefix = request.query_params.get('prefix', '').lower()
+        try:
+            limit = int(request.query_params.get(
+                'limit', self.autocomplete_limit))
+        except ValueError:
+            return Response(
+                {'limit': ['A valid integer is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, self.autocomplete_max_limit))
+
+        tags = self.get_queryset().annotate(name_lower=Lower('name'))\
+            .filter(name_lower__startswith=prefix)\
+            .order_by('-usage_count', 'name')[:limit]
+        serializer = self.get_serializer(tags, many=True)
+        return Response(serializer.data)
+
+
+class CategoryViewSet(BaseSpendingProfileAttrViewSet):
+    # Manage transaction categories in the database
+    serializer_class = CategorySerializer
+    queryset = Category.objects.all()
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user).order_by('name')
+
+    def perform_create(self, serializer):
+        # Category names are unique per user, reuse an existing one
+        serializer.instance, created = Category.objects.get_or_create(
+            user=self.request.user, name=serializer.validated_data['name'])
+        if created:
+            self.audit(AuditAction.CREATE, serializer.instance,
+                       serializer.validated_data)
+
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(AuditMixin, ProfilingMixin, ConvertedListMixin,
+                         AdmissionControlMixin, ReplicaReadMixin,
+                         viewsets.ModelViewSet):
     # Manage transactions in the database
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES,
+                        ColumnarJSONRenderer)
+    columnar_dictionary_fields = ('category', 'flow', 'wallet')
+    converted_field = 'converted_ammount'
+    replica_actions = ('list', 'retrieve', 'report')
+    suggest_max_notes = 1000
 
     def get_queryset(self):
         # return objects, for the current authenticated user only
         query = self.request.query_params.get('keyword')
         queryset = self.queryset
-        if query:
+        ids = records.search(self.request.user.pk, query) if query else None
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        elif query:
             if queryset.filter(tags__name__icontains=query):
                 queryset = queryset.filter(tags__name__icontains=query)
-            elif queryset.filter(category__icontains=query):
-                queryset = queryset.filter(category__icontains=query)
+            elif queryset.filter(category__name__icontains=query):
+                queryset = queryset.filter(category__name__icontains=query)
             else:
                 queryset = queryset.filter(note__icontains=query)
 
-        return queryset.filter(user=self.request.user).order_by('-date')
+        tags = self.request.query_params.get('tags')
+        if tags:
+            try:
+                tag_ids = [int(pk) for pk in tags.split(',')]
+            except ValueError:
+                raise ValidationError(
+                    {'tags': ['A comma separated list of ids is required.']})
+            # Transactions with all of the tags, without joining the tags
+            queryset = queryset.filter(tag_ids__contains=tag_ids)
+
+        return queryset.filter(user=self.request.user)\
+            .select_related('category').order_by('-date')
+
+    def is_search(self):
+        return self.action == 'list' and \
+            bool(self.request.query_params.get('keyword'))
+
+    def get_expensive_scope(self):
+        if self.action == 'report':
+            return 'report'
+        return 'search' if self.is_search() else None
+
+    def get_admission_scope(self):
+        return self.get_expensive_scope()
+
+    def get_throttle_scope(self):
+        return self.get_expensive_scope()
+
+    def get_conversion_inputs(self, transactions):
+        wallet_ids = {transaction.wallet_id for transaction in transactions}
+        currencies = dict(Wallet.objects.filter(pk__in=wallet_ids)
+                          .values_list('id', 'currency'))
+        return ([transaction.ammount for transaction in transactions],
+                [currencies[transaction.wallet_id]
+                 for transaction in transactions],
+                [transaction.date.date() for transaction in transactions])
 
     def get_serializer_class(self):
         # return appropriate serializer class
@@ -71,19 +362,74 @@ class TransactionViewSet(viewsets.ModelViewSet):
             return TransactionImageSerializer
         return self.serializer_class
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        return serializer.save(user=self.request.user)
+        transaction = serializer.save(user=self.request.user)
+        self.audit(AuditAction.CREATE, transaction, serializer.validated_data)
+        return transaction
+
+    @action(methods=['GET'], detail=False)
+    def report(self, request):
+        # return yearly statistics and unusual spending of the user
+        try:
+            year = int(request.query_params.get(
+                'year', timezone.now().year))
+        except ValueError:
+            return Response(
+                {'year': ['A valid integer is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not MINYEAR <= year <= MAXYEAR:
+            return Response(
+                {'year': [f'Ensure this value is between {MINYEAR} '
+                          f'and {MAXYEAR}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(yearly_report(request.user.pk, year))
+
+    @action(methods=['POST'], detail=False)
+    def suggest(self, request):
+        # suggest a category and tags for each note, e.g. before an import
+        if hasattr(request.data, 'getlist'):
+            notes = request.data.getlist('notes')
+        else:
+            notes = request.data.get('notes')
+        if not isinstance(notes, list) or \
+                not all(isinstance(note, str) for note in notes):
+            return Response(
+                {'notes': ['A list of notes is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(notes) > self.suggest_max_notes:
+            return Response(
+                {'notes': [f'At most {self.suggest_max_notes} notes.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        suggestions = categorizer.suggest(request.user.pk, notes)
+        return Response([
+            {'note': note, 'category': category, 'tags': tags}
+            for note, (category, tags) in zip(notes, suggestions)
+        ])
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
+    @idempotent
     def upload_image(self, request, pk=None):
         # upload an image to a transaction
         transaction = self.get_object()
+        previous_image = transaction.image.name
         serializer = self.get_serializer(
             transaction,
             data=request.data
         )
         if serializer.is_valid():
             serializer.save()
+            self.audit(AuditAction.UPDATE, transaction,
+                       {'image': transaction.image.name})
+            if previous_image and previous_image != transaction.image.name:
+                tasks.delete_media_files.delay([previous_image])
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -93,3 +439,64 @@ class TransactionViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class RecurringTransactionViewSet(AuditMixin, ProfilingMixin,
+                                  ReplicaReadMixin, viewsets.ModelViewSet):
+    # Manage recurring transaction rules in the database
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    queryset = RecurringTransaction.objects.all()
+    serializer_class = RecurringTransactionSerializer
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)\
+            .select_related('category').order_by('next_run')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+        self.audit(AuditAction.CREATE, serializer.instance,
+                   serializer.validated_data)
+
+
+class BudgetViewSet(AuditMixin, ProfilingMixin, ReplicaReadMixin,
+                    viewsets.ModelViewSet):
+    # Manage budgets and report their status
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    queryset = Budget.objects.all()
+    serializer_class = BudgetSerializer
+    # Reads roll ended periods over, they must see their own writes
+    replica_actions = ()
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)\
+            .select_related('category').order_by('id')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in ('list', 'retrieve'):
+            Budget.objects.roll_over(request.user.pk, timezone.now().date())
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+        self.audit(AuditAction.CREATE, serializer.instance,
+                   serializer.validated_data)
+
+
+class DashboardView(APIView):
+    # Return the precomputed home screen of the authenticated user
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response(dashboard.get(request.user.pk))
+
+
+class MetricsView(APIView):
+    # Report in-process counters and timings to staff users
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({**metrics.snapshot(), 'tasks': tasks.queue_stats()})
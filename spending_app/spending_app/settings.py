@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.HealthCheckMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,9 +93,47 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
+        # Keep connections open between requests instead of reconnecting
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
     }
 }
 
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica1,replica2
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.PrimaryReplicaRouter']
+
+# Seconds a user keeps reading from the primary after a write
+READ_YOUR_WRITES_WINDOW = int(os.environ.get('DB_READ_YOUR_WRITES_WINDOW', 5))
+
+# The default cache is local to each process. SHARED_CACHE names the alias
+# for values every web process and run_worker must agree on, such as the
+# read-your-writes pins and the dashboard payloads. It is kept in the
+# database, its table is created by `manage.py createcachetable`, which the
+# start command runs.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_shared_cache',
+    },
+}
+SHARED_CACHE = 'shared'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -138,3 +178,160 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'api.User'
 
+# Responses smaller than this many bytes are sent uncompressed. Brotli is
+# used when the optional brotli package is installed, gzip otherwise.
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+
+
+# Number of (currency pair, date) exchange rates cached per process and
+# the seconds after which a cached rate is read again, so rates loaded by
+# load_exchange_rates reach every process
+EXCHANGE_RATE_CACHE_SIZE = 10000
+EXCHANGE_RATE_CACHE_TTL = 10 * 60
+
+# Seconds a stored Idempotency-Key response can be replayed, and after
+# which a request that never finished stops blocking retries of its key
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_IN_PROGRESS_TIMEOUT = 5 * 60
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserRateThrottle',
+        'api.throttling.EndpointRateThrottle',
+    ],
+}
+
+# Token bucket rates per user, 'user' applies to every request and the
+# other keys to the endpoint scopes of the api viewsets
+RATE_LIMITS = {
+    'user': '1200/min',
+    'search': '60/min',
+    'series': '60/min',
+    'report': '30/min',
+}
+
+# Cache alias to share rate limit buckets between processes, None keeps
+# them in local memory
+RATE_LIMIT_CACHE = None
+
+# Expensive requests of a scope allowed to run at once per process, and
+# seconds a request waits for a free slot before a 503
+CONCURRENCY_LIMITS = {
+    'search': 4,
+    'series': 4,
+    'report': 2,
+}
+CONCURRENCY_QUEUE_TIMEOUT = 2
+
+# Background tasks: run them inline instead of queueing when TASKS_EAGER
+# is set, retry failures after TASK_RETRY_BACKOFF * 2 ** (attempt - 1)
+# seconds, requeue running tasks whose worker stopped renewing their
+# TASK_LEASE seconds lease and delete finished ones after TASK_RESULT_TTL
+# seconds
+TASKS_EAGER = False
+TASK_RETRY_BACKOFF = 5
+TASK_RETRY_MAX_DELAY = 3600
+TASK_LEASE = 60
+TASK_RESULT_TTL = 24 * 60 * 60
+
+# Transactions deleted per statement when removing wallets and users, and
+# the transaction count above which that happens in the background
+DELETION_BATCH_SIZE = 1000
+BACKGROUND_DELETION_THRESHOLD = 5000
+
+# Seconds /readyz reuses its last result and the statement timeout of its
+# database check
+READINESS_CACHE_SECONDS = 5
+READINESS_DB_TIMEOUT = 2
+
+# Log queries slower than SLOW_QUERY_THRESHOLD milliseconds with the code
+# that ran them, unset to disable. A sample of slow SELECTs on PostgreSQL
+# also gets an EXPLAIN (ANALYZE, BUFFERS), which runs the query again.
+SLOW_QUERY_THRESHOLD = (float(os.environ['SLOW_QUERY_THRESHOLD_MS'])
+                        if os.environ.get('SLOW_QUERY_THRESHOLD_MS') else None)
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(
+    os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'api.jsonlog.JSONFormatter'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get(
+                'SLOW_QUERY_LOG', '/vol/web/logs/slow_queries.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'api.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Per request cProfile output: staff can ask for it with ?profile=1 or an
+# X-Profile header, and one in PROFILE_SAMPLE_RATE requests is profiled
+# when it is above 0
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/vol/web/profiles')
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+# Unfiltered admin changelists of tables with at least this many rows use
+# PostgreSQL's row estimate instead of COUNT(*)
+ADMIN_ESTIMATED_COUNT_MIN = 10000
+
+# Audit entries buffered in memory per process, how many are written per
+# insert and how often, and how long a request waits for room in a full
+# buffer before its entry is dropped
+AUDIT_BUFFER_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0
+AUDIT_BACKPRESSURE_TIMEOUT = 0.05
+
+# Dashboard payloads are kept in the SHARED_CACHE, where the web processes
+# read what run_worker recomputes after writes. DASHBOARD_PENDING_TTL
+# bounds how long later writes wait on an already queued recompute.
+DASHBOARD_CACHE_TTL = 24 * 60 * 60
+DASHBOARD_PENDING_TTL = 60
+DASHBOARD_RECENT_TRANSACTIONS = 10
+
+# What to do with a new or changed transaction matching an existing one by
+# wallet, day, amount and note: 'flag' saves it with is_duplicate set,
+# 'reject' answers 400, None skips the check
+DUPLICATE_TRANSACTIONS = 'flag'
+
+# Category and tag suggestions: per-user models kept per process, the
+# number of latest transactions each is trained on and the seconds after
+# which it is rebuilt
+CATEGORIZER_CACHE_SIZE = 1000
+CATEGORIZER_TRAINING_SIZE = 5000
+CATEGORIZER_MODEL_MAX_AGE = 60 * 60
+
+# Per-process cache of users' transactions as compact records, used by
+# the dashboard and transaction search: the total bytes kept across users,
+# the most transactions of a user worth caching and the seconds after
+# which records are rebuilt anyway. Writes change a per-user version kept
+# in the SHARED_CACHE, so every process drops records older than a write.
+RECORD_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RECORD_CACHE_MAX_ROWS = 20000
+RECORD_CACHE_MAX_AGE = 10 * 60
+# Keyword searches use cached records only up to this many matches
+RECORD_SEARCH_MAX_IDS = 500
+
+# Yearly reports: a month is a spike when a category's spend is more than
+# REPORT_SPIKE_Z standard deviations above its monthly mean, an expense is
+# unusual above a robust z-score of REPORT_ANOMALY_Z within its category.
+# generate_reports writes to REPORT_DIR/<year>/<user id>.json and
+# generate_statements keeps its checkpoints in REPORT_DIR/statements.
+REPORT_SPIKE_Z = 2.0
+REPORT_ANOMALY_Z = 3.5
+REPORT_MAX_ANOMALIES = 50
+REPORT_DIR = os.environ.get('REPORT_DIR', '/vol/web/reports')
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spending_app.settings')
 
 application = get_wsgi_application()
+
+from api import audit  # noqa: E402
+
+audit.start()
@@ -134,6 +134,12 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(response.status_code,
                          status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    def test_delete_user_profile(self):
+        # Test deleting the account of the authenticated user
+        response = self.client.delete(PROFILE_URL)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
     def test_update_user_profile(self):
         # Test updating the user profile for authenticated user
         payload = {
@@ -1,6 +1,9 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, authentication, permissions, status
+from rest_framework.response import Response
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from api import audit, deletion
+from api.models import AuditAction, Transaction
 from .serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -15,7 +18,7 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     # Manage the profile of the authenticated user
     serializer_class = UserSerializer
     authentication_classes = (authentication.TokenAuthentication,)
@@ -24,3 +27,16 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         # Retrieve and return authenticated user
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        # Delete the account, in the background when it is large
+        user = self.get_object()
+        audit.record(AuditAction.DELETE, user, user.pk, user)
+        if deletion.is_large(Transaction.objects.filter(user=user)):
+            # Lock the account out until the worker has deleted it
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            deletion.delete_user_task.delay(user.pk)
+            return Response(status=status.HTTP_202_ACCEPTED)
+        deletion.delete_user(user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)